@@ -5,18 +5,51 @@ Dashboard de Oportunidades Imobiliárias Nacionais
 Visualização expandida para monitoramento de múltiplas cidades
 """
 
-from flask import Flask, render_template_string, jsonify
+from flask import Flask, Response, render_template_string, jsonify, g, request
 import sqlite3
 from datetime import datetime
 import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from esquema import migrar_arquivo
+from conexao_leitura import ConexoesLeitura
+from paginacao import ORDENACAO_PADRAO, filtros_de, pagina
+from eventos_oportunidades import garantir_eventos, transmitir_eventos
 
 app = Flask(__name__)
 
+BANCO = 'oportunidades_nacionais.db'
+
+# Colunas de um card de oportunidade (listagem paginada e eventos do stream)
+COLUNAS_CARD = (
+    'id', 'cidade', 'estado', 'titulo', 'preco', 'area', 'preco_m2', 'score',
+    'potencial_categoria', 'portal', 'data_encontrado'
+)
+
+# Bancos criados antes de cidade_rank/índices de leitura são migrados ao subir
+if os.path.exists(BANCO):
+    migrar_arquivo(BANCO, 'oportunidades')
+    # Log de mudanças lido pelo stream /api/eventos
+    conn_migracao = sqlite3.connect(BANCO)
+    garantir_eventos(conn_migracao, 'oportunidades')
+    conn_migracao.close()
+
+# Conexões somente leitura reaproveitadas entre requisições (cache quente)
+leitura = ConexoesLeitura(BANCO)
+
 def get_db_connection():
-    """Conecta ao banco de dados"""
-    conn = sqlite3.connect('oportunidades_nacionais.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Conexão de leitura do banco, devolvida ao fim da requisição"""
+    if 'conn' not in g:
+        g.conn = leitura.obter()
+    return g.conn
+
+@app.teardown_appcontext
+def devolver_conexao(erro):
+    conn = g.pop('conn', None)
+    if conn is not None:
+        leitura.devolver(conn)
 
 @app.route('/')
 def dashboard():
@@ -25,30 +58,24 @@ def dashboard():
 
 @app.route('/api/oportunidades')
 def api_oportunidades():
-    """API para obter oportunidades"""
+    """API paginada das oportunidades (?ordem=&cursor=&limite= + filtros de paginacao.FILTROS)"""
     conn = get_db_connection()
     
-    # Oportunidades por categoria de potencial
-    oportunidades = conn.execute('''
-        SELECT cidade, estado, titulo, preco, area, preco_m2, score, 
-               potencial_categoria, portal, data_encontrado
-        FROM oportunidades 
-        ORDER BY 
-            CASE 
-                WHEN cidade = 'Lucas do Rio Verde' THEN 1
-                WHEN cidade = 'Rio Verde' THEN 2
-                WHEN cidade = 'Sinop' THEN 3
-                WHEN cidade = 'Barreiras' THEN 4
-                WHEN cidade = 'Palmas' THEN 5
-                ELSE 6
-            END,
-            score DESC
-        LIMIT 50
-    ''').fetchall()
-    
-    conn.close()
+    try:
+        oportunidades, proximo_cursor = pagina(
+            conn, 'oportunidades', COLUNAS_CARD,
+            filtros=filtros_de(request.args),
+            ordem=request.args.get('ordem', ORDENACAO_PADRAO),
+            cursor=request.args.get('cursor'),
+            limite=min(max(request.args.get('limite', 50, type=int), 1), 200)
+        )
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
     
-    return jsonify([dict(row) for row in oportunidades])
+    return jsonify({
+        'oportunidades': [dict(row) for row in oportunidades],
+        'proximo_cursor': proximo_cursor
+    })
 
 @app.route('/api/estatisticas')
 def api_estatisticas():
@@ -61,18 +88,11 @@ def api_estatisticas():
                AVG(score) as score_medio,
                AVG(preco_m2) as preco_m2_medio,
                MIN(preco_m2) as menor_preco_m2,
-               MAX(preco_m2) as maior_preco_m2
+               MAX(preco_m2) as maior_preco_m2,
+               MIN(cidade_rank) as cidade_rank
         FROM oportunidades 
         GROUP BY cidade, estado
-        ORDER BY 
-            CASE 
-                WHEN cidade = 'Lucas do Rio Verde' THEN 1
-                WHEN cidade = 'Rio Verde' THEN 2
-                WHEN cidade = 'Sinop' THEN 3
-                WHEN cidade = 'Barreiras' THEN 4
-                WHEN cidade = 'Palmas' THEN 5
-                ELSE 6
-            END
+        ORDER BY MIN(cidade_rank)
     ''').fetchall()
     
     # Histórico de varreduras
@@ -87,8 +107,6 @@ def api_estatisticas():
     # Total geral
     total_geral = conn.execute('SELECT COUNT(*) as total FROM oportunidades').fetchone()
     
-    conn.close()
-    
     return jsonify({
         'stats_cidade': [dict(row) for row in stats_cidade],
         'historico': [dict(row) for row in historico],
@@ -107,10 +125,44 @@ def api_melhores_cidade(cidade):
         LIMIT 10
     ''', (cidade,)).fetchall()
     
-    conn.close()
-    
     return jsonify([dict(row) for row in oportunidades])
 
+def estatisticas_das_cidades(conn, cidades):
+    """Estatísticas das cidades afetadas (delta do stream); cidade que ficou vazia vem com total 0"""
+    if not cidades:
+        return []
+    linhas = conn.execute(f'''
+        SELECT cidade, estado, COUNT(*) as total, 
+               AVG(score) as score_medio,
+               AVG(preco_m2) as preco_m2_medio,
+               MIN(preco_m2) as menor_preco_m2,
+               MAX(preco_m2) as maior_preco_m2,
+               MIN(cidade_rank) as cidade_rank
+        FROM oportunidades 
+        WHERE cidade IN ({', '.join('?' * len(cidades))})
+        GROUP BY cidade, estado
+    ''', cidades).fetchall()
+    
+    presentes = {linha['cidade'] for linha in linhas}
+    return linhas + [{'cidade': cidade, 'total': 0} for cidade in cidades if cidade not in presentes]
+
+@app.route('/api/eventos')
+def api_eventos():
+    """Server-Sent Events: oportunidades novas/alteradas/removidas e estatísticas das cidades afetadas"""
+    # EventSource reenvia o último id recebido ao reconectar
+    ultimo_id = request.headers.get('Last-Event-ID') or request.args.get('desde')
+    try:
+        ultimo_id = int(ultimo_id) if ultimo_id else None
+    except ValueError:
+        return jsonify({'erro': 'Last-Event-ID inválido'}), 400
+    
+    return Response(
+        transmitir_eventos(leitura.conexao(), 'oportunidades', COLUNAS_CARD,
+                           ultimo_id, estatisticas_das_cidades),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # Template HTML expandido
 DASHBOARD_TEMPLATE = '''
 <!DOCTYPE html>
@@ -330,10 +382,13 @@ DASHBOARD_TEMPLATE = '''
         
         <div id="oportunidades" class="oportunidades-grid" style="display: none;">
         </div>
+        <button class="refresh-btn" id="carregar-mais" style="display: none;" onclick="carregarOportunidades(true)">⬇️ Carregar mais</button>
     </div>
 
     <script>
         let chartInstance = null;
+        let proximoCursor = null;
+        let estatisticasAtuais = null;
         
         async function carregarDados() {
             document.getElementById('loading').style.display = 'block';
@@ -343,12 +398,12 @@ DASHBOARD_TEMPLATE = '''
             
             try {
                 const [oportunidades, estatisticas] = await Promise.all([
-                    fetch('/api/oportunidades').then(r => r.json()),
+                    carregarOportunidades(false),
                     fetch('/api/estatisticas').then(r => r.json())
                 ]);
                 
+                estatisticasAtuais = estatisticas;
                 exibirEstatisticas(estatisticas);
-                exibirOportunidades(oportunidades);
                 criarGrafico(estatisticas.stats_cidade);
                 
                 document.getElementById('ultima-atualizacao').textContent = 
@@ -395,53 +450,66 @@ DASHBOARD_TEMPLATE = '''
             container.style.display = 'grid';
         }
         
-        function exibirOportunidades(oportunidades) {
-            const container = document.getElementById('oportunidades');
-            
-            let html = '';
+        async function carregarOportunidades(acrescentar) {
+            // Páginas por cursor: a lista não fica mais presa às 50 primeiras
+            const params = new URLSearchParams();
+            if (acrescentar && proximoCursor) params.set('cursor', proximoCursor);
             
-            oportunidades.forEach((op, index) => {
-                const potencial = getPotencialClass(op.cidade);
-                
-                html += `
-                    <div class="oportunidade-card">
-                        <div class="oportunidade-header">
-                            <div>
-                                <h4>🏠 ${op.titulo}</h4>
-                                <p><strong>📍 ${op.cidade}/${op.estado}</strong></p>
-                            </div>
-                            <div class="score-badge">
-                                ${op.score}/100
-                            </div>
+            const resultado = await fetch(`/api/oportunidades?${params}`).then(r => r.json());
+            exibirOportunidades(resultado.oportunidades, acrescentar);
+            proximoCursor = resultado.proximo_cursor;
+            document.getElementById('carregar-mais').style.display = proximoCursor ? 'block' : 'none';
+            return resultado.oportunidades;
+        }
+        
+        function htmlOportunidade(op) {
+            return `
+                <div class="oportunidade-card" data-id="${op.id}">
+                    <div class="oportunidade-header">
+                        <div>
+                            <h4>🏠 ${op.titulo}</h4>
+                            <p><strong>📍 ${op.cidade}/${op.estado}</strong></p>
                         </div>
-                        
-                        <div class="preco-destaque">
-                            💰 R$ ${op.preco.toLocaleString('pt-BR')}
+                        <div class="score-badge">
+                            ${op.score}/100
+                        </div>
+                    </div>
+                    
+                    <div class="preco-destaque">
+                        💰 R$ ${op.preco.toLocaleString('pt-BR')}
+                    </div>
+                    
+                    <div class="detalhes-grid">
+                        <div class="detalhe-item">
+                            📐 <strong>${op.area.toFixed(0)} m²</strong>
                         </div>
-                        
-                        <div class="detalhes-grid">
-                            <div class="detalhe-item">
-                                📐 <strong>${op.area.toFixed(0)} m²</strong>
-                            </div>
-                            <div class="detalhe-item">
-                                💲 <strong>R$ ${op.preco_m2.toFixed(2)}/m²</strong>
-                            </div>
-                            <div class="detalhe-item">
-                                🎯 <strong>${op.potencial_categoria}</strong>
-                            </div>
-                            <div class="detalhe-item">
-                                🌐 <strong>${op.portal}</strong>
-                            </div>
+                        <div class="detalhe-item">
+                            💲 <strong>R$ ${op.preco_m2.toFixed(2)}/m²</strong>
+                        </div>
+                        <div class="detalhe-item">
+                            🎯 <strong>${op.potencial_categoria}</strong>
+                        </div>
+                        <div class="detalhe-item">
+                            🌐 <strong>${op.portal}</strong>
                         </div>
-                        
-                        <p style="margin-top: 10px; font-size: 0.9em; color: #666;">
-                            📅 Encontrado em: ${new Date(op.data_encontrado).toLocaleDateString('pt-BR')}
-                        </p>
                     </div>
-                `;
-            });
+                    
+                    <p style="margin-top: 10px; font-size: 0.9em; color: #666;">
+                        📅 Encontrado em: ${new Date(op.data_encontrado).toLocaleDateString('pt-BR')}
+                    </p>
+                </div>
+            `;
+        }
+        
+        function exibirOportunidades(oportunidades, acrescentar = false) {
+            const container = document.getElementById('oportunidades');
+            const html = oportunidades.map(htmlOportunidade).join('');
             
-            container.innerHTML = html;
+            if (acrescentar) {
+                container.insertAdjacentHTML('beforeend', html);
+            } else {
+                container.innerHTML = html;
+            }
             container.style.display = 'grid';
             document.getElementById('loading').style.display = 'none';
         }
@@ -505,11 +573,51 @@ DASHBOARD_TEMPLATE = '''
             return badges[cidade] || '📊 PADRÃO';
         }
         
-        // Carrega dados ao inicializar
-        document.addEventListener('DOMContentLoaded', carregarDados);
+        function aplicarOportunidade(evento) {
+            // Delta do stream: troca, remove ou insere só o card afetado
+            const card = document.querySelector(`.oportunidade-card[data-id="${evento.id_anuncio}"]`);
+            if (!evento.oportunidade) {
+                if (card) card.remove();
+            } else if (card) {
+                card.outerHTML = htmlOportunidade(evento.oportunidade);
+            } else if (evento.tipo === 'nova') {
+                document.getElementById('oportunidades')
+                    .insertAdjacentHTML('afterbegin', htmlOportunidade(evento.oportunidade));
+            }
+            document.getElementById('ultima-atualizacao').textContent = 
+                `Última atualização: ${new Date().toLocaleString('pt-BR')}`;
+        }
+        
+        function aplicarEstatisticas(linhas) {
+            if (!estatisticasAtuais) return;
+            // Substitui as cidades recebidas; cidades que ficaram vazias saem
+            const cidades = estatisticasAtuais.stats_cidade.filter(c => !linhas.some(l => l.cidade === c.cidade));
+            linhas.forEach(linha => { if (linha.total > 0) cidades.push(linha); });
+            cidades.sort((a, b) => a.cidade_rank - b.cidade_rank);
+            
+            estatisticasAtuais.stats_cidade = cidades;
+            estatisticasAtuais.total_geral.total = cidades.reduce((soma, c) => soma + c.total, 0);
+            exibirEstatisticas(estatisticasAtuais);
+            criarGrafico(cidades);
+        }
+        
+        function conectarEventos() {
+            if (!window.EventSource) {
+                // Navegador sem SSE: volta ao refresh periódico
+                setInterval(carregarDados, 300000);
+                return;
+            }
+            const fonte = new EventSource('/api/eventos');
+            fonte.addEventListener('oportunidade', e => aplicarOportunidade(JSON.parse(e.data)));
+            fonte.addEventListener('estatisticas', e => aplicarEstatisticas(JSON.parse(e.data)));
+            fonte.addEventListener('recarregar', () => carregarDados());
+        }
         
-        // Auto-refresh a cada 5 minutos
-        setInterval(carregarDados, 300000);
+        // Carrega dados ao inicializar; depois só chegam os deltas do servidor
+        document.addEventListener('DOMContentLoaded', () => {
+            carregarDados();
+            conectarEventos();
+        });
     </script>
 </body>
 </html>
@@ -5,18 +5,38 @@ Dashboard Plataforma Completa de Oportunidades Imobiliárias
 Sistema consolidado com todas as cidades: Senador Canedo + Regionais
 """
 
-from flask import Flask, render_template_string, jsonify
-import sqlite3
+from flask import Flask, render_template_string, jsonify, g
 from datetime import datetime
 import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from esquema import migrar_arquivo
+from conexao_leitura import ConexoesLeitura
 
 app = Flask(__name__)
 
+BANCO = 'plataforma_oportunidades_completa.db'
+
+# Bancos criados antes de cidade_rank/índices de leitura são migrados ao subir
+if os.path.exists(BANCO):
+    migrar_arquivo(BANCO, 'oportunidades_completas', 'estatisticas_cidades')
+
+# Conexões somente leitura reaproveitadas entre requisições (cache quente)
+leitura = ConexoesLeitura(BANCO)
+
 def get_db_connection():
-    """Conecta ao banco consolidado"""
-    conn = sqlite3.connect('plataforma_oportunidades_completa.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Conexão de leitura do banco consolidado, devolvida ao fim da requisição"""
+    if 'conn' not in g:
+        g.conn = leitura.obter()
+    return g.conn
+
+@app.teardown_appcontext
+def devolver_conexao(erro):
+    conn = g.pop('conn', None)
+    if conn is not None:
+        leitura.devolver(conn)
 
 @app.route('/')
 def dashboard():
@@ -33,21 +53,9 @@ def api_oportunidades():
                potencial_categoria, portal, referencia, endereco, bairro,
                quartos, banheiros, vagas, url, data_encontrado
         FROM oportunidades_completas 
-        ORDER BY 
-            CASE 
-                WHEN cidade = 'Lucas do Rio Verde' THEN 1
-                WHEN cidade = 'Rio Verde' THEN 2
-                WHEN cidade = 'Sinop' THEN 3
-                WHEN cidade = 'Barreiras' THEN 4
-                WHEN cidade = 'Palmas' THEN 5
-                WHEN cidade = 'Senador Canedo' THEN 6
-                ELSE 7
-            END,
-            score DESC
+        ORDER BY cidade_rank, score DESC
     ''').fetchall()
     
-    conn.close()
-    
     return jsonify([dict(row) for row in oportunidades])
 
 @app.route('/api/estatisticas')
@@ -55,22 +63,14 @@ def api_estatisticas():
     """API para estatísticas consolidadas"""
     conn = get_db_connection()
     
-    # Estatísticas por cidade
+    # Estatísticas por cidade (agregados mantidos por triggers, O(cidades))
     stats_cidade = conn.execute('''
         SELECT c.cidade, c.estado, c.total_oportunidades, c.score_medio,
                c.preco_medio, c.preco_m2_medio, c.menor_preco, c.maior_preco,
                c.potencial_categoria, c.crescimento_populacional
         FROM estatisticas_cidades c
-        ORDER BY 
-            CASE 
-                WHEN c.cidade = 'Lucas do Rio Verde' THEN 1
-                WHEN c.cidade = 'Rio Verde' THEN 2
-                WHEN c.cidade = 'Sinop' THEN 3
-                WHEN c.cidade = 'Barreiras' THEN 4
-                WHEN c.cidade = 'Palmas' THEN 5
-                WHEN c.cidade = 'Senador Canedo' THEN 6
-                ELSE 7
-            END
+        WHERE c.total_oportunidades > 0
+        ORDER BY c.cidade_rank
     ''').fetchall()
     
     # Histórico consolidado
@@ -93,8 +93,6 @@ def api_estatisticas():
         FROM oportunidades_completas
     ''').fetchone()
     
-    conn.close()
-    
     return jsonify({
         'stats_cidade': [dict(row) for row in stats_cidade],
         'historico': [dict(row) for row in historico],
@@ -117,8 +115,6 @@ def api_cidade_detalhes(cidade):
         WHERE cidade = ?
     ''', (cidade,)).fetchone()
     
-    conn.close()
-    
     return jsonify({
         'oportunidades': [dict(row) for row in oportunidades],
         'estatisticas': dict(estatisticas) if estatisticas else None
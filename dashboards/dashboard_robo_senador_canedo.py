@@ -6,20 +6,30 @@ Interface web para visualização dos dados coletados
 """
 
 from flask import Flask, render_template_string, jsonify, request
-import sqlite3
 import json
 from datetime import datetime, timedelta
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from esquema import migrar_arquivo
+from conexao_leitura import ConexoesLeitura
 
 app = Flask(__name__)
 
 class DashboardRobo:
     def __init__(self):
         self.db_path = '/home/ubuntu/oportunidades_senador_canedo.db'
+        # Conexões somente leitura reaproveitadas entre requisições (cache quente)
+        self.leitura = ConexoesLeitura(self.db_path, row_factory=None)
     
     def get_connection(self):
-        """Retorna conexão com o banco de dados"""
-        return sqlite3.connect(self.db_path)
+        """Retorna conexão de leitura com o banco de dados (devolver com release_connection)"""
+        return self.leitura.obter()
+    
+    def release_connection(self, conn):
+        """Devolve a conexão ao pool de leitura"""
+        self.leitura.devolver(conn)
     
     def get_oportunidades_recentes(self, dias=7):
         """Busca oportunidades dos últimos N dias"""
@@ -38,7 +48,7 @@ class DashboardRobo:
             colunas = [desc[0] for desc in cursor.description]
             oportunidades = [dict(zip(colunas, row)) for row in cursor.fetchall()]
             
-            conn.close()
+            self.release_connection(conn)
             return oportunidades
         
         except Exception as e:
@@ -91,7 +101,7 @@ class DashboardRobo:
             colunas = [desc[0] for desc in cursor.description]
             ultimas_varreduras = [dict(zip(colunas, row)) for row in cursor.fetchall()]
             
-            conn.close()
+            self.release_connection(conn)
             
             return {
                 'total_oportunidades': total_oportunidades,
@@ -588,5 +598,8 @@ if __name__ == '__main__':
     # Verifica se o banco existe
     if not os.path.exists('/home/ubuntu/oportunidades_senador_canedo.db'):
         print("⚠️  Banco de dados não encontrado. Execute primeiro o robô principal")
+    else:
+        # Índices de leitura (data_encontrado, portal, bairro) em bancos antigos
+        migrar_arquivo(dashboard.db_path, 'oportunidades')
     
     app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Adaptador para APIs JSON de Listagem
+Portais declarados com 'metodo': 'api_publica' são lidos por este adaptador:
+paginação por offset, número de página ou cursor, lotes configuráveis e
+projeção de campos (caminhos com ponto) direto para Anuncio.
+Inclui um servidor local que imita o endpoint, para testes sem rede
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from extracao_atributos import converter_numero_br
+from modelos import Anuncio
+
+
+CAMPOS_NUMERICOS = ('preco', 'area')
+CAMPOS_INTEIROS = ('quartos', 'banheiros', 'vagas')
+
+
+def valor_caminho(objeto, caminho):
+    """Valor de um caminho com ponto ('location.neighbourhood', 'images.0.url')"""
+    atual = objeto
+    for parte in caminho.split('.'):
+        if isinstance(atual, dict):
+            atual = atual.get(parte)
+        elif isinstance(atual, list) and parte.isdigit():
+            indice = int(parte)
+            atual = atual[indice] if indice < len(atual) else None
+        else:
+            return None
+        if atual is None:
+            return None
+    return atual
+
+
+def _numero(valor):
+    """Número do JSON (int/float ou texto no formato brasileiro)"""
+    if isinstance(valor, bool) or valor is None:
+        return 0
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    return converter_numero_br(valor)
+
+
+class AdaptadorAPIJSON:
+    """Lê um endpoint JSON de anúncios página a página.
+
+    campos: {campo do Anuncio: caminho no item}, ex. {'preco': 'price.value'}
+    paginacao: 'offset', 'pagina' ou 'cursor'
+    """
+
+    def __init__(self, cliente, url, campos, caminho_itens='ads', paginacao='offset',
+                 tamanho_lote=50, max_paginas=10, parametros=None,
+                 parametro_offset='offset', parametro_pagina='page', parametro_limite='limit',
+                 parametro_cursor='cursor', caminho_cursor='next_cursor',
+                 parametro_campos='fields'):
+        if paginacao not in ('offset', 'pagina', 'cursor'):
+            raise ValueError(f"Paginação desconhecida: {paginacao}")
+
+        self.cliente = cliente
+        self.url = url
+        self.campos = campos
+        self.caminho_itens = caminho_itens
+        self.paginacao = paginacao
+        self.tamanho_lote = tamanho_lote
+        self.max_paginas = max_paginas
+        self.parametros = dict(parametros or {})
+        self.parametro_offset = parametro_offset
+        self.parametro_pagina = parametro_pagina
+        self.parametro_limite = parametro_limite
+        self.parametro_cursor = parametro_cursor
+        self.caminho_cursor = caminho_cursor
+        self.parametro_campos = parametro_campos
+
+    def parametros_pagina(self, numero, cursor=None):
+        """Query string da página 'numero' (0, 1, ...)"""
+        parametros = dict(self.parametros)
+        parametros[self.parametro_limite] = self.tamanho_lote
+
+        if self.parametro_campos:
+            # Projeção no servidor: só os campos de primeiro nível usados
+            raizes = sorted({caminho.split('.')[0] for caminho in self.campos.values()})
+            parametros[self.parametro_campos] = ','.join(raizes)
+
+        if self.paginacao == 'offset':
+            parametros[self.parametro_offset] = numero * self.tamanho_lote
+        elif self.paginacao == 'pagina':
+            parametros[self.parametro_pagina] = numero + 1
+        elif cursor:
+            parametros[self.parametro_cursor] = cursor
+        return parametros
+
+    def paginas(self):
+        """Gera a lista de itens de cada página até acabar ou atingir max_paginas"""
+        cursor = None
+        for numero in range(self.max_paginas):
+            response = self.cliente.get(
+                self.url, params=self.parametros_pagina(numero, cursor),
+                headers={'Accept': 'application/json'}
+            )
+            response.raise_for_status()
+            dados = response.json()
+
+            itens = valor_caminho(dados, self.caminho_itens) if self.caminho_itens else dados
+            if not itens:
+                return
+            yield itens
+
+            if self.paginacao == 'cursor':
+                cursor = valor_caminho(dados, self.caminho_cursor)
+                if not cursor:
+                    return
+            elif len(itens) < self.tamanho_lote:
+                return
+
+    def projetar(self, item):
+        """Converte um item do JSON em Anuncio usando o mapa de campos"""
+        valores = {}
+        for campo, caminho in self.campos.items():
+            valor = valor_caminho(item, caminho)
+            if campo in CAMPOS_NUMERICOS:
+                valores[campo] = _numero(valor)
+            elif campo in CAMPOS_INTEIROS:
+                valores[campo] = int(_numero(valor))
+            else:
+                valores[campo] = '' if valor is None else str(valor)
+
+        valores.setdefault('titulo', '')
+        return Anuncio(**valores)
+
+    def anuncios(self):
+        """Gera os anúncios de todas as páginas"""
+        for itens in self.paginas():
+            for item in itens:
+                if isinstance(item, dict):
+                    yield self.projetar(item)
+
+
+class ServidorLocalAPI:
+    """Servidor HTTP local que imita um endpoint de listagem JSON.
+
+    Aceita offset/limit, page, cursor e fields, como o adaptador envia.
+    Uso: with ServidorLocalAPI(itens) as servidor: ... servidor.url ...
+    """
+
+    def __init__(self, itens, caminho_itens='ads', host='127.0.0.1', porta=0):
+        self.itens = list(itens)
+        self.caminho_itens = caminho_itens
+        self.requisicoes = []
+
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parametros = {chave: valores[0] for chave, valores in parse_qs(urlparse(self.path).query).items()}
+                servidor.requisicoes.append(parametros)
+
+                corpo = json.dumps(servidor.responder(parametros)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, formato, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, porta), Handler)
+        self.thread = None
+
+    @property
+    def url(self):
+        host, porta = self.httpd.server_address[:2]
+        return f"http://{host}:{porta}/anuncios"
+
+    def responder(self, parametros):
+        """Monta a resposta para a query recebida"""
+        limite = int(parametros.get('limit', 50))
+        if 'cursor' in parametros:
+            inicio = int(parametros['cursor'])
+        elif 'page' in parametros:
+            inicio = (int(parametros['page']) - 1) * limite
+        else:
+            inicio = int(parametros.get('offset', 0))
+
+        itens = self.itens[inicio:inicio + limite]
+        if parametros.get('fields'):
+            campos = parametros['fields'].split(',')
+            itens = [{campo: item[campo] for campo in campos if campo in item} for item in itens]
+
+        proximo = inicio + limite
+        return {
+            self.caminho_itens: itens,
+            'next_cursor': str(proximo) if proximo < len(self.itens) else None
+        }
+
+    def iniciar(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def parar(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+
+
+if __name__ == "__main__":
+    # Verificação offline: pagina o servidor local nos três modos
+    from cliente_http import ClienteHTTP
+
+    itens_exemplo = [
+        {
+            'list_id': i,
+            'subject': f'Casa {i} - Setor Universitário',
+            'price': f'R$ {300 + i}.000',
+            'properties': {'size': 150 + i, 'rooms': 3, 'bathrooms': 2, 'garage_spaces': 2},
+            'location': {'neighbourhood': 'Setor Universitário', 'municipality': 'Barreiras'},
+            'url': f'https://www.olx.com.br/anuncio/{i}',
+            'description': 'x' * 500
+        }
+        for i in range(23)
+    ]
+    campos_exemplo = {
+        'titulo': 'subject', 'preco': 'price', 'area': 'properties.size',
+        'quartos': 'properties.rooms', 'bairro': 'location.neighbourhood',
+        'url': 'url', 'referencia': 'list_id'
+    }
+
+    cliente = ClienteHTTP(tentativas=0)
+    with ServidorLocalAPI(itens_exemplo) as servidor:
+        for modo in ('offset', 'pagina', 'cursor'):
+            adaptador = AdaptadorAPIJSON(cliente, servidor.url, campos_exemplo,
+                                         paginacao=modo, tamanho_lote=10)
+            anuncios = list(adaptador.anuncios())
+            print(f"{modo}: {len(anuncios)} anúncios; primeiro: {anuncios[0]}")
+        print(f"Requisições: {len(servidor.requisicoes)}")
+    cliente.fechar()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Armazenamento em Lote das Oportunidades
+Uma conexão de longa duração por robô: duplicatas resolvidas por índice
+único + INSERT ... ON CONFLICT DO UPDATE, cada lote gravado com executemany
+em uma única transação, junto com o histórico de varreduras acumulado
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from modelos import identidade_anuncio
+
+
+def _agora():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def preencher_identidade(conn, tabela, com_cidade=True):
+    """Preenche a coluna identidade (modelos.identidade_anuncio) de linhas antigas.
+
+    Só a linha mais recente de cada anúncio recebe a identidade: as anteriores
+    (preços antigos gravados como linhas novas) ficam NULL, fora da chave
+    única. URL repetida em títulos diferentes é a da listagem, não a do
+    anúncio. Retorna quantas linhas foram preenchidas.
+    """
+    cidade = 'cidade' if com_cidade else "''"
+    linhas = conn.execute(f'''
+        SELECT id, portal, url, titulo, {cidade}, bairro, endereco, area
+        FROM {tabela} WHERE identidade IS NULL ORDER BY id
+    ''').fetchall()
+
+    titulos_por_url = defaultdict(set)
+    for linha in linhas:
+        titulos_por_url[linha[2]].add(linha[3])
+
+    mais_recente = {}
+    for id_linha, portal, url, titulo, cidade_linha, bairro, endereco, area in linhas:
+        propria = url if url and len(titulos_por_url[url]) == 1 else ''
+        identidade = identidade_anuncio(portal, propria, '', titulo, cidade_linha, bairro or '', endereco or '', area)
+        mais_recente[identidade] = id_linha
+
+    with conn:
+        conn.executemany(
+            f"UPDATE {tabela} SET identidade = ? WHERE id = ?",
+            mais_recente.items()
+        )
+    return len(mais_recente)
+
+
+class ArmazenamentoOportunidades:
+    """Upsert em lote de uma tabela de oportunidades.
+
+    chave: colunas que identificam o anúncio (índice único)
+    colunas: colunas gravadas, na ordem dos dicts recebidos em salvar()
+    colunas_historico: colunas de historico_varreduras em registrar_historico()
+    so_na_insercao: colunas gravadas só quando o anúncio é novo (o score é do
+    rescore; o da varredura usa a referência de mercado do momento e não deve
+    fazer a linha parecer alterada)
+    escritor: EscritorSQLite opcional; com ele as gravações vão para a thread
+    de escrita (salvar() retorna um Future) e conn fica só para leitura/esquema
+    """
+
+    def __init__(self, conn, tabela, chave, colunas,
+                 tabela_historico='historico_varreduras', colunas_historico=(), escritor=None,
+                 so_na_insercao=('score',)):
+        self.conn = conn
+        self.logger = logging.getLogger(__name__)
+        self.escritor = escritor
+        self.tabela = tabela
+        self.chave = tuple(chave)
+        self.colunas = tuple(colunas)
+        self.so_na_insercao = set(so_na_insercao)
+        self.tabela_historico = tabela_historico
+        self.colunas_historico = tuple(colunas_historico)
+        self.historico_pendente = []
+
+        self.garantir_esquema()
+        self.sql_historico = (
+            f"INSERT INTO {tabela_historico} ({', '.join(self.colunas_historico)}) "
+            f"VALUES ({', '.join('?' * len(self.colunas_historico))})"
+        )
+
+    def _colunas_tabela(self):
+        return {linha[1] for linha in self.conn.execute(f"PRAGMA table_info({self.tabela})")}
+
+    def _tem_indice_unico(self):
+        """True se já existe índice/constraint UNIQUE exatamente sobre a chave"""
+        for linha in self.conn.execute(f"PRAGMA index_list({self.tabela})"):
+            nome, unico = linha[1], linha[2]
+            if unico:
+                colunas = {info[2] for info in self.conn.execute(f"PRAGMA index_info({nome})")}
+                if colunas == set(self.chave):
+                    return True
+        return False
+
+    def garantir_esquema(self):
+        """Coluna atualizado_em e índice único da chave (remove duplicatas antigas antes)"""
+        with self.conn:
+            if 'atualizado_em' not in self._colunas_tabela():
+                self.conn.execute(f"ALTER TABLE {self.tabela} ADD COLUMN atualizado_em TIMESTAMP")
+            # Leitura incremental das alterações (consolidação por marca d'água)
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{self.tabela}_atualizado_em ON {self.tabela}(atualizado_em)"
+            )
+
+            if not self._tem_indice_unico():
+                colunas_chave = ', '.join(self.chave)
+                # Fica a primeira ocorrência de cada anúncio; chave com NULL não
+                # colide no índice único e fica como está
+                preenchida = ' AND '.join(f"{coluna} IS NOT NULL" for coluna in self.chave)
+                removidas = self.conn.execute(f'''
+                    DELETE FROM {self.tabela}
+                    WHERE {preenchida} AND rowid NOT IN (
+                        SELECT MIN(rowid) FROM {self.tabela} WHERE {preenchida} GROUP BY {colunas_chave}
+                    )
+                ''').rowcount
+                if removidas:
+                    self.logger.warning(
+                        f"{self.tabela}: {removidas} linhas duplicadas por ({colunas_chave}) removidas "
+                        f"antes de criar o índice único"
+                    )
+                # Índice de uma chave anterior (ex.: com o preço) sai antes
+                self.conn.execute(f"DROP INDEX IF EXISTS ux_{self.tabela}_chave")
+                self.conn.execute(
+                    f"CREATE UNIQUE INDEX ux_{self.tabela}_chave ON {self.tabela}({colunas_chave})"
+                )
+
+    def _montar_upsert(self):
+        """INSERT ... ON CONFLICT DO UPDATE só quando algum valor mudou.
+
+        Linhas alteradas perdem as versões de score (score_versao e as
+        score_<variante>_versao de robôs que dividem a tabela) para o rescore
+        incremental recalcular as features delas. Montado a cada lote porque
+        essas colunas podem surgir depois (primeiro rescore).
+        """
+        atualizaveis = [coluna for coluna in self.colunas
+                        if coluna not in self.chave and coluna not in self.so_na_insercao]
+        atribuicoes = [f"{coluna} = excluded.{coluna}" for coluna in atualizaveis]
+        atribuicoes.append('atualizado_em = excluded.atualizado_em')
+        atribuicoes.extend(
+            f"{coluna} = NULL" for coluna in sorted(self._colunas_tabela())
+            if coluna.startswith('score') and coluna.endswith('_versao')
+        )
+        mudou = ' OR '.join(f"{self.tabela}.{coluna} IS NOT excluded.{coluna}" for coluna in atualizaveis)
+
+        colunas = ', '.join(self.colunas + ('atualizado_em',))
+        return f'''
+            INSERT INTO {self.tabela} ({colunas})
+            VALUES ({', '.join('?' * (len(self.colunas) + 1))})
+            ON CONFLICT({', '.join(self.chave)}) DO UPDATE SET {', '.join(atribuicoes)}
+            WHERE {mudou or '0'}
+        '''
+
+    def registrar_historico(self, *valores):
+        """Acumula uma linha de histórico; vai ao banco no próximo salvar()/descarregar_historico()"""
+        self.historico_pendente.append(valores)
+
+    def _gravar(self, conn, sql_upsert, linhas, historico):
+        # rowcount soma as linhas do próprio upsert (sem as dos triggers)
+        gravadas = conn.executemany(sql_upsert, linhas).rowcount if linhas else 0
+        if historico:
+            conn.executemany(self.sql_historico, historico)
+        return gravadas
+
+    def _enviar(self, linhas):
+        """Agenda o lote + histórico pendente no escritor; retorna o Future"""
+        historico, self.historico_pendente = self.historico_pendente, []
+        sql_upsert = self._montar_upsert() if linhas else None
+        return self.escritor.executar(lambda conn: self._gravar(conn, sql_upsert, linhas, historico))
+
+    def salvar(self, registros):
+        """Grava um lote de dicts (+ histórico pendente) em uma transação.
+
+        Retorna o número de linhas inseridas ou alteradas (com escritor, um
+        Future desse número).
+        """
+        agora = _agora()
+        linhas = [tuple(registro[coluna] for coluna in self.colunas) + (agora,) for registro in registros]
+
+        if self.escritor is not None:
+            return self._enviar(linhas)
+
+        with self.conn:
+            gravadas = self._gravar(self.conn, self._montar_upsert() if linhas else None,
+                                    linhas, self.historico_pendente)
+        self.historico_pendente = []
+        return gravadas
+
+    def descarregar_historico(self):
+        """Grava o histórico acumulado"""
+        if self.escritor is not None:
+            if self.historico_pendente:
+                self._enviar([])
+            return
+        with self.conn:
+            self._gravar(self.conn, None, [], self.historico_pendente)
+        self.historico_pendente = []
+
+    def fechar(self):
+        self.descarregar_historico()
+        if self.escritor is not None:
+            self.escritor.aguardar()
+        self.conn.close()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Busca Textual das Oportunidades
+Índice FTS5 de conteúdo externo (sem duplicar o texto) sobre titulo,
+endereco, bairro e observacoes, sincronizado por triggers com a tabela de
+anúncios. Consulta do usuário reduzida a termos entre aspas (nenhum operador
+FTS5 passa), ordenada por bm25 e combinável com filtros de cidade, score e preço
+"""
+
+import re
+
+from esquema import colunas_tabela
+
+
+COLUNAS_BUSCA = ('titulo', 'endereco', 'bairro', 'observacoes')
+
+# Pesos do bm25 na ordem de COLUNAS_BUSCA: título pesa mais que observações
+PESOS_BUSCA = (10.0, 2.0, 5.0, 1.0)
+
+MAXIMO_TERMOS = 8
+
+
+def fts5_disponivel(conn):
+    return any(opcao[0] == 'ENABLE_FTS5' for opcao in conn.execute('PRAGMA compile_options'))
+
+
+def garantir_busca(conn, tabela, indice=None, chave='id'):
+    """Cria o índice FTS5 + triggers de sincronia; retorna o nome do índice.
+
+    Sem FTS5 no SQLite (ou sem a tabela) retorna None. Na criação o índice é
+    preenchido com 'rebuild' a partir da tabela.
+    """
+    if not fts5_disponivel(conn) or not colunas_tabela(conn, tabela):
+        return None
+    indice = indice or f"{tabela}_busca"
+    colunas = ', '.join(COLUNAS_BUSCA)
+    antigos = ', '.join(f"OLD.{coluna}" for coluna in COLUNAS_BUSCA)
+    novos = ', '.join(f"NEW.{coluna}" for coluna in COLUNAS_BUSCA)
+
+    with conn:
+        existia = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (indice,)
+        ).fetchone()
+
+        # remove_diacritics: 'sao' encontra 'São'; prefix: autocompletar barato
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {indice} USING fts5(
+                {colunas},
+                content='{tabela}', content_rowid='{chave}',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        ''')
+        if not existia:
+            conn.execute(f"INSERT INTO {indice}({indice}) VALUES ('rebuild')")
+
+        # Conteúdo externo: o 'delete' precisa dos valores antigos
+        gatilhos = [
+            f'''CREATE TRIGGER IF NOT EXISTS {tabela}_busca_insert
+            AFTER INSERT ON {tabela}
+            BEGIN
+                INSERT INTO {indice}(rowid, {colunas}) VALUES (NEW.{chave}, {novos});
+            END''',
+            f'''CREATE TRIGGER IF NOT EXISTS {tabela}_busca_delete
+            AFTER DELETE ON {tabela}
+            BEGIN
+                INSERT INTO {indice}({indice}, rowid, {colunas}) VALUES ('delete', OLD.{chave}, {antigos});
+            END''',
+            # Só quando algum texto indexado muda (upsert de preço não reindexa)
+            f'''CREATE TRIGGER IF NOT EXISTS {tabela}_busca_update
+            AFTER UPDATE OF {colunas} ON {tabela}
+            WHEN {' OR '.join(f"OLD.{coluna} IS NOT NEW.{coluna}" for coluna in COLUNAS_BUSCA)}
+            BEGIN
+                INSERT INTO {indice}({indice}, rowid, {colunas}) VALUES ('delete', OLD.{chave}, {antigos});
+                INSERT INTO {indice}(rowid, {colunas}) VALUES (NEW.{chave}, {novos});
+            END'''
+        ]
+        for gatilho in gatilhos:
+            conn.execute(gatilho)
+    return indice
+
+
+def consulta_fts(texto):
+    """Texto livre -> expressão MATCH segura ('' se não sobrar termo).
+
+    Cada palavra vira uma frase entre aspas (AND implícito); a última aceita
+    prefixo, para a busca funcionar enquanto o usuário digita.
+    """
+    termos = re.findall(r'\w+', texto or '')[:MAXIMO_TERMOS]
+    if not termos:
+        return ''
+    frases = [f'"{termo}"' for termo in termos]
+    frases[-1] += '*'
+    return ' '.join(frases)
+
+
+def buscar(conn, tabela, texto=None, cidade=None, score_min=None, score_max=None,
+           preco_min=None, preco_max=None, limite=20, pagina=1, indice=None, chave='id'):
+    """Anúncios que casam com o texto e os filtros, do mais ao menos relevante.
+
+    Sem texto, só os filtros valem (ordem cidade_rank, score). Busca limite + 1
+    linhas: a extra indica se há próxima página e não é retornada.
+    Retorna (linhas, tem_mais).
+    """
+    indice = indice or f"{tabela}_busca"
+    consulta = consulta_fts(texto)
+
+    filtros, parametros = [], {'limite': limite + 1, 'deslocamento': (max(pagina, 1) - 1) * limite}
+    for condicao, nome, valor in (
+        ('o.cidade = :cidade', 'cidade', cidade),
+        ('o.score >= :score_min', 'score_min', score_min),
+        ('o.score <= :score_max', 'score_max', score_max),
+        ('o.preco >= :preco_min', 'preco_min', preco_min),
+        ('o.preco <= :preco_max', 'preco_max', preco_max)
+    ):
+        if valor is not None:
+            filtros.append(condicao)
+            parametros[nome] = valor
+
+    if consulta:
+        filtros.insert(0, f"{indice} MATCH :consulta")
+        parametros['consulta'] = consulta
+        origem = f"{indice} JOIN {tabela} o ON o.{chave} = {indice}.rowid"
+        relevancia = f"bm25({indice}, {', '.join(str(peso) for peso in PESOS_BUSCA)})"
+        ordem = 'relevancia, o.score DESC'
+    else:
+        origem = f"{tabela} o"
+        relevancia = 'NULL'
+        ordem = 'o.cidade_rank, o.score DESC'
+
+    linhas = conn.execute(f'''
+        SELECT o.{chave} AS id, o.cidade, o.estado, o.titulo, o.preco, o.area, o.preco_m2, o.score,
+               o.potencial_categoria, o.portal, o.referencia, o.endereco, o.bairro,
+               o.quartos, o.banheiros, o.vagas, o.url, o.data_encontrado,
+               {relevancia} AS relevancia
+        FROM {origem}
+        {'WHERE ' + ' AND '.join(filtros) if filtros else ''}
+        ORDER BY {ordem}
+        LIMIT :limite OFFSET :deslocamento
+    ''', parametros).fetchall()
+
+    return linhas[:limite], len(linhas) > limite
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache HTTP Persistente com GET Condicional
+Guarda ETag / Last-Modified e o corpo comprimido de cada página de listagem,
+para que as varreduras revalidem com If-None-Match / If-Modified-Since e
+pulem o parsing quando o portal responde 304. Uma página nova só vai para o
+cache quando o chamador confirma que a processou e gravou: se o parsing ou a
+gravação falharem, a próxima varredura baixa a página de novo
+"""
+
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+
+
+class CacheHTTP:
+    """Cache em disco (SQLite) indexado pela URL"""
+
+    def __init__(self, caminho='cache_http.db', nivel_compressao=6):
+        self.caminho = caminho
+        self.nivel_compressao = nivel_compressao
+        self.lock = threading.Lock()
+        # Respostas 200 aguardando confirmar(), por URL
+        self.pendentes = {}
+        # O motor assíncrono chama o cache a partir de várias threads
+        self.conn = sqlite3.connect(caminho, check_same_thread=False)
+        self.init_database()
+
+    def init_database(self):
+        """Cria a tabela do cache"""
+        with self.lock:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_paginas (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_type TEXT,
+                    corpo BLOB,
+                    tamanho_original INTEGER,
+                    data_download TIMESTAMP,
+                    data_validacao TIMESTAMP
+                )
+            ''')
+            self.conn.commit()
+
+    def cabecalhos_condicionais(self, url):
+        """Retorna If-None-Match / If-Modified-Since para a URL, se houver entrada"""
+        with self.lock:
+            linha = self.conn.execute(
+                'SELECT etag, last_modified FROM cache_paginas WHERE url = ?', (url,)
+            ).fetchone()
+
+        if not linha:
+            return {}
+
+        etag, last_modified = linha
+        cabecalhos = {}
+        if etag:
+            cabecalhos['If-None-Match'] = etag
+        if last_modified:
+            cabecalhos['If-Modified-Since'] = last_modified
+        return cabecalhos
+
+    def registrar(self, url, response):
+        """Atualiza o cache com a resposta recebida.
+
+        Retorna True quando a página não mudou (304), indicando que o
+        chamador pode pular o download e o parsing. Uma resposta 200 fica
+        pendente até confirmar(url).
+        """
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        if response.status_code == 304:
+            with self.lock:
+                self.conn.execute(
+                    'UPDATE cache_paginas SET data_validacao = ? WHERE url = ?', (agora, url)
+                )
+                self.conn.commit()
+            return True
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        # Sem validadores não há como revalidar depois
+        if response.status_code != 200 or (not etag and not last_modified):
+            with self.lock:
+                self.pendentes.pop(url, None)
+            return False
+
+        conteudo = response.content
+        with self.lock:
+            self.pendentes[url] = (
+                url, etag, last_modified, response.headers.get('Content-Type'),
+                zlib.compress(conteudo, self.nivel_compressao), len(conteudo),
+                agora, agora
+            )
+        return False
+
+    def confirmar(self, *urls):
+        """Grava as respostas pendentes das URLs já processadas com sucesso"""
+        with self.lock:
+            linhas = [self.pendentes.pop(url) for url in urls if url in self.pendentes]
+            if not linhas:
+                return
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO cache_paginas
+                (url, etag, last_modified, content_type, corpo, tamanho_original,
+                 data_download, data_validacao)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', linhas)
+            self.conn.commit()
+
+    def corpo(self, url):
+        """Retorna o último corpo baixado para a URL (descomprimido) ou None"""
+        with self.lock:
+            linha = self.conn.execute(
+                'SELECT corpo FROM cache_paginas WHERE url = ?', (url,)
+            ).fetchone()
+        return zlib.decompress(linha[0]) if linha and linha[0] else None
+
+    def fechar(self):
+        """Fecha a conexão com o banco do cache"""
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache de Respostas das APIs dos Dashboards
+Corpo JSON já serializado por chave (rota + query string), válido enquanto o
+banco não mudar: a versão vem de PRAGMA data_version de uma conexão sentinela
+(muda a cada commit de outra conexão, inclusive de outros processos) e do
+inode do arquivo (banco substituído). ETag forte = hash do corpo. Misses
+simultâneos da mesma chave calculam uma vez só (os demais esperam o resultado)
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+from urllib.parse import quote
+
+
+EntradaCache = namedtuple('EntradaCache', 'versao corpo etag')
+
+
+class CacheRespostas:
+    """Respostas serializadas por chave, invalidadas quando o banco muda"""
+
+    def __init__(self, caminho, maximo_entradas=256):
+        self.caminho = os.path.abspath(caminho)
+        self.maximo_entradas = maximo_entradas
+        self.lock = threading.Lock()
+        self.entradas = OrderedDict()
+        self.calculando = {}
+        self.sentinela = None
+        self.identidade = None
+
+    def versao(self):
+        """(dispositivo, inode, data_version) atual do banco"""
+        estado = os.stat(self.caminho)
+        identidade = (estado.st_dev, estado.st_ino)
+        with self.lock:
+            if self.sentinela is None or identidade != self.identidade:
+                if self.sentinela is not None:
+                    self.sentinela.close()
+                self.sentinela = sqlite3.connect(
+                    f"file:{quote(self.caminho)}?mode=ro", uri=True, check_same_thread=False
+                )
+                self.identidade = identidade
+            return identidade + (self.sentinela.execute('PRAGMA data_version').fetchone()[0],)
+
+    def obter(self, chave, calcular):
+        """EntradaCache da chave; calcular() -> bytes só roda em miss (uma vez por versão)"""
+        versao = self.versao()
+        with self.lock:
+            entrada = self.entradas.get(chave)
+            if entrada is not None and entrada.versao == versao:
+                self.entradas.move_to_end(chave)
+                return entrada
+            futuro = self.calculando.get((chave, versao))
+            dono = futuro is None
+            if dono:
+                futuro = self.calculando[(chave, versao)] = Future()
+
+        if not dono:
+            return futuro.result()
+
+        try:
+            corpo = calcular()
+            entrada = EntradaCache(versao, corpo, hashlib.sha1(corpo).hexdigest())
+        except BaseException as e:
+            with self.lock:
+                del self.calculando[(chave, versao)]
+            futuro.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.calculando[(chave, versao)]
+            self.entradas[chave] = entrada
+            self.entradas.move_to_end(chave)
+            while len(self.entradas) > self.maximo_entradas:
+                self.entradas.popitem(last=False)
+        futuro.set_result(entrada)
+        return entrada
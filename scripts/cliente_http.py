@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cliente HTTP Compartilhado
+Sessão única com pool de conexões keep-alive, retry com backoff, timeouts
+separados de conexão e leitura e rotação de headers, usada por todos os robôs
+"""
+
+import random
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Headers base enviados em todas as requisições
+HEADERS_PADRAO = {
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Cache-Control': 'max-age=0'
+}
+
+# User agents rotativos
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15'
+]
+
+# Conjuntos completos de headers (rotação por perfil de navegador)
+HEADERS_POOL = [
+    {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1'
+    },
+    {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'pt-BR,pt;q=0.8,en-US;q=0.5,en;q=0.3',
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive'
+    }
+]
+
+
+def criar_sessao(pool_conexoes=10, pool_maximo=10, tentativas=3, backoff=1,
+                 status_retry=(429, 500, 502, 503, 504)):
+    """Cria uma sessão requests com pool de conexões e política de retry"""
+    session = requests.Session()
+
+    retry_strategy = Retry(
+        total=tentativas,
+        connect=tentativas,
+        read=tentativas,
+        backoff_factor=backoff,
+        status_forcelist=list(status_retry),
+        allowed_methods=['HEAD', 'GET', 'OPTIONS'],
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_conexoes,  # hosts com pool próprio
+        pool_maxsize=pool_maximo,        # conexões reutilizáveis por host
+        max_retries=retry_strategy
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+class ClienteHTTP:
+    """Cliente compartilhado pelos robôs.
+
+    Reaproveita conexões TCP/TLS entre requisições, aplica o limitador de
+    taxa por host e, se houver cache, faz GET condicional.
+    """
+
+    def __init__(self, pool_conexoes=10, pool_maximo=10, tentativas=3, backoff=1,
+                 timeout_conexao=10, timeout_leitura=30, headers_base=None,
+                 headers_pool=None, user_agents=None, limitador=None, cache=None):
+        self.session = criar_sessao(pool_conexoes, pool_maximo, tentativas, backoff)
+        self.timeout = (timeout_conexao, timeout_leitura)
+        self.headers_base = dict(headers_base if headers_base is not None else HEADERS_PADRAO)
+        self.headers_pool = headers_pool
+        self.user_agents = user_agents if user_agents is not None else USER_AGENTS
+        self.limitador = limitador
+        self.cache = cache
+
+    def headers_rotativos(self):
+        """Retorna um conjunto de headers para a próxima requisição"""
+        if self.headers_pool:
+            return dict(random.choice(self.headers_pool))
+
+        headers = dict(self.headers_base)
+        if self.user_agents:
+            headers['User-Agent'] = random.choice(self.user_agents)
+        return headers
+
+    def get(self, url, headers=None, aguardar=True, **kwargs):
+        """GET com rotação de headers, limitador de taxa e timeouts separados.
+
+        aguardar=False quando o chamador já reservou a vaga no limitador
+        (caso do motor assíncrono).
+        """
+        cabecalhos = self.headers_rotativos()
+        if headers:
+            cabecalhos.update(headers)
+        kwargs.setdefault('timeout', self.timeout)
+
+        if self.limitador is not None and aguardar:
+            self.limitador.aguardar(url)
+
+        response = self.session.get(url, headers=cabecalhos, **kwargs)
+
+        if self.limitador is not None:
+            self.limitador.registrar_resposta(url, response)
+
+        return response
+
+    def get_condicional(self, url, headers=None, aguardar=True, **kwargs):
+        """GET revalidado pelo cache; retorna (response, nao_modificado)"""
+        if self.cache is None:
+            return self.get(url, headers=headers, aguardar=aguardar, **kwargs), False
+
+        cabecalhos = dict(headers or {})
+        cabecalhos.update(self.cache.cabecalhos_condicionais(url))
+
+        response = self.get(url, headers=cabecalhos, aguardar=aguardar, **kwargs)
+        return response, self.cache.registrar(url, response)
+
+    def confirmar(self, *urls):
+        """Páginas de get_condicional processadas e gravadas: validadores vão para o cache"""
+        if self.cache is not None:
+            self.cache.confirmar(*urls)
+
+    def fechar(self):
+        """Fecha as conexões do pool"""
+        self.session.close()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conexões de Leitura Persistentes para os Dashboards
+Pool de conexões SQLite somente leitura (URI mode=ro + query_only) reaproveitadas
+entre requisições: o cache de páginas, o mmap e o cache de statements
+preparados continuam quentes. Se o arquivo do banco for substituído (novo
+inode), as conexões antigas são descartadas e reabertas no arquivo novo
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+
+
+class _ConexaoLeitura(sqlite3.Connection):
+    """sqlite3.Connection que lembra de qual arquivo (dispositivo, inode) foi aberta"""
+    identidade = None
+
+
+class ConexoesLeitura:
+    """Conexões somente leitura de um arquivo de banco.
+
+    O servidor do Flask cria uma thread por requisição, então a conexão não
+    fica presa à thread: obter() pega uma ociosa (ou abre), devolver() a
+    guarda para a próxima requisição.
+    """
+
+    def __init__(self, caminho, row_factory=sqlite3.Row, maximo_ociosas=8,
+                 cache_kib=32 * 1024, mmap_bytes=256 * 1024 * 1024, statements=256):
+        self.caminho = os.path.abspath(caminho)
+        self.row_factory = row_factory
+        self.maximo_ociosas = maximo_ociosas
+        self.cache_kib = cache_kib
+        self.mmap_bytes = mmap_bytes
+        self.statements = statements
+        self.lock = threading.Lock()
+        self.ociosas = []
+
+    def _identidade(self):
+        try:
+            estado = os.stat(self.caminho)
+        except FileNotFoundError:
+            raise sqlite3.OperationalError(f"banco não encontrado: {self.caminho}")
+        return estado.st_dev, estado.st_ino
+
+    def _abrir(self, identidade):
+        conn = sqlite3.connect(
+            f"file:{quote(self.caminho)}?mode=ro", uri=True,
+            factory=_ConexaoLeitura, check_same_thread=False,
+            cached_statements=self.statements
+        )
+        conn.identidade = identidade
+        conn.row_factory = self.row_factory
+        conn.execute('PRAGMA query_only = ON')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_kib)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_bytes)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def obter(self):
+        """Conexão ociosa do mesmo arquivo, ou uma nova"""
+        identidade = self._identidade()
+        descartadas = []
+        conn = None
+        with self.lock:
+            while self.ociosas:
+                candidata = self.ociosas.pop()
+                if candidata.identidade == identidade:
+                    conn = candidata
+                    break
+                # Arquivo substituído: as demais ociosas também são do antigo
+                descartadas.append(candidata)
+            if descartadas:
+                descartadas.extend(self.ociosas)
+                self.ociosas = []
+
+        for antiga in descartadas:
+            antiga.close()
+        return conn or self._abrir(identidade)
+
+    def devolver(self, conn):
+        """Guarda a conexão para reuso (fecha se sobrar ou se o arquivo mudou)"""
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            atual = self._identidade() == conn.identidade
+        except sqlite3.OperationalError:
+            atual = False
+        with self.lock:
+            if atual and len(self.ociosas) < self.maximo_ociosas:
+                self.ociosas.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def conexao(self):
+        conn = self.obter()
+        try:
+            yield conn
+        finally:
+            self.devolver(conn)
+
+    def fechar(self):
+        with self.lock:
+            ociosas, self.ociosas = self.ociosas, []
+        for conn in ociosas:
+            conn.close()
@@ -3,23 +3,77 @@
 """
 Script para consolidar todas as oportunidades em uma plataforma unificada
 Integra dados de Senador Canedo + Oportunidades Regionais
+
+Consolidação incremental: os bancos de origem são anexados (ATTACH) e só as
+linhas novas ou alteradas desde a última execução (marca d'água por origem:
+último id e último atualizado_em) são mescladas com INSERT ... SELECT, em
+transações curtas de até LOTE_CONSOLIDACAO ids (banco em WAL: os dashboards
+continuam lendo durante a consolidação)
 """
 
-import sqlite3
 import logging
+import argparse
+import os
 from datetime import datetime
 
-def consolidar_plataforma():
-    """Consolida todos os dados em uma plataforma unificada"""
-    
-    # Conecta aos bancos existentes
-    conn_senador = sqlite3.connect('oportunidades_senador_canedo.db')
-    conn_regionais = sqlite3.connect('oportunidades_regionais.db')
-    
-    # Cria banco consolidado
-    conn_consolidado = sqlite3.connect('plataforma_oportunidades_completa.db')
-    cursor_consolidado = conn_consolidado.cursor()
-    
+from escritor_sqlite import conectar_escrita
+from esquema import migrar_esquema_leitura
+from historico_precos import garantir_historico_precos
+from busca_textual import garantir_busca
+from eventos_oportunidades import garantir_eventos, podar_eventos
+
+BANCO_CONSOLIDADO = 'plataforma_oportunidades_completa.db'
+
+# Ids de origem por transação na mescla das linhas novas
+LOTE_CONSOLIDACAO = 5000
+
+# Colunas gravadas em oportunidades_completas (mesma ordem dos SELECTs abaixo)
+COLUNAS_CONSOLIDADAS = (
+    'cidade', 'estado', 'titulo', 'preco', 'area', 'preco_m2', 'endereco', 'bairro',
+    'quartos', 'banheiros', 'vagas', 'score', 'potencial_categoria', 'portal',
+    'referencia', 'url', 'data_encontrado', 'observacoes'
+)
+
+# Origens: alias do ATTACH, arquivo, tabela e SELECT já no formato consolidado.
+# A referência de Senador Canedo vem do id ('SC001', 'SC002', ...): antes era
+# sempre 'SC001' e as linhas colidiam na chave (referencia, portal, cidade).
+# O id não muda com o preço (o v4 grava pela identidade do anúncio), então
+# uma queda de preço chega aqui como alteração da mesma linha
+ORIGENS = [
+    {
+        'alias': 'senador',
+        'arquivo': 'oportunidades_senador_canedo.db',
+        'tabela': 'oportunidades',
+        'select': '''
+            SELECT 'Senador Canedo', 'GO', titulo, preco, area, preco_m2, endereco, bairro,
+                   quartos, banheiros, vagas, score, 'CONSOLIDADO - REFERÊNCIA', portal,
+                   'SC' || printf('%03d', id), url, data_encontrado, observacoes
+        '''
+    },
+    {
+        'alias': 'regionais',
+        'arquivo': 'oportunidades_regionais.db',
+        'tabela': 'oportunidades_reais',
+        'select': '''
+            SELECT cidade, estado, titulo, preco, area, preco_m2, endereco, bairro,
+                   NULL, NULL, NULL, score, potencial_categoria, portal,
+                   referencia, url, data_encontrado, 'Migrado de sistema regional'
+        '''
+    }
+]
+
+# Estatísticas fixas das cidades
+CIDADES_STATS = [
+    ('Lucas do Rio Verde', 'MT', 'OURO - EXCEPCIONAL', '3,83% ao ano - 2º maior do Brasil'),
+    ('Rio Verde', 'GO', 'PRATA - EXCEPCIONAL', '2,1% ao ano - Agronegócio forte'),
+    ('Sinop', 'MT', 'BRONZE - ALTA', '1,8% ao ano - Portal Norte MT'),
+    ('Barreiras', 'BA', 'REGIONAL - MÉDIA', '1,5% ao ano - Hub do Oeste Baiano'),
+    ('Palmas', 'TO', 'ESTÁVEL - CONSOLIDADA', '1,2% ao ano - Capital planejada'),
+    ('Senador Canedo', 'GO', 'CONSOLIDADO - REFERÊNCIA', '0,8% ao ano - Mercado aquecido')
+]
+
+def criar_tabelas(cursor_consolidado):
+    """Tabelas do banco consolidado"""
     # Cria tabela unificada
     cursor_consolidado.execute('''
         CREATE TABLE IF NOT EXISTS oportunidades_completas (
@@ -46,50 +100,6 @@ def consolidar_plataforma():
         )
     ''')
     
-    # Migra dados de Senador Canedo
-    cursor_senador = conn_senador.cursor()
-    dados_senador = cursor_senador.execute('''
-        SELECT titulo, preco, area, preco_m2, endereco, bairro, 
-               quartos, banheiros, vagas, score, portal, url, 
-               data_encontrado, observacoes
-        FROM oportunidades
-    ''').fetchall()
-    
-    for dado in dados_senador:
-        cursor_consolidado.execute('''
-            INSERT OR REPLACE INTO oportunidades_completas 
-            (cidade, estado, titulo, preco, area, preco_m2, endereco, bairro,
-             quartos, banheiros, vagas, score, potencial_categoria, portal, 
-             referencia, url, data_encontrado, observacoes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            'Senador Canedo', 'GO', dado[0], dado[1], dado[2], dado[3], 
-            dado[4], dado[5], dado[6], dado[7], dado[8], dado[9],
-            'CONSOLIDADO - REFERÊNCIA', dado[10], 'SC001', dado[11], 
-            dado[12], dado[13]
-        ))
-    
-    # Migra dados regionais
-    cursor_regionais = conn_regionais.cursor()
-    dados_regionais = cursor_regionais.execute('''
-        SELECT cidade, estado, titulo, preco, area, preco_m2, endereco, bairro,
-               score, potencial_categoria, portal, referencia, url, data_encontrado
-        FROM oportunidades_reais
-    ''').fetchall()
-    
-    for dado in dados_regionais:
-        cursor_consolidado.execute('''
-            INSERT OR REPLACE INTO oportunidades_completas 
-            (cidade, estado, titulo, preco, area, preco_m2, endereco, bairro,
-             quartos, banheiros, vagas, score, potencial_categoria, portal, 
-             referencia, url, data_encontrado, observacoes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            dado[0], dado[1], dado[2], dado[3], dado[4], dado[5], 
-            dado[6], dado[7], None, None, None, dado[8], dado[9], 
-            dado[10], dado[11], dado[12], dado[13], 'Migrado de sistema regional'
-        ))
-    
     # Cria tabela de estatísticas por cidade
     cursor_consolidado.execute('''
         CREATE TABLE IF NOT EXISTS estatisticas_cidades (
@@ -107,35 +117,6 @@ def consolidar_plataforma():
         )
     ''')
     
-    # Popula estatísticas das cidades
-    cidades_stats = [
-        ('Lucas do Rio Verde', 'MT', 'OURO - EXCEPCIONAL', '3,83% ao ano - 2º maior do Brasil'),
-        ('Rio Verde', 'GO', 'PRATA - EXCEPCIONAL', '2,1% ao ano - Agronegócio forte'),
-        ('Sinop', 'MT', 'BRONZE - ALTA', '1,8% ao ano - Portal Norte MT'),
-        ('Barreiras', 'BA', 'REGIONAL - MÉDIA', '1,5% ao ano - Hub do Oeste Baiano'),
-        ('Palmas', 'TO', 'ESTÁVEL - CONSOLIDADA', '1,2% ao ano - Capital planejada'),
-        ('Senador Canedo', 'GO', 'CONSOLIDADO - REFERÊNCIA', '0,8% ao ano - Mercado aquecido')
-    ]
-    
-    for cidade, estado, potencial, crescimento in cidades_stats:
-        # Calcula estatísticas reais
-        stats = cursor_consolidado.execute('''
-            SELECT COUNT(*), AVG(score), AVG(preco), AVG(preco_m2), 
-                   MIN(preco), MAX(preco)
-            FROM oportunidades_completas 
-            WHERE cidade = ?
-        ''', (cidade,)).fetchone()
-        
-        if stats[0] > 0:  # Se tem dados
-            cursor_consolidado.execute('''
-                INSERT OR REPLACE INTO estatisticas_cidades 
-                (cidade, estado, total_oportunidades, score_medio, preco_medio, 
-                 preco_m2_medio, menor_preco, maior_preco, potencial_categoria, 
-                 crescimento_populacional)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (cidade, estado, stats[0], stats[1], stats[2], stats[3], 
-                  stats[4], stats[5], potencial, crescimento))
-    
     # Cria tabela de histórico consolidado
     cursor_consolidado.execute('''
         CREATE TABLE IF NOT EXISTS historico_consolidado (
@@ -148,30 +129,168 @@ def consolidar_plataforma():
         )
     ''')
     
-    # Registra consolidação atual
-    total_ops = cursor_consolidado.execute('SELECT COUNT(*) FROM oportunidades_completas').fetchone()[0]
-    total_cidades = cursor_consolidado.execute('SELECT COUNT(DISTINCT cidade) FROM oportunidades_completas').fetchone()[0]
-    total_portais = cursor_consolidado.execute('SELECT COUNT(DISTINCT portal) FROM oportunidades_completas').fetchone()[0]
-    
+    # Marca d'água por origem: último id e último atualizado_em já mesclados
     cursor_consolidado.execute('''
-        INSERT INTO historico_consolidado 
-        (total_oportunidades, cidades_monitoradas, portais_ativos, observacoes)
-        VALUES (?, ?, ?, ?)
-    ''', (total_ops, total_cidades, total_portais, 'Consolidação completa - Senador Canedo + Regionais'))
+        CREATE TABLE IF NOT EXISTS marcas_consolidacao (
+            origem TEXT PRIMARY KEY,
+            ultimo_id INTEGER NOT NULL DEFAULT 0,
+            ultima_alteracao TIMESTAMP,
+            data_consolidacao TIMESTAMP
+        )
+    ''')
+
+def mesclar_origem(conn_consolidado, origem, lote=LOTE_CONSOLIDACAO):
+    """Mescla as linhas novas/alteradas de uma origem anexada; retorna o número de linhas.
+
+    Cada lote é uma transação; a marca d'água só avança no fim. Se a execução
+    cair no meio, a próxima remescla o que já foi (o upsert é idempotente).
+    """
+    alias, tabela = origem['alias'], origem['tabela']
+    colunas_origem = {linha[1] for linha in conn_consolidado.execute(f"PRAGMA {alias}.table_info({tabela})")}
+    if not colunas_origem:
+        return 0
+    
+    marca = conn_consolidado.execute(
+        'SELECT ultimo_id, ultima_alteracao FROM marcas_consolidacao WHERE origem = ?', (alias,)
+    ).fetchone() or (0, None)
+    tem_alteracao = 'atualizado_em' in colunas_origem
     
-    # Salva alterações
-    conn_consolidado.commit()
+    # Próxima marca lida antes da mescla: o que chegar durante ela fica para a
+    # próxima execução (no máximo reprocessado, nunca perdido)
+    ultimo_id, ultima_alteracao = conn_consolidado.execute(
+        f"SELECT MAX(id), {'MAX(atualizado_em)' if tem_alteracao else 'NULL'} FROM {alias}.{tabela}"
+    ).fetchone()
+    ultimo_id = ultimo_id or marca[0]
+    
+    atualizaveis = [coluna for coluna in COLUNAS_CONSOLIDADAS if coluna not in ('referencia', 'portal', 'cidade')]
+    
+    def mesclar(filtro, parametros):
+        cursor = conn_consolidado.execute(f'''
+            INSERT INTO oportunidades_completas ({', '.join(COLUNAS_CONSOLIDADAS)})
+            {origem['select']}
+            FROM {alias}.{tabela} o
+            WHERE {filtro}
+            ON CONFLICT(referencia, portal, cidade) DO UPDATE SET
+                {', '.join(f"{coluna} = excluded.{coluna}" for coluna in atualizaveis)}
+            WHERE {' OR '.join(f"oportunidades_completas.{coluna} IS NOT excluded.{coluna}" for coluna in atualizaveis)}
+        ''', parametros)
+        return cursor.rowcount
+    
+    mescladas = 0
+    
+    # Alteradas (já mescladas antes): atualizado_em >= marca (>= porque várias
+    # linhas podem ter o mesmo segundo; reprocessar é idempotente)
+    if tem_alteracao and marca[0]:
+        with conn_consolidado:
+            mescladas += mesclar('o.id <= :ultimo_id AND o.atualizado_em >= :ultima_alteracao',
+                                 {'ultimo_id': marca[0], 'ultima_alteracao': marca[1] or ''})
+    
+    # Novas: id acima da marca, em faixas de ids
+    inicio = marca[0]
+    while inicio < ultimo_id:
+        fim = min(inicio + lote, ultimo_id)
+        with conn_consolidado:
+            mescladas += mesclar('o.id > :inicio AND o.id <= :fim', {'inicio': inicio, 'fim': fim})
+        inicio = fim
+    
+    with conn_consolidado:
+        conn_consolidado.execute('''
+            INSERT INTO marcas_consolidacao (origem, ultimo_id, ultima_alteracao, data_consolidacao)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(origem) DO UPDATE SET
+                ultimo_id = excluded.ultimo_id,
+                ultima_alteracao = COALESCE(excluded.ultima_alteracao, ultima_alteracao),
+                data_consolidacao = excluded.data_consolidacao
+        ''', (alias, ultimo_id, ultima_alteracao, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    
+    return mescladas
+
+def atualizar_estatisticas(cursor_consolidado):
+    """Dados fixos das cidades; os agregados são mantidos pelos triggers (esquema.py)"""
+    cursor_consolidado.executemany('''
+        INSERT INTO estatisticas_cidades
+        (cidade, estado, potencial_categoria, crescimento_populacional, total_oportunidades)
+        VALUES (?, ?, ?, ?, 0)
+        ON CONFLICT(cidade) DO UPDATE SET
+            potencial_categoria = excluded.potencial_categoria,
+            crescimento_populacional = excluded.crescimento_populacional
+        WHERE potencial_categoria IS NOT excluded.potencial_categoria
+           OR crescimento_populacional IS NOT excluded.crescimento_populacional
+    ''', CIDADES_STATS)
+
+def consolidar_plataforma(completo=False):
+    """Consolida os dados novos/alterados em uma plataforma unificada"""
+    
+    # Cria banco consolidado
+    conn_consolidado = conectar_escrita(BANCO_CONSOLIDADO)
+    cursor_consolidado = conn_consolidado.cursor()
+    
+    criar_tabelas(cursor_consolidado)
+    
+    # cidade_rank mantido por trigger + índices de leitura dos dashboards
+    migrar_esquema_leitura(conn_consolidado, 'oportunidades_completas', 'estatisticas_cidades')
+    
+    # Mudanças de preço/área preservadas em observacoes_anuncios (o upsert sobrescreve)
+    garantir_historico_precos(conn_consolidado, 'oportunidades_completas')
+    
+    # Índice FTS5 da busca textual do dashboard (sincronizado por triggers)
+    garantir_busca(conn_consolidado, 'oportunidades_completas')
+    
+    # Novas/alteradas/removidas viram eventos do stream /api/eventos
+    garantir_eventos(conn_consolidado, 'oportunidades_completas')
+    podar_eventos(conn_consolidado)
+    
+    # Anexa os bancos de origem (ATTACH fica fora da transação)
+    origens = []
+    for origem in ORIGENS:
+        if os.path.exists(origem['arquivo']):
+            cursor_consolidado.execute(f"ATTACH DATABASE ? AS {origem['alias']}", (origem['arquivo'],))
+            origens.append(origem)
+        else:
+            print(f"⚠️ Banco de origem não encontrado: {origem['arquivo']}")
+    
+    total_mescladas = 0
+    with conn_consolidado:
+        if completo:
+            # Remesclagem total: zera as marcas d'água
+            cursor_consolidado.execute('DELETE FROM marcas_consolidacao')
+        
+        atualizar_estatisticas(cursor_consolidado)
+    
+    # Transações curtas por lote (ver mesclar_origem)
+    for origem in origens:
+        total_mescladas += mesclar_origem(conn_consolidado, origem)
+    
+    with conn_consolidado:
+        # Registra consolidação atual
+        total_ops, total_cidades, total_portais = cursor_consolidado.execute('''
+            SELECT COUNT(*), COUNT(DISTINCT cidade), COUNT(DISTINCT portal)
+            FROM oportunidades_completas
+        ''').fetchone()
+        
+        cursor_consolidado.execute('''
+            INSERT INTO historico_consolidado
+            (total_oportunidades, cidades_monitoradas, portais_ativos, observacoes)
+            VALUES (?, ?, ?, ?)
+        ''', (total_ops, total_cidades, total_portais,
+              f"Consolidação {'completa' if completo else 'incremental'} - "
+              f"{total_mescladas} linhas novas/alteradas"))
     
     # Fecha conexões
-    conn_senador.close()
-    conn_regionais.close()
+    for origem in origens:
+        cursor_consolidado.execute(f"DETACH DATABASE {origem['alias']}")
     conn_consolidado.close()
     
     print(f"✅ Plataforma consolidada criada!")
+    print(f"🔄 Linhas novas/alteradas: {total_mescladas}")
     print(f"📊 Total de oportunidades: {total_ops}")
     print(f"🏙️ Cidades monitoradas: {total_cidades}")
     print(f"🌐 Portais ativos: {total_portais}")
-    print(f"💾 Banco: plataforma_oportunidades_completa.db")
+    print(f"💾 Banco: {BANCO_CONSOLIDADO}")
 
 if __name__ == "__main__":
-    consolidar_plataforma()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--completo', action='store_true',
+                        help="ignora as marcas d'água e remescla todas as linhas das origens")
+    args = parser.parse_args()
+    consolidar_plataforma(completo=args.completo)
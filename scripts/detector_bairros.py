@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Detector de Bairros (Aho-Corasick)
+Autômato multi-padrão compilado uma vez a partir da lista de bairros/regiões:
+encontra todos os nomes conhecidos em uma única passada sobre o texto, sem
+diferenciar maiúsculas nem acentos, respeitando limites de palavra, e
+devolve o nome canônico do bairro
+"""
+
+import os
+from collections import deque
+from functools import lru_cache
+
+
+# Acentos do português (e vizinhos) -> letra base; preserva o tamanho do texto
+_ACENTUADAS = 'ÀÁÂÃÄÅàáâãäåÇçÈÉÊËèéêëÌÍÎÏìíîïÑñÒÓÔÕÖòóôõöÙÚÛÜùúûüÝýÿ'
+_BASE = 'AAAAAAaaaaaaCcEEEEeeeeIIIIiiiiNnOOOOOoooooUUUUuuuuYyy'
+TABELA_ACENTOS = str.maketrans(_ACENTUADAS, _BASE)
+
+
+def normalizar(texto):
+    """Minúsculas sem acento e com espaços simples ('Vila  Galvão' -> 'vila galvao')"""
+    return ' '.join((texto or '').translate(TABELA_ACENTOS).lower().split())
+
+
+def _letra(caractere):
+    return caractere.isalnum() or caractere == '_'
+
+
+class DetectorBairros:
+    """Autômato de Aho-Corasick sobre os nomes normalizados.
+
+    nomes: nomes canônicos; aliases: {variação: nome canônico}
+    """
+
+    def __init__(self, nomes, aliases=None):
+        self.canonicos = []
+        # Estado 0 é a raiz; cada estado tem transições, falha e saídas
+        self.transicoes = [{}]
+        self.falha = [0]
+        self.saidas = [[]]
+
+        padroes = {}
+        for nome in nomes:
+            padroes.setdefault(normalizar(nome), nome)
+        for variacao, canonico in (aliases or {}).items():
+            padroes.setdefault(normalizar(variacao), canonico)
+
+        for padrao, canonico in padroes.items():
+            if padrao:
+                self._inserir(padrao, len(self.canonicos))
+                self.canonicos.append((canonico, len(padrao)))
+
+        self._construir_falhas()
+
+    def _inserir(self, padrao, indice):
+        estado = 0
+        for caractere in padrao:
+            proximo = self.transicoes[estado].get(caractere)
+            if proximo is None:
+                proximo = len(self.transicoes)
+                self.transicoes.append({})
+                self.falha.append(0)
+                self.saidas.append([])
+                self.transicoes[estado][caractere] = proximo
+            estado = proximo
+        self.saidas[estado].append(indice)
+
+    def _construir_falhas(self):
+        """Links de falha em largura; saídas herdam as do estado de falha"""
+        fila = deque(self.transicoes[0].values())
+        while fila:
+            estado = fila.popleft()
+            for caractere, proximo in self.transicoes[estado].items():
+                fila.append(proximo)
+                falha = self.falha[estado]
+                while falha and caractere not in self.transicoes[falha]:
+                    falha = self.falha[falha]
+                destino = self.transicoes[falha].get(caractere, 0)
+                self.falha[proximo] = destino if destino != proximo else 0
+                self.saidas[proximo] = self.saidas[proximo] + self.saidas[self.falha[proximo]]
+
+    def encontrar(self, texto):
+        """Todas as ocorrências: lista de (inicio, fim, nome canônico) no texto normalizado"""
+        texto = normalizar(texto)
+        ocorrencias = []
+        estado = 0
+        for posicao, caractere in enumerate(texto):
+            while estado and caractere not in self.transicoes[estado]:
+                estado = self.falha[estado]
+            estado = self.transicoes[estado].get(caractere, 0)
+
+            for indice in self.saidas[estado]:
+                canonico, tamanho = self.canonicos[indice]
+                inicio = posicao - tamanho + 1
+                fim = posicao + 1
+                # Só palavras inteiras ('Centro' não casa com 'Centroeste')
+                if inicio > 0 and _letra(texto[inicio - 1]):
+                    continue
+                if fim < len(texto) and _letra(texto[fim]):
+                    continue
+                ocorrencias.append((inicio, fim, canonico))
+        return ocorrencias
+
+    def identificar(self, texto):
+        """Bairro canônico do texto: ocorrência mais à esquerda e, no empate, a mais longa"""
+        melhor = None
+        for inicio, fim, canonico in self.encontrar(texto):
+            if melhor is None or (inicio, -fim) < (melhor[0], -melhor[1]):
+                melhor = (inicio, fim, canonico)
+        return melhor[2] if melhor else None
+
+    def bairros(self, texto):
+        """Nomes canônicos encontrados, sem repetição, na ordem do texto"""
+        vistos = []
+        for _, _, canonico in sorted(self.encontrar(texto)):
+            if canonico not in vistos:
+                vistos.append(canonico)
+        return vistos
+
+    def contem(self, texto):
+        """True se algum nome conhecido aparece no texto"""
+        return bool(self.encontrar(texto))
+
+
+def carregar_gazetteer(caminho):
+    """Lê um arquivo de bairros: uma linha por bairro, 'Canônico;variação;variação'.
+
+    Linhas vazias e iniciadas por '#' são ignoradas. Retorna (nomes, aliases);
+    arquivo inexistente retorna listas vazias.
+    """
+    nomes, aliases = [], {}
+    if not caminho or not os.path.exists(caminho):
+        return nomes, aliases
+
+    with open(caminho, encoding='utf-8') as arquivo:
+        for linha in arquivo:
+            linha = linha.strip()
+            if not linha or linha.startswith('#'):
+                continue
+            partes = [parte.strip() for parte in linha.split(';') if parte.strip()]
+            nomes.append(partes[0])
+            for variacao in partes[1:]:
+                aliases[variacao] = partes[0]
+    return nomes, aliases
+
+
+@lru_cache(maxsize=64)
+def _detector_cache(nomes, arquivo):
+    extras, aliases = carregar_gazetteer(arquivo)
+    return DetectorBairros(list(nomes) + extras, aliases)
+
+
+def detector_para(nomes, arquivo=None):
+    """Detector compilado para a lista de nomes (+ gazetteer opcional), reaproveitado por lista"""
+    return _detector_cache(tuple(nomes), arquivo)
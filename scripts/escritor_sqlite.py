@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Escrita Concorrente em SQLite
+Modo WAL (leitores nunca esperam o escritor e vice-versa) com busy_timeout, e
+um escritor único: uma thread dona da conexão de escrita recebe as operações
+por fila e as grava em lotes, com commit ao atingir um número de operações ou
+um intervalo de tempo. Cada operação roda em um SAVEPOINT, então uma falha
+descarta só ela, não o lote
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+
+BUSY_TIMEOUT_MS = 10000
+
+
+def configurar_escrita(conn, busy_timeout_ms=BUSY_TIMEOUT_MS):
+    """WAL + synchronous NORMAL (seguro em WAL) + espera por lock em vez de erro"""
+    conn.execute(f'PRAGMA busy_timeout = {int(busy_timeout_ms)}')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+
+def conectar_escrita(caminho, busy_timeout_ms=BUSY_TIMEOUT_MS, **kwargs):
+    """sqlite3.connect já configurado para escrita concorrente"""
+    conn = sqlite3.connect(caminho, timeout=busy_timeout_ms / 1000, **kwargs)
+    return configurar_escrita(conn, busy_timeout_ms)
+
+
+class EscritorSQLite:
+    """Thread única de escrita de um banco.
+
+    executar(funcao) agenda funcao(conn) na thread do escritor e retorna um
+    Future com o resultado; executar_muitos(sql, linhas) é o atalho para
+    executemany. aguardar() grava o lote pendente e espera o commit.
+    """
+
+    _PARAR = object()
+
+    def __init__(self, caminho, max_operacoes=200, intervalo=2.0, busy_timeout_ms=BUSY_TIMEOUT_MS):
+        self.caminho = caminho
+        self.max_operacoes = max_operacoes
+        self.intervalo = intervalo
+        self.busy_timeout_ms = busy_timeout_ms
+        self.logger = logging.getLogger(__name__)
+        self.fila = queue.Queue()
+        self.pronto = Future()
+        self.thread = threading.Thread(target=self._executar, name=f"escritor-{caminho}", daemon=True)
+        self.thread.start()
+        # Erros de abertura aparecem para quem criou o escritor
+        self.pronto.result()
+
+    def executar(self, funcao):
+        futuro = Future()
+        self.fila.put((funcao, futuro))
+        return futuro
+
+    def executar_muitos(self, sql, linhas):
+        linhas = list(linhas)
+        return self.executar(lambda conn: conn.executemany(sql, linhas).rowcount)
+
+    def aguardar(self, timeout=None):
+        """Commit de tudo o que foi enviado até aqui"""
+        futuro = Future()
+        self.fila.put((None, futuro))
+        return futuro.result(timeout)
+
+    def fechar(self):
+        if self.thread.is_alive():
+            self.fila.put(self._PARAR)
+            self.thread.join()
+
+    def _executar(self):
+        try:
+            conn = conectar_escrita(self.caminho, self.busy_timeout_ms, isolation_level=None)
+        except Exception as e:
+            self.pronto.set_exception(e)
+            return
+        self.pronto.set_result(True)
+
+        pendentes = []
+        inicio_lote = None
+        try:
+            while True:
+                espera = None if inicio_lote is None else max(0, inicio_lote + self.intervalo - time.monotonic())
+                try:
+                    item = self.fila.get(timeout=espera)
+                except queue.Empty:
+                    item = None
+
+                if item is self._PARAR:
+                    break
+                if item is not None:
+                    funcao, futuro = item
+                    if funcao is not None:
+                        if inicio_lote is None:
+                            try:
+                                conn.execute('BEGIN IMMEDIATE')
+                            except sqlite3.Error as e:
+                                # Lock não liberado dentro do busy_timeout
+                                futuro.set_exception(e)
+                                continue
+                            inicio_lote = time.monotonic()
+                        pendentes.append((futuro, self._aplicar(conn, funcao)))
+                        if len(pendentes) < self.max_operacoes:
+                            continue
+                    else:
+                        pendentes.append((futuro, (True, None)))
+
+                # Limite de tamanho, de tempo ou pedido de aguardar()
+                inicio_lote = self._commit(conn, pendentes, inicio_lote)
+                pendentes = []
+        finally:
+            self._commit(conn, pendentes, inicio_lote)
+            conn.close()
+
+    def _aplicar(self, conn, funcao):
+        """(ok, resultado) de uma operação isolada em SAVEPOINT"""
+        conn.execute('SAVEPOINT operacao')
+        try:
+            resultado = funcao(conn)
+        except Exception as e:
+            conn.execute('ROLLBACK TO operacao')
+            conn.execute('RELEASE operacao')
+            self.logger.error(f"Escritor {self.caminho}: operação descartada: {e}")
+            return False, e
+        conn.execute('RELEASE operacao')
+        return True, resultado
+
+    def _commit(self, conn, pendentes, inicio_lote):
+        """Fecha o lote e resolve os Futures (retorna o novo inicio_lote: None)"""
+        erro = None
+        if inicio_lote is not None:
+            try:
+                conn.execute('COMMIT')
+            except Exception as e:
+                erro = e
+                self.logger.error(f"Escritor {self.caminho}: falha no commit: {e}")
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+
+        for futuro, (ok, resultado) in pendentes:
+            if erro is not None:
+                futuro.set_exception(erro)
+            elif ok:
+                futuro.set_result(resultado)
+            else:
+                futuro.set_exception(resultado)
+        return None
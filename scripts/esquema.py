@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Esquema de Leitura dos Bancos de Oportunidades
+Ordem das cidades guardada em ranking_cidades e copiada por trigger para a
+coluna cidade_rank, índices para os caminhos de acesso dos dashboards e
+relatórios (ORDER BY cidade_rank, score DESC sem ordenação temporária) e
+migração no próprio banco, idempotente
+"""
+
+import sqlite3
+
+
+# Ordem de exibição das cidades nos dashboards e relatórios
+RANKING_CIDADES = [
+    ('Lucas do Rio Verde', 1),
+    ('Rio Verde', 2),
+    ('Sinop', 3),
+    ('Barreiras', 4),
+    ('Palmas', 5),
+    ('Senador Canedo', 6)
+]
+
+# Cidades fora do ranking vão para o fim
+RANK_PADRAO = 99
+
+# (sufixo, colunas): criado quando a tabela tem todas as colunas citadas
+INDICES_LEITURA = [
+    # Listagem geral: ORDER BY cidade_rank, score DESC
+    ('rank_score', ['cidade_rank', 'score DESC']),
+    # Detalhe/melhores da cidade: WHERE cidade = ? ORDER BY score DESC
+    ('cidade_score', ['cidade', 'score DESC']),
+    # Recentes: WHERE data_encontrado >= ? (e ordenação 'recentes' da paginação)
+    ('data', ['data_encontrado']),
+    # Demais ordenações da paginação por cursor (paginacao.ORDENACOES)
+    ('score', ['score DESC']),
+    ('preco', ['preco']),
+    ('preco_m2', ['preco_m2']),
+    # Agregados por cidade e resumo geral lidos só do índice (cobertura)
+    ('resumo_cidade', ['cidade', 'estado', 'cidade_rank', 'score', 'preco', 'preco_m2', 'portal']),
+    # Contagens por portal/bairro do dashboard de Senador Canedo
+    ('portal', ['portal']),
+    ('bairro', ['bairro'])
+]
+
+
+def colunas_tabela(conn, tabela):
+    """Nomes das colunas da tabela (vazio se ela não existe)"""
+    return {linha[1] for linha in conn.execute(f"PRAGMA table_info({tabela})")}
+
+
+def garantir_ranking(conn):
+    """Tabela ranking_cidades com a ordem atual (só altera as linhas que mudaram)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ranking_cidades (
+            cidade TEXT PRIMARY KEY,
+            posicao INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.executemany('''
+        INSERT INTO ranking_cidades (cidade, posicao) VALUES (?, ?)
+        ON CONFLICT(cidade) DO UPDATE SET posicao = excluded.posicao
+        WHERE posicao != excluded.posicao
+    ''', RANKING_CIDADES)
+
+
+def _expressao_rank(cidade):
+    return f"COALESCE((SELECT posicao FROM ranking_cidades WHERE cidade = {cidade}), {RANK_PADRAO})"
+
+
+def garantir_cidade_rank(conn, tabela):
+    """Coluna cidade_rank preenchida nas linhas existentes e mantida por triggers"""
+    if 'cidade_rank' not in colunas_tabela(conn, tabela):
+        conn.execute(f"ALTER TABLE {tabela} ADD COLUMN cidade_rank INTEGER")
+        conn.execute(f"UPDATE {tabela} SET cidade_rank = {_expressao_rank(tabela + '.cidade')}")
+
+    gatilhos = [
+        f'''CREATE TRIGGER IF NOT EXISTS {tabela}_rank_insert
+        AFTER INSERT ON {tabela}
+        BEGIN
+            UPDATE {tabela} SET cidade_rank = {_expressao_rank('NEW.cidade')}
+            WHERE rowid = NEW.rowid;
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {tabela}_rank_cidade
+        AFTER UPDATE OF cidade ON {tabela}
+        BEGIN
+            UPDATE {tabela} SET cidade_rank = {_expressao_rank('NEW.cidade')}
+            WHERE rowid = NEW.rowid;
+        END''',
+        # Mudança de ordem em ranking_cidades propaga para as linhas da cidade
+        f'''CREATE TRIGGER IF NOT EXISTS {tabela}_rank_ranking_insert
+        AFTER INSERT ON ranking_cidades
+        BEGIN
+            UPDATE {tabela} SET cidade_rank = NEW.posicao WHERE cidade = NEW.cidade;
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {tabela}_rank_ranking_update
+        AFTER UPDATE OF posicao ON ranking_cidades
+        BEGIN
+            UPDATE {tabela} SET cidade_rank = NEW.posicao WHERE cidade = NEW.cidade;
+        END'''
+    ]
+    # execute() um a um: executescript faria COMMIT no meio da migração
+    for gatilho in gatilhos:
+        conn.execute(gatilho)
+
+
+def garantir_indices(conn, tabela):
+    """Índices de leitura cujas colunas existem na tabela; retorna quantos foram criados"""
+    colunas = colunas_tabela(conn, tabela)
+    existentes = {linha[0] for linha in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (tabela,)
+    )}
+    criados = 0
+    for sufixo, definicao in INDICES_LEITURA:
+        nome = f"idx_{tabela}_{sufixo}"
+        if nome not in existentes and all(coluna.split()[0] in colunas for coluna in definicao):
+            conn.execute(f"CREATE INDEX {nome} ON {tabela}({', '.join(definicao)})")
+            criados += 1
+    return criados
+
+
+# Agregados de estatisticas_cidades mantidos por triggers sobre oportunidades_completas:
+# (coluna, coluna da média) com soma e contagem de não nulos, como o AVG do SQLite
+MEDIAS_CIDADE = [('score', 'score_medio'), ('preco', 'preco_medio'), ('preco_m2', 'preco_m2_medio')]
+# (coluna, menor, maior); o extremo removido é buscado de novo no índice (cidade, coluna)
+EXTREMOS_CIDADE = [('preco', 'menor_preco', 'maior_preco')]
+
+
+def _somar_linha(linha, sinal):
+    """Atribuições que somam (sinal '+') ou retiram ('-') a linha NEW/OLD dos agregados"""
+    atribuicoes = [f"total_oportunidades = total_oportunidades {sinal} 1"]
+    for coluna, _ in MEDIAS_CIDADE:
+        atribuicoes.append(f"soma_{coluna} = soma_{coluna} {sinal} COALESCE({linha}.{coluna}, 0)")
+        atribuicoes.append(f"n_{coluna} = n_{coluna} {sinal} ({linha}.{coluna} IS NOT NULL)")
+    return atribuicoes
+
+
+def _sql_inclusao():
+    """Comandos de trigger que incluem NEW nos agregados da cidade.
+
+    Sem INSERT OR IGNORE: dentro do trigger a política de conflito do comando
+    externo (ex.: upsert da consolidação) prevaleceria sobre o IGNORE.
+    """
+    extremos = []
+    for coluna, menor, maior in EXTREMOS_CIDADE:
+        extremos.append(f"{menor} = CASE WHEN NEW.{coluna} IS NOT NULL AND ({menor} IS NULL OR NEW.{coluna} < {menor}) "
+                        f"THEN NEW.{coluna} ELSE {menor} END")
+        extremos.append(f"{maior} = CASE WHEN NEW.{coluna} IS NOT NULL AND ({maior} IS NULL OR NEW.{coluna} > {maior}) "
+                        f"THEN NEW.{coluna} ELSE {maior} END")
+    zeros = ', '.join(['0'] * (1 + 2 * len(MEDIAS_CIDADE)))
+    colunas_zero = ', '.join(['total_oportunidades'] + [f"soma_{c}, n_{c}" for c, _ in MEDIAS_CIDADE])
+    return f'''
+            INSERT INTO estatisticas_cidades (cidade, estado, {colunas_zero})
+            SELECT NEW.cidade, NEW.estado, {zeros}
+            WHERE NOT EXISTS (SELECT 1 FROM estatisticas_cidades WHERE cidade = NEW.cidade);
+            UPDATE estatisticas_cidades SET {', '.join(_somar_linha('NEW', '+') + extremos)}
+            WHERE cidade = NEW.cidade;
+            {_sql_medias('NEW')}'''
+
+
+def _sql_exclusao():
+    """Comandos de trigger que retiram OLD dos agregados da cidade (após a remoção)"""
+    extremos = []
+    for coluna, menor, maior in EXTREMOS_CIDADE:
+        for extremo, funcao in ((menor, 'MIN'), (maior, 'MAX')):
+            extremos.append(
+                f"{extremo} = CASE WHEN OLD.{coluna} IS NOT NULL AND OLD.{coluna} = {extremo} "
+                f"THEN (SELECT {funcao}({coluna}) FROM oportunidades_completas WHERE cidade = OLD.cidade) "
+                f"ELSE {extremo} END"
+            )
+    return f'''
+            UPDATE estatisticas_cidades SET {', '.join(_somar_linha('OLD', '-') + extremos)}
+            WHERE cidade = OLD.cidade;
+            {_sql_medias('OLD')}'''
+
+
+def _sql_medias(linha):
+    medias = ', '.join(f"{media} = soma_{coluna} * 1.0 / NULLIF(n_{coluna}, 0)" for coluna, media in MEDIAS_CIDADE)
+    return (f"UPDATE estatisticas_cidades SET {medias}, ultima_atualizacao = CURRENT_TIMESTAMP "
+            f"WHERE cidade = {linha}.cidade;")
+
+
+def recalcular_estatisticas_cidades(conn):
+    """Reconstrói todos os agregados a partir de oportunidades_completas (só na migração)"""
+    zerar = ['total_oportunidades = 0'] + [f"soma_{c} = 0, n_{c} = 0, {m} = NULL" for c, m in MEDIAS_CIDADE]
+    zerar += [f"{menor} = NULL, {maior} = NULL" for _, menor, maior in EXTREMOS_CIDADE]
+    conn.execute(f"UPDATE estatisticas_cidades SET {', '.join(zerar)}")
+
+    colunas = ['total_oportunidades']
+    expressoes = ['COUNT(*)']
+    for coluna, media in MEDIAS_CIDADE:
+        colunas += [f"soma_{coluna}", f"n_{coluna}", media]
+        expressoes += [f"TOTAL({coluna})", f"COUNT({coluna})", f"AVG({coluna})"]
+    for coluna, menor, maior in EXTREMOS_CIDADE:
+        colunas += [menor, maior]
+        expressoes += [f"MIN({coluna})", f"MAX({coluna})"]
+
+    conn.execute(f'''
+        INSERT INTO estatisticas_cidades (cidade, estado, {', '.join(colunas)})
+        SELECT cidade, MIN(estado), {', '.join(expressoes)}
+        FROM oportunidades_completas WHERE 1
+        GROUP BY cidade
+        ON CONFLICT(cidade) DO UPDATE SET {', '.join(f"{c} = excluded.{c}" for c in colunas)}
+    ''')
+
+
+def garantir_estatisticas_cidades(conn):
+    """estatisticas_cidades mantida por triggers em cada INSERT/UPDATE/DELETE de
+    oportunidades_completas; a primeira migração recalcula tudo uma vez.
+
+    INSERT OR REPLACE não dispara o trigger de DELETE (sem recursive_triggers):
+    a tabela deve ser gravada com upsert, como na consolidação.
+    """
+    colunas = colunas_tabela(conn, 'estatisticas_cidades')
+    if not colunas or not colunas_tabela(conn, 'oportunidades_completas'):
+        return
+
+    novas = [f"{prefixo}_{coluna}" for coluna, _ in MEDIAS_CIDADE for prefixo in ('soma', 'n')]
+    faltando = [coluna for coluna in novas if coluna not in colunas]
+    for coluna in faltando:
+        tipo = 'REAL' if coluna.startswith('soma_') else 'INTEGER'
+        conn.execute(f"ALTER TABLE estatisticas_cidades ADD COLUMN {coluna} {tipo} NOT NULL DEFAULT 0")
+
+    # MIN/MAX de uma cidade em O(log n) quando o extremo é removido
+    for coluna, _, _ in EXTREMOS_CIDADE:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_oportunidades_completas_cidade_{coluna} "
+                     f"ON oportunidades_completas(cidade, {coluna})")
+
+    colunas_agregadas = ', '.join(dict.fromkeys(
+        ['cidade', 'estado'] + [c for c, _ in MEDIAS_CIDADE] + [c for c, _, _ in EXTREMOS_CIDADE]
+    ))
+    gatilhos = [
+        f'''CREATE TRIGGER oportunidades_completas_stats_insert
+        AFTER INSERT ON oportunidades_completas
+        BEGIN{_sql_inclusao()}
+        END''',
+        f'''CREATE TRIGGER oportunidades_completas_stats_delete
+        AFTER DELETE ON oportunidades_completas
+        BEGIN{_sql_exclusao()}
+        END''',
+        f'''CREATE TRIGGER oportunidades_completas_stats_update
+        AFTER UPDATE OF {colunas_agregadas} ON oportunidades_completas
+        BEGIN{_sql_exclusao()}{_sql_inclusao()}
+        END'''
+    ]
+    # Recriados a cada migração: bancos antigos recebem a versão atual do corpo
+    for nome in ('insert', 'delete', 'update'):
+        conn.execute(f"DROP TRIGGER IF EXISTS oportunidades_completas_stats_{nome}")
+    for gatilho in gatilhos:
+        conn.execute(gatilho)
+
+    if faltando:
+        recalcular_estatisticas_cidades(conn)
+
+
+def migrar_esquema_leitura(conn, *tabelas):
+    """Atualiza as tabelas no próprio banco; tabelas inexistentes são ignoradas.
+
+    Tabelas com coluna cidade ganham cidade_rank (+ triggers); todas recebem os
+    índices de leitura aplicáveis; estatisticas_cidades passa a ser mantida por
+    triggers. Pode ser chamada a cada inicialização.
+    """
+    criados = 0
+    with conn:
+        for tabela in tabelas:
+            colunas = colunas_tabela(conn, tabela)
+            if not colunas:
+                continue
+            if 'cidade' in colunas:
+                # ranking_cidades precisa existir antes dos triggers que a citam
+                garantir_ranking(conn)
+                garantir_cidade_rank(conn, tabela)
+            criados += garantir_indices(conn, tabela)
+        if 'estatisticas_cidades' in tabelas:
+            garantir_estatisticas_cidades(conn)
+        # Estatísticas do planejador só quando há índice novo
+        if criados:
+            conn.execute('ANALYZE')
+
+
+def migrar_arquivo(caminho, *tabelas):
+    """migrar_esquema_leitura para um arquivo de banco (dashboards)"""
+    conn = sqlite3.connect(caminho)
+    try:
+        migrar_esquema_leitura(conn, *tabelas)
+    finally:
+        conn.close()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Estatísticas de Mercado em Streaming
+Quantis de preço/m² por cidade e por bairro mantidos com o algoritmo P²
+(Jain & Chlamtac): cinco marcadores por quantil, atualização O(1) por anúncio,
+sem guardar as amostras nem recalcular a tabela. O estado é persistido em
+SQLite para que a mediana local sirva de referência ao score. Cada anúncio
+entra uma vez por preço/m²: revarreduras do mesmo anúncio sem mudança não
+pesam de novo nos quantis
+"""
+
+import json
+import math
+import threading
+from datetime import datetime
+
+from detector_bairros import normalizar
+
+
+QUANTIS = (0.25, 0.5, 0.75)
+
+
+class QuantilP2:
+    """Estimador P² de um quantil p"""
+
+    def __init__(self, p, estado=None):
+        self.p = p
+        self.incrementos = [0, p / 2, p, (1 + p) / 2, 1]
+        if estado:
+            self.n = estado['n']
+            self.alturas = estado['alturas']
+            self.posicoes = estado['posicoes']
+            self.desejadas = estado['desejadas']
+        else:
+            self.n = 0
+            self.alturas = []
+            self.posicoes = [1, 2, 3, 4, 5]
+            self.desejadas = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+
+    def estado(self):
+        return {
+            'n': self.n,
+            'alturas': self.alturas,
+            'posicoes': self.posicoes,
+            'desejadas': self.desejadas
+        }
+
+    def adicionar(self, valor):
+        """Inclui uma observação (O(1))"""
+        alturas = self.alturas
+        if self.n < 5:
+            alturas.append(valor)
+            alturas.sort()
+            self.n += 1
+            return
+        self.n += 1
+
+        # Célula onde a observação cai; estende os extremos se preciso
+        if valor < alturas[0]:
+            alturas[0] = valor
+            celula = 0
+        elif valor >= alturas[4]:
+            alturas[4] = valor
+            celula = 3
+        else:
+            celula = 0
+            while celula < 3 and valor >= alturas[celula + 1]:
+                celula += 1
+
+        posicoes = self.posicoes
+        for i in range(celula + 1, 5):
+            posicoes[i] += 1
+        for i in range(5):
+            self.desejadas[i] += self.incrementos[i]
+
+        # Ajusta os três marcadores internos (parabólico, ou linear se sair da ordem)
+        for i in (1, 2, 3):
+            diferenca = self.desejadas[i] - posicoes[i]
+            if ((diferenca >= 1 and posicoes[i + 1] - posicoes[i] > 1) or
+                    (diferenca <= -1 and posicoes[i - 1] - posicoes[i] < -1)):
+                passo = 1 if diferenca > 0 else -1
+                altura = self._parabolica(i, passo)
+                if not alturas[i - 1] < altura < alturas[i + 1]:
+                    altura = alturas[i] + passo * (alturas[i + passo] - alturas[i]) / (posicoes[i + passo] - posicoes[i])
+                alturas[i] = altura
+                posicoes[i] += passo
+
+    def _parabolica(self, i, passo):
+        q, n = self.alturas, self.posicoes
+        return q[i] + passo / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + passo) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - passo) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def valor(self):
+        """Estimativa atual (exata enquanto houver até 5 observações)"""
+        if self.n == 0:
+            return None
+        if self.n <= 5:
+            posicao = self.p * (self.n - 1)
+            inferior = int(math.floor(posicao))
+            superior = min(inferior + 1, self.n - 1)
+            fracao = posicao - inferior
+            return self.alturas[inferior] + (self.alturas[superior] - self.alturas[inferior]) * fracao
+        return self.alturas[2]
+
+
+class DistribuicaoPrecos:
+    """Quantis de preço/m² de uma cidade ou bairro"""
+
+    def __init__(self, estado=None):
+        estado = estado or {}
+        self.quantis = {p: QuantilP2(p, estado.get(str(p))) for p in QUANTIS}
+
+    @property
+    def amostras(self):
+        return self.quantis[0.5].n
+
+    def adicionar(self, valor):
+        for quantil in self.quantis.values():
+            quantil.adicionar(valor)
+
+    def valor(self, p):
+        return self.quantis[p].valor()
+
+    def estado(self):
+        return {str(p): quantil.estado() for p, quantil in self.quantis.items()}
+
+
+class EstatisticasMercado:
+    """Distribuições por (cidade, bairro) e por cidade (bairro ''), persistidas em SQLite.
+
+    registrar(), referencia_m2() e assinatura() são seguros entre threads;
+    salvar() grava só as chaves alteradas.
+    """
+
+    def __init__(self, conn, minimo_amostras=10, escritor=None):
+        self.conn = conn
+        # Com EscritorSQLite, salvar() só agenda a gravação na thread de escrita
+        self.escritor = escritor
+        self.minimo_amostras = minimo_amostras
+        self.lock = threading.Lock()
+        self.distribuicoes = {}
+        self.alteradas = set()
+        # identidade do anúncio -> último preço/m² incluído nos quantis
+        self.amostras = {}
+        self.amostras_alteradas = {}
+        self.init_database()
+        self.carregar()
+
+    def init_database(self):
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS estatisticas_preco_m2 (
+                cidade TEXT NOT NULL,
+                bairro TEXT NOT NULL,
+                amostras INTEGER,
+                p25 REAL,
+                mediana REAL,
+                p75 REAL,
+                estado TEXT,
+                atualizado_em TIMESTAMP,
+                PRIMARY KEY (cidade, bairro)
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS amostras_preco_m2 (
+                anuncio TEXT PRIMARY KEY,
+                preco_m2 REAL,
+                atualizado_em TIMESTAMP
+            )
+        ''')
+        self.conn.commit()
+
+    def carregar(self):
+        for cidade, bairro, estado in self.conn.execute(
+            'SELECT cidade, bairro, estado FROM estatisticas_preco_m2'
+        ):
+            self.distribuicoes[(cidade, bairro)] = DistribuicaoPrecos(json.loads(estado))
+        self.amostras = dict(self.conn.execute('SELECT anuncio, preco_m2 FROM amostras_preco_m2'))
+
+    @staticmethod
+    def chave(cidade, bairro=''):
+        return cidade, normalizar(bairro)
+
+    def registrar(self, cidade, bairro, preco_m2, anuncio=None):
+        """Inclui um preço/m² observado na distribuição do bairro e da cidade.
+
+        anuncio: identidade do anúncio (modelos.identidade_anuncio); com ela o
+        valor só entra se o anúncio for novo ou o preço/m² tiver mudado.
+        Retorna True se o valor entrou nos quantis.
+        """
+        if not preco_m2 or preco_m2 <= 0:
+            return False
+        with self.lock:
+            if anuncio is not None:
+                valor = round(preco_m2, 2)
+                if self.amostras.get(anuncio) == valor:
+                    return False
+                self.amostras[anuncio] = valor
+                self.amostras_alteradas[anuncio] = valor
+            for chave in {self.chave(cidade), self.chave(cidade, bairro)}:
+                distribuicao = self.distribuicoes.get(chave)
+                if distribuicao is None:
+                    distribuicao = self.distribuicoes[chave] = DistribuicaoPrecos()
+                distribuicao.adicionar(preco_m2)
+                self.alteradas.add(chave)
+            return True
+
+    def _mediana(self, cidade, bairro=''):
+        # Chamado com self.lock adquirido
+        distribuicao = self.distribuicoes.get(self.chave(cidade, bairro))
+        if distribuicao is None or distribuicao.amostras < self.minimo_amostras:
+            return None
+        return distribuicao.valor(0.5)
+
+    def mediana(self, cidade, bairro=''):
+        """Mediana de preço/m² (None sem amostras suficientes)"""
+        with self.lock:
+            return self._mediana(cidade, bairro)
+
+    def referencia_m2(self, cidade, bairro, padrao):
+        """Mediana do bairro, senão da cidade, senão o valor padrão (valor_max_m2)"""
+        with self.lock:
+            return self._mediana(cidade, bairro or '') or self._mediana(cidade) or padrao
+
+    def assinatura(self, cidade):
+        """Resumo das medianas da cidade arredondadas em degraus de ~2%; muda só
+        quando alguma referência se move de fato (usado no hash de contexto do rescore)"""
+        degraus = []
+        with self.lock:
+            for (cidade_chave, bairro), distribuicao in sorted(self.distribuicoes.items()):
+                if cidade_chave != cidade or distribuicao.amostras < self.minimo_amostras:
+                    continue
+                mediana = distribuicao.valor(0.5)
+                degraus.append((bairro, round(math.log(mediana) / math.log(1.02)) if mediana > 0 else 0))
+        return degraus
+
+    def salvar(self):
+        """Persiste as distribuições alteradas desde o último salvar()"""
+        with self.lock:
+            agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            linhas = []
+            for chave in self.alteradas:
+                distribuicao = self.distribuicoes[chave]
+                linhas.append((
+                    chave[0], chave[1], distribuicao.amostras,
+                    distribuicao.valor(0.25), distribuicao.valor(0.5), distribuicao.valor(0.75),
+                    json.dumps(distribuicao.estado()), agora
+                ))
+            self.alteradas.clear()
+            amostras = [(anuncio, valor, agora) for anuncio, valor in self.amostras_alteradas.items()]
+            self.amostras_alteradas.clear()
+
+        sql = '''
+            INSERT OR REPLACE INTO estatisticas_preco_m2
+            (cidade, bairro, amostras, p25, mediana, p75, estado, atualizado_em)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+        sql_amostras = 'INSERT OR REPLACE INTO amostras_preco_m2 (anuncio, preco_m2, atualizado_em) VALUES (?, ?, ?)'
+        if self.escritor is not None:
+            if linhas:
+                self.escritor.executar_muitos(sql, linhas)
+            if amostras:
+                self.escritor.executar_muitos(sql_amostras, amostras)
+        else:
+            with self.conn:
+                self.conn.executemany(sql, linhas)
+                self.conn.executemany(sql_amostras, amostras)
+        return len(linhas)
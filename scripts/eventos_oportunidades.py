@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Eventos de Oportunidades para Server-Sent Events
+Log de mudanças eventos_oportunidades alimentado por triggers (anúncio novo,
+score/preço alterado, anúncio removido), gravado na mesma transação do dado.
+O stream SSE acorda quando PRAGMA data_version muda (houve commit), lê só os
+eventos depois do último enviado e os manda como deltas; o id do evento é o
+Last-Event-ID da reconexão. Backlog grande vira um único 'recarregar'
+"""
+
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+
+TIPO_NOVA = 'nova'
+TIPO_ATUALIZADA = 'atualizada'
+TIPO_REMOVIDA = 'removida'
+
+# Acima disso o cliente recarrega a página em vez de aplicar evento a evento
+MAXIMO_EVENTOS_LOTE = 500
+
+
+def garantir_eventos(conn, tabela, chave='id'):
+    """Cria eventos_oportunidades + triggers de insert/update/delete na tabela"""
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS eventos_oportunidades (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo TEXT NOT NULL,
+                id_anuncio INTEGER NOT NULL,
+                cidade TEXT,
+                criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_eventos_oportunidades_criado_em
+            ON eventos_oportunidades(criado_em)
+        ''')
+
+        gatilhos = [
+            f'''CREATE TRIGGER IF NOT EXISTS {tabela}_evento_insert
+            AFTER INSERT ON {tabela}
+            BEGIN
+                INSERT INTO eventos_oportunidades (tipo, id_anuncio, cidade)
+                VALUES ('{TIPO_NOVA}', NEW.{chave}, NEW.cidade);
+            END''',
+            # Rescore ou mudança de preço: o que muda o card e a ordem
+            f'''CREATE TRIGGER IF NOT EXISTS {tabela}_evento_update
+            AFTER UPDATE OF score, preco, cidade ON {tabela}
+            WHEN OLD.score IS NOT NEW.score OR OLD.preco IS NOT NEW.preco OR OLD.cidade IS NOT NEW.cidade
+            BEGIN
+                INSERT INTO eventos_oportunidades (tipo, id_anuncio, cidade)
+                VALUES ('{TIPO_ATUALIZADA}', NEW.{chave}, NEW.cidade);
+            END''',
+            f'''CREATE TRIGGER IF NOT EXISTS {tabela}_evento_delete
+            AFTER DELETE ON {tabela}
+            BEGIN
+                INSERT INTO eventos_oportunidades (tipo, id_anuncio, cidade)
+                VALUES ('{TIPO_REMOVIDA}', OLD.{chave}, OLD.cidade);
+            END'''
+        ]
+        for gatilho in gatilhos:
+            conn.execute(gatilho)
+
+
+def podar_eventos(conn, dias=3):
+    """Remove eventos antigos (clientes desconectados há mais tempo recarregam)"""
+    limite = (datetime.now(timezone.utc) - timedelta(days=dias)).strftime('%Y-%m-%d %H:%M:%S')
+    with conn:
+        return conn.execute('DELETE FROM eventos_oportunidades WHERE criado_em < ?', (limite,)).rowcount
+
+
+def ultimo_evento(conn):
+    return conn.execute('SELECT COALESCE(MAX(id), 0) FROM eventos_oportunidades').fetchone()[0]
+
+
+def eventos_desde(conn, tabela, colunas, ultimo_id, limite=MAXIMO_EVENTOS_LOTE, chave='id'):
+    """Eventos depois de ultimo_id com a linha atual do anúncio, um por anúncio.
+
+    Retorna (eventos, último id lido, truncado). 'nova' seguida de alteração
+    continua 'nova'; anúncio removido vem sem a linha.
+    """
+    linhas = conn.execute(f'''
+        SELECT e.id AS id_evento, e.tipo, e.id_anuncio, e.cidade AS cidade_evento, a.{chave} AS existente,
+               {', '.join(f"a.{coluna}" for coluna in colunas)}
+        FROM eventos_oportunidades e
+        LEFT JOIN {tabela} a ON a.{chave} = e.id_anuncio
+        WHERE e.id > ?
+        ORDER BY e.id
+        LIMIT ?
+    ''', (ultimo_id, limite + 1)).fetchall()
+
+    truncado = len(linhas) > limite
+    linhas = linhas[:limite]
+    if not linhas:
+        return [], ultimo_id, False
+
+    por_anuncio = {}
+    for linha in linhas:
+        anterior = por_anuncio.pop(linha['id_anuncio'], None)
+        tipo = linha['tipo']
+        if anterior is not None and anterior['tipo'] == TIPO_NOVA and tipo != TIPO_REMOVIDA:
+            tipo = TIPO_NOVA
+        por_anuncio[linha['id_anuncio']] = {
+            'id': linha['id_evento'],
+            'tipo': tipo,
+            'cidade': linha['cidade_evento'],
+            'id_anuncio': linha['id_anuncio'],
+            'oportunidade': None if tipo == TIPO_REMOVIDA or linha['existente'] is None
+            else {coluna: linha[coluna] for coluna in colunas}
+        }
+    return list(por_anuncio.values()), linhas[-1]['id_evento'], truncado
+
+
+def _mensagem(evento, dados, id_evento=None):
+    texto = f"event: {evento}\n"
+    if id_evento is not None:
+        texto += f"id: {id_evento}\n"
+    return texto + f"data: {json.dumps(dados, ensure_ascii=False, default=str)}\n\n"
+
+
+def transmitir_eventos(conexao, tabela, colunas, ultimo_id=None, estatisticas=None,
+                       intervalo=1.0, intervalo_ping=15.0, chave='id'):
+    """Gerador do corpo text/event-stream.
+
+    conexao: context manager de uma conexão de leitura (sqlite3.Row), mantida
+    enquanto o cliente estiver conectado. estatisticas(conn, cidades) -> lista
+    de linhas das cidades afetadas, enviada como evento 'estatisticas'.
+    Sem ultimo_id, começa do fim (só o que acontecer a partir de agora).
+    """
+    with conexao as conn:
+        if ultimo_id is None:
+            ultimo_id = ultimo_evento(conn)
+        yield f"retry: 5000\nid: {ultimo_id}\n\n"
+
+        versao = None
+        ultimo_envio = time.monotonic()
+        while True:
+            # data_version só muda quando outra conexão fez commit
+            atual = conn.execute('PRAGMA data_version').fetchone()[0]
+            if atual != versao:
+                versao = atual
+                while True:
+                    eventos, ultimo_id, truncado = eventos_desde(conn, tabela, colunas, ultimo_id, chave=chave)
+                    if truncado:
+                        # Backlog grande (ex.: consolidação completa): um evento só
+                        ultimo_id = ultimo_evento(conn)
+                        yield _mensagem('recarregar', {}, ultimo_id)
+                        ultimo_envio = time.monotonic()
+                        break
+                    if not eventos:
+                        break
+                    for evento in eventos:
+                        yield _mensagem('oportunidade', evento, evento['id'])
+                    if estatisticas is not None:
+                        cidades = sorted({evento['cidade'] for evento in eventos if evento['cidade']})
+                        yield _mensagem('estatisticas', [dict(linha) for linha in estatisticas(conn, cidades)], ultimo_id)
+                    ultimo_envio = time.monotonic()
+
+            if time.monotonic() - ultimo_envio >= intervalo_ping:
+                # Comentário SSE: mantém proxies e a conexão abertos
+                yield ": ping\n\n"
+                ultimo_envio = time.monotonic()
+            time.sleep(intervalo)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Extração de Atributos em Passada Única
+Padrões pré-compilados que leem o texto de um card uma única vez e devolvem
+preço, área, quartos, suítes, banheiros e vagas, com normalização única
+dos números no formato brasileiro
+"""
+
+import re
+
+
+# Primeiro número de um texto ("R$ 1.234.567,89", "120,5 m²", "3 quartos")
+NUMERO = re.compile(r'\d[\d.,]*')
+
+# Um único padrão com um grupo nomeado por atributo; finditer percorre o
+# texto uma vez e cada atributo fica com a sua primeira ocorrência
+ATRIBUTOS = re.compile(
+    r'R\$\s*(?P<preco>\d[\d.,]*)'
+    r'|(?P<area>\d[\d.,]*)\s*m[²2](?![a-z])'
+    r'|(?P<quartos>\d+)\s*(?:quartos?|dormit[óo]rios?|dorms?\b|bedrooms?)'
+    r'|(?P<quartos_abrev>\d+)q\b'
+    r'|(?P<suites>\d+)\s*su[íi]tes?'
+    r'|(?P<banheiros>\d+)\s*(?:banheiros?|bathrooms?|wc\b)'
+    r'|(?P<vagas>\d+)\s*(?:vagas?|garag(?:em|ens|es?))',
+    re.IGNORECASE
+)
+
+# Padrões usados com BeautifulSoup (find(string=...)) - compilados uma vez
+TEXTO_PRECO = re.compile(r'R\$\s*[\d.,]+')
+TEXTO_AREA = re.compile(r'\d+\s*m[²2]', re.IGNORECASE)
+TEXTO_QUARTOS = re.compile(r'\d+\s*quarto', re.IGNORECASE)
+TEXTO_VAGAS = re.compile(r'\d+\s*vaga', re.IGNORECASE)
+TEXTO_REFERENCIA = re.compile(r'Ref:\s*(\d+)')
+
+ATRIBUTOS_DECIMAIS = ('preco', 'area')
+
+
+def normalizar_numero_br(token):
+    """Converte um número no formato brasileiro em float.
+
+    '1.234.567,89' -> 1234567.89   '120,5' -> 120.5   '1.200' -> 1200.0
+    '120.5' -> 120.5 (ponto só é decimal quando não forma grupos de milhar)
+    """
+    token = token.strip('.,')
+    if not token:
+        return 0
+
+    try:
+        if ',' in token:
+            inteiro, _, decimal = token.rpartition(',')
+            inteiro = inteiro.replace('.', '').replace(',', '')
+            return float(f"{inteiro or '0'}.{decimal}")
+
+        partes = token.split('.')
+        if len(partes) > 1 and all(len(parte) == 3 for parte in partes[1:]):
+            return float(''.join(partes))
+        if len(partes) == 2:
+            return float(token)
+        return float(''.join(partes))
+    except ValueError:
+        return 0
+
+
+def converter_numero_br(texto):
+    """Primeiro número do texto, normalizado (0 quando não há número)"""
+    if not texto:
+        return 0
+    match = NUMERO.search(str(texto))
+    return normalizar_numero_br(match.group()) if match else 0
+
+
+def extrair_atributos(texto):
+    """Lê o texto uma vez e retorna todos os atributos numéricos do card"""
+    atributos = {
+        'preco': 0,
+        'area': 0,
+        'quartos': 0,
+        'suites': 0,
+        'banheiros': 0,
+        'vagas': 0
+    }
+    if not texto:
+        return atributos
+
+    encontrados = set()
+    for match in ATRIBUTOS.finditer(texto):
+        nome = match.lastgroup
+        if nome == 'quartos_abrev':
+            nome = 'quartos'
+        if nome in encontrados:
+            continue
+        encontrados.add(nome)
+
+        valor = match.group(match.lastgroup)
+        if nome in ATRIBUTOS_DECIMAIS:
+            atributos[nome] = normalizar_numero_br(valor)
+        else:
+            atributos[nome] = int(valor)
+
+        if len(encontrados) == len(atributos):
+            break
+
+    return atributos
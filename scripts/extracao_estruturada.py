@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Extração de Dados Estruturados Embutidos
+Caminho rápido para portais que enviam os anúncios como JSON-LD (schema.org)
+ou JSON de hidratação (__NEXT_DATA__, __INITIAL_STATE__) dentro da página.
+Os scripts são localizados por regex sobre os bytes, sem montar a árvore DOM,
+e decodificados com orjson quando disponível
+"""
+
+import json
+import re
+from urllib.parse import urljoin
+
+try:
+    import orjson
+    decodificar_json = orjson.loads
+except ImportError:  # orjson é opcional
+    decodificar_json = json.loads
+
+from extracao_atributos import converter_numero_br
+from modelos import Anuncio
+
+
+# Blocos de dados procurados na página (sobre bytes, sem parsing HTML)
+PADROES_PAYLOAD = [
+    re.compile(rb'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.IGNORECASE | re.DOTALL),
+    re.compile(rb'<script[^>]*id=["\']__NEXT_DATA__["\'][^>]*>(.*?)</script>', re.IGNORECASE | re.DOTALL),
+    re.compile(rb'window\.__INITIAL_STATE__\s*=\s*(\{.*?\})\s*;?\s*</script>', re.DOTALL)
+]
+
+# Tipos schema.org que descrevem um imóvel anunciado
+TIPOS_SCHEMA = {
+    'Product', 'Offer', 'RealEstateListing', 'Residence', 'House', 'Apartment',
+    'SingleFamilyResidence', 'Accommodation'
+}
+
+
+def payloads(conteudo):
+    """Decodifica todos os blocos JSON embutidos na página (bytes ou str)"""
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode('utf-8')
+
+    dados = []
+    for padrao in PADROES_PAYLOAD:
+        for match in padrao.finditer(conteudo):
+            try:
+                dados.append(decodificar_json(match.group(1).strip()))
+            except ValueError:  # orjson.JSONDecodeError também é ValueError
+                continue
+    return dados
+
+
+def _primeiro(valor):
+    """Primeiro elemento quando o valor é lista"""
+    if isinstance(valor, list):
+        return valor[0] if valor else None
+    return valor
+
+
+def _numero(valor):
+    """Converte número, texto ('R$ 350.000') ou {'value': ...} em float"""
+    valor = _primeiro(valor)
+    if isinstance(valor, dict):
+        valor = valor.get('value', valor.get('amount'))
+    if isinstance(valor, bool) or valor is None:
+        return 0
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    return converter_numero_br(valor)
+
+
+def _campo(objetos, *nomes):
+    """Primeiro campo não vazio entre os objetos candidatos"""
+    for objeto in objetos:
+        if not isinstance(objeto, dict):
+            continue
+        for nome in nomes:
+            valor = objeto.get(nome)
+            if valor not in (None, '', [], {}):
+                return valor
+    return None
+
+
+def _endereco(endereco):
+    """Monta (endereco, bairro) a partir de um dict de endereço"""
+    if isinstance(endereco, str):
+        return endereco, ''
+    if not isinstance(endereco, dict):
+        return '', ''
+
+    bairro = endereco.get('neighborhood') or endereco.get('addressNeighborhood') or ''
+    partes = [
+        bairro,
+        endereco.get('streetAddress') or endereco.get('street'),
+        endereco.get('addressLocality') or endereco.get('city'),
+        endereco.get('addressRegion') or endereco.get('stateAcronym') or endereco.get('state')
+    ]
+    return ', '.join(str(parte) for parte in partes if parte), bairro
+
+
+def _de_schema_org(objeto):
+    """Anúncio a partir de um objeto schema.org (Product/Offer/Residence...)"""
+    candidatos = [objeto]
+    for chave in ('itemOffered', 'about', 'mainEntity', 'offers'):
+        candidatos.append(_primeiro(objeto.get(chave)))
+
+    oferta = _primeiro(objeto.get('offers'))
+    preco = _numero(_campo([oferta, objeto], 'price', 'lowPrice'))
+    if isinstance(oferta, dict) and not preco:
+        preco = _numero(_campo([oferta.get('priceSpecification')], 'price'))
+
+    endereco, bairro = _endereco(_campo(candidatos, 'address'))
+    return Anuncio(
+        titulo=str(_campo(candidatos, 'name', 'headline') or ''),
+        preco=preco,
+        area=_numero(_campo(candidatos, 'floorSize', 'area')),
+        endereco=endereco,
+        bairro=bairro,
+        quartos=int(_numero(_campo(candidatos, 'numberOfBedrooms', 'numberOfRooms'))),
+        banheiros=int(_numero(_campo(candidatos, 'numberOfBathroomsTotal', 'numberOfFullBathrooms'))),
+        url=str(_campo(candidatos, 'url') or ''),
+        referencia=str(_campo(candidatos, 'sku', 'productID', 'identifier') or '')
+    )
+
+
+def _de_listing(listing, link=None):
+    """Anúncio no formato dos portais do grupo ZAP/Viva Real (pricingInfos, usableAreas...)"""
+    preco = 0
+    for info in listing.get('pricingInfos') or []:
+        if isinstance(info, dict) and info.get('businessType', 'SALE') == 'SALE':
+            preco = _numero(info.get('price'))
+            break
+
+    endereco, bairro = _endereco(listing.get('address'))
+    href = (link or {}).get('href') if isinstance(link, dict) else None
+    return Anuncio(
+        titulo=str(listing.get('title') or ''),
+        preco=preco,
+        area=_numero(listing.get('usableAreas') or listing.get('totalAreas')),
+        endereco=endereco,
+        bairro=bairro,
+        quartos=int(_numero(listing.get('bedrooms'))),
+        banheiros=int(_numero(listing.get('bathrooms'))),
+        vagas=int(_numero(listing.get('parkingSpaces'))),
+        url=str(href or listing.get('url') or ''),
+        referencia=str(listing.get('id') or listing.get('externalId') or '')
+    )
+
+
+def _de_posting(posting):
+    """Anúncio no formato do Imovelweb (priceOperationTypes, mainFeatures)"""
+    preco = 0
+    for operacao in posting.get('priceOperationTypes') or []:
+        precos = operacao.get('prices') if isinstance(operacao, dict) else None
+        if precos:
+            preco = _numero(precos)
+            break
+
+    caracteristicas = {}
+    for item in (posting.get('mainFeatures') or {}).values():
+        if isinstance(item, dict) and item.get('label'):
+            caracteristicas[item['label'].lower()] = item.get('value')
+
+    def caracteristica(*rotulos):
+        for rotulo, valor in caracteristicas.items():
+            if any(parte in rotulo for parte in rotulos):
+                return _numero(valor)
+        return 0
+
+    localizacao = posting.get('postingLocation') or {}
+    bairro = ((localizacao.get('location') or {}).get('name') or '') if isinstance(localizacao, dict) else ''
+    rua = ((localizacao.get('address') or {}).get('name') or '') if isinstance(localizacao, dict) else ''
+    return Anuncio(
+        titulo=str(posting.get('title') or ''),
+        preco=preco,
+        area=caracteristica('área útil', 'área total', 'área'),
+        endereco=', '.join(parte for parte in (bairro, rua) if parte),
+        bairro=bairro,
+        quartos=int(caracteristica('quarto', 'dormit')),
+        banheiros=int(caracteristica('banheiro')),
+        vagas=int(caracteristica('vaga', 'garage')),
+        url=str(posting.get('url') or ''),
+        referencia=str(posting.get('postingId') or '')
+    )
+
+
+def _converter(objeto):
+    """Anúncio se o dict tiver um dos formatos conhecidos, senão None"""
+    tipo = objeto.get('@type')
+    tipos = set(tipo) if isinstance(tipo, list) else {tipo}
+    if tipos & TIPOS_SCHEMA:
+        return _de_schema_org(objeto)
+
+    if isinstance(objeto.get('listing'), dict) and 'pricingInfos' in objeto['listing']:
+        return _de_listing(objeto['listing'], objeto.get('link'))
+    if 'pricingInfos' in objeto:
+        return _de_listing(objeto)
+    if 'priceOperationTypes' in objeto:
+        return _de_posting(objeto)
+    return None
+
+
+def anuncios_do_payload(dados):
+    """Percorre o JSON (iterativo) e converte cada objeto de anúncio encontrado"""
+    anuncios = []
+    pilha = [dados]
+    while pilha:
+        atual = pilha.pop()
+        if isinstance(atual, list):
+            pilha.extend(reversed(atual))
+        elif isinstance(atual, dict):
+            anuncio = _converter(atual)
+            if anuncio is not None:
+                # Objeto de anúncio já convertido: não desce nas suas ofertas
+                anuncios.append(anuncio)
+            else:
+                pilha.extend(reversed(list(atual.values())))
+    return anuncios
+
+
+def extrair_anuncios(conteudo, url_base=''):
+    """Anúncios dos dados estruturados da página; [] quando não há payload útil"""
+    anuncios = []
+    vistos = set()
+    for dados in payloads(conteudo):
+        for anuncio in anuncios_do_payload(dados):
+            if not anuncio.titulo and not anuncio.preco:
+                continue
+            if anuncio.url:
+                anuncio.url = urljoin(url_base, anuncio.url)
+            if not anuncio.titulo:
+                anuncio.titulo = 'Imóvel sem título'
+
+            chave = (anuncio.url, anuncio.titulo, anuncio.preco)
+            if chave in vistos:
+                continue
+            vistos.add(chave)
+            anuncios.append(anuncio)
+    return anuncios
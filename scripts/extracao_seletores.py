@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motor de Extração por Seletores
+Compila uma vez os seletores CSS de cada portal (config 'seletores') e os
+executa sobre uma árvore lxml, devolvendo anúncios tipados
+"""
+
+import re
+from urllib.parse import urljoin
+
+import lxml.html
+from lxml.cssselect import CSSSelector
+from lxml.etree import ParserError
+
+from extracao_atributos import converter_numero_br
+from modelos import Anuncio
+
+
+CAMPOS_TEXTO = ('titulo', 'preco', 'area', 'endereco')
+ESPACOS = re.compile(r'\s+')
+
+
+def texto_elemento(elemento):
+    """Texto do elemento com espaços normalizados"""
+    return ESPACOS.sub(' ', elemento.text_content()).strip()
+
+
+class ExtratorSeletores:
+    """Extrator de um portal, construído a partir do dict 'seletores'"""
+
+    def __init__(self, seletores, url_base=''):
+        self.url_base = url_base
+        self.seletor_cards = CSSSelector(seletores['cards'])
+        self.seletores_campos = {
+            campo: CSSSelector(seletores[campo])
+            for campo in CAMPOS_TEXTO if seletores.get(campo)
+        }
+        self.seletor_link = CSSSelector('a[href]')
+
+    def cards(self, arvore):
+        """Cards da página, sem repetir cards aninhados dentro de outros cards"""
+        encontrados = self.seletor_cards(arvore)
+        conjunto = set(encontrados)
+
+        cards = []
+        for card in encontrados:
+            # Só o card mais externo é processado
+            if not any(ancestral in conjunto for ancestral in card.iterancestors()):
+                cards.append(card)
+        return cards
+
+    def campo(self, card, nome):
+        """Texto do primeiro elemento do card que casa com o seletor do campo"""
+        seletor = self.seletores_campos.get(nome)
+        if seletor is None:
+            return ''
+        for elemento in seletor(card):
+            texto = texto_elemento(elemento)
+            if texto:
+                return texto
+        return ''
+
+    def extrair_card(self, card, url_base=''):
+        """Converte um card em Anuncio"""
+        links = self.seletor_link(card)
+        return Anuncio(
+            titulo=self.campo(card, 'titulo') or 'Imóvel sem título',
+            preco=converter_numero_br(self.campo(card, 'preco')),
+            area=converter_numero_br(self.campo(card, 'area')),
+            endereco=self.campo(card, 'endereco') or 'Endereço não informado',
+            url=urljoin(url_base, links[0].get('href')) if links else ''
+        )
+
+    def extrair(self, conteudo, url_base=None, limite=None):
+        """Extrai os anúncios do HTML (bytes ou str)"""
+        try:
+            arvore = lxml.html.document_fromstring(conteudo)
+        except (ParserError, ValueError):
+            return []
+
+        url_base = url_base or self.url_base
+        cards = self.cards(arvore)
+        if limite is not None:
+            cards = cards[:limite]
+        return [self.extrair_card(card, url_base) for card in cards]
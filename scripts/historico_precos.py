@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Histórico de Preços dos Anúncios
+Tabela observacoes_anuncios alimentada por triggers: uma linha quando o
+anúncio aparece, quando preço ou área mudam de fato e quando ele sai da
+tabela (situação 'removido'). Recrawls sem mudança não gravam nada, então o
+histórico cresce com as mudanças, não com as varreduras
+"""
+
+from datetime import datetime, timedelta, timezone
+
+
+SITUACAO_ATIVO = 'ativo'
+SITUACAO_REMOVIDO = 'removido'
+
+
+def garantir_historico_precos(conn, tabela, chave='id'):
+    """Cria observacoes_anuncios + triggers sobre a tabela de anúncios.
+
+    Na primeira vez, cada anúncio existente ganha uma observação inicial (na
+    data_encontrado), base para comparar as mudanças seguintes.
+    """
+    with conn:
+        existia = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'observacoes_anuncios'"
+        ).fetchone()
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS observacoes_anuncios (
+                id INTEGER PRIMARY KEY,
+                id_anuncio INTEGER NOT NULL,
+                observado_em TIMESTAMP NOT NULL,
+                preco REAL,
+                area REAL,
+                situacao TEXT NOT NULL
+            )
+        ''')
+        # Histórico de um anúncio e "o que mudou desde T"
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_observacoes_anuncio_data
+            ON observacoes_anuncios(id_anuncio, observado_em)
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_observacoes_data
+            ON observacoes_anuncios(observado_em)
+        ''')
+
+        if not existia:
+            conn.execute(f'''
+                INSERT INTO observacoes_anuncios (id_anuncio, observado_em, preco, area, situacao)
+                SELECT {chave}, COALESCE(data_encontrado, CURRENT_TIMESTAMP), preco, area, '{SITUACAO_ATIVO}'
+                FROM {tabela}
+            ''')
+
+        gatilhos = [
+            f'''CREATE TRIGGER IF NOT EXISTS {tabela}_observacao_insert
+            AFTER INSERT ON {tabela}
+            BEGIN
+                INSERT INTO observacoes_anuncios (id_anuncio, observado_em, preco, area, situacao)
+                VALUES (NEW.{chave}, CURRENT_TIMESTAMP, NEW.preco, NEW.area, '{SITUACAO_ATIVO}');
+            END''',
+            # Só quando preço ou área mudam de fato
+            f'''CREATE TRIGGER IF NOT EXISTS {tabela}_observacao_update
+            AFTER UPDATE OF preco, area ON {tabela}
+            WHEN OLD.preco IS NOT NEW.preco OR OLD.area IS NOT NEW.area
+            BEGIN
+                INSERT INTO observacoes_anuncios (id_anuncio, observado_em, preco, area, situacao)
+                VALUES (NEW.{chave}, CURRENT_TIMESTAMP, NEW.preco, NEW.area, '{SITUACAO_ATIVO}');
+            END''',
+            f'''CREATE TRIGGER IF NOT EXISTS {tabela}_observacao_delete
+            AFTER DELETE ON {tabela}
+            BEGIN
+                INSERT INTO observacoes_anuncios (id_anuncio, observado_em, preco, area, situacao)
+                VALUES (OLD.{chave}, CURRENT_TIMESTAMP, OLD.preco, OLD.area, '{SITUACAO_REMOVIDO}');
+            END'''
+        ]
+        for gatilho in gatilhos:
+            conn.execute(gatilho)
+
+
+def alteracoes_preco(conn, tabela, desde=None, cidade=None, apenas_quedas=False, limite=100, chave='id'):
+    """Mudanças de preço observadas desde 'desde' (padrão: últimos 7 dias).
+
+    LAG sobre o histórico só dos anúncios com observação depois de 'desde'
+    (índice em observado_em), comparando cada observação com a anterior.
+    Retorna linhas (sqlite3.Row ou tuplas) da mais recente para a mais antiga.
+    """
+    if desde is None:
+        desde = (datetime.now(timezone.utc) - timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
+
+    filtros = ['o.observado_em >= :desde', 'o.preco_anterior IS NOT NULL', 'o.preco IS NOT o.preco_anterior',
+               f"o.situacao = '{SITUACAO_ATIVO}'"]
+    if apenas_quedas:
+        filtros.append('o.preco < o.preco_anterior')
+    if cidade:
+        filtros.append('a.cidade = :cidade')
+
+    return conn.execute(f'''
+        WITH alterados AS (
+            SELECT DISTINCT id_anuncio FROM observacoes_anuncios WHERE observado_em >= :desde
+        ),
+        sequencia AS (
+            SELECT h.id_anuncio, h.observado_em, h.preco, h.situacao,
+                   LAG(h.preco) OVER (PARTITION BY h.id_anuncio ORDER BY h.observado_em, h.id) AS preco_anterior
+            FROM observacoes_anuncios h
+            JOIN alterados USING (id_anuncio)
+        )
+        SELECT a.{chave} AS id, a.cidade, a.titulo, a.bairro, a.portal, a.url,
+               o.preco_anterior, o.preco,
+               ROUND((o.preco - o.preco_anterior) * 100.0 / NULLIF(o.preco_anterior, 0), 2) AS variacao_pct,
+               o.observado_em
+        FROM sequencia o
+        JOIN {tabela} a ON a.{chave} = o.id_anuncio
+        WHERE {' AND '.join(filtros)}
+        ORDER BY o.observado_em DESC
+        LIMIT :limite
+    ''', {'desde': desde, 'cidade': cidade, 'limite': limite}).fetchall()
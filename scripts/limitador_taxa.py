@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Limitador de Taxa por Host
+Um token bucket por host substitui os time.sleep() espalhados pelos robôs:
+requisições a portais diferentes não esperam umas pelas outras
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+
+def normalizar_host(url_ou_host):
+    """Aceita uma URL completa ou só o host e devolve o host em minúsculas"""
+    if '://' in url_ou_host:
+        return (urlparse(url_ou_host).hostname or '').lower()
+    return url_ou_host.lower()
+
+
+def interpretar_retry_after(valor):
+    """Converte o cabeçalho Retry-After (segundos ou data HTTP) em segundos"""
+    if not valor:
+        return 0.0
+
+    valor = valor.strip()
+    if valor.isdigit():
+        return float(valor)
+
+    try:
+        data = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return 0.0
+
+    if data.tzinfo is None:
+        data = data.replace(tzinfo=timezone.utc)
+    return max(0.0, (data - datetime.now(timezone.utc)).total_seconds())
+
+
+class BaldeTokens:
+    """Token bucket com reabastecimento contínuo.
+
+    reservar() consome um token e devolve quanto tempo o chamador precisa
+    esperar antes de usá-lo; a espera acontece fora do lock, então várias
+    threads podem reservar a mesma fila sem se bloquear.
+    """
+
+    def __init__(self, taxa, rajada):
+        self.taxa = float(taxa)          # tokens por segundo
+        self.rajada = float(rajada)      # capacidade máxima do balde
+        self.tokens = float(rajada)
+        self.atualizado = time.monotonic()
+        self.bloqueado_ate = 0.0
+
+    def reservar(self, agora):
+        """Consome um token e retorna a espera necessária em segundos"""
+        self.tokens = min(self.rajada, self.tokens + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+        self.tokens -= 1
+
+        espera_tokens = -self.tokens / self.taxa if self.tokens < 0 else 0.0
+        espera_bloqueio = max(0.0, self.bloqueado_ate - agora)
+        return max(espera_tokens, espera_bloqueio)
+
+    def bloquear(self, agora, segundos):
+        """Suspende o host por alguns segundos (Retry-After)"""
+        self.bloqueado_ate = max(self.bloqueado_ate, agora + segundos)
+        # Quem estava na fila continua ordenado depois do bloqueio
+        self.tokens = min(self.tokens, 0.0)
+
+
+class LimitadorPorHost:
+    """Mantém um BaldeTokens por host.
+
+    config_hosts permite ajustar cada portal:
+        {'www.62imoveis.com.br': {'taxa': 0.5, 'rajada': 2}}
+    """
+
+    STATUS_RETRY_AFTER = (429, 503)
+
+    def __init__(self, taxa_padrao=0.3, rajada_padrao=1, config_hosts=None, espera_maxima=300):
+        self.taxa_padrao = taxa_padrao
+        self.rajada_padrao = rajada_padrao
+        self.config_hosts = {
+            normalizar_host(host): config for host, config in (config_hosts or {}).items()
+        }
+        self.espera_maxima = espera_maxima
+        self.baldes = {}
+        self.lock = threading.Lock()
+
+    def configurar_host(self, url_ou_host, taxa=None, rajada=None):
+        """Define taxa e rajada de um host específico"""
+        host = normalizar_host(url_ou_host)
+        config = self.config_hosts.setdefault(host, {})
+        if taxa is not None:
+            config['taxa'] = taxa
+        if rajada is not None:
+            config['rajada'] = rajada
+        with self.lock:
+            self.baldes.pop(host, None)
+
+    def _balde(self, host):
+        balde = self.baldes.get(host)
+        if balde is None:
+            config = self.config_hosts.get(host, {})
+            balde = BaldeTokens(
+                config.get('taxa', self.taxa_padrao),
+                config.get('rajada', self.rajada_padrao)
+            )
+            self.baldes[host] = balde
+        return balde
+
+    def reservar(self, url_ou_host):
+        """Reserva uma vaga para o host e retorna a espera em segundos"""
+        host = normalizar_host(url_ou_host)
+        with self.lock:
+            return self._balde(host).reservar(time.monotonic())
+
+    def aguardar(self, url_ou_host):
+        """Bloqueia a thread atual até o host liberar a próxima requisição"""
+        espera = self.reservar(url_ou_host)
+        if espera > 0:
+            time.sleep(espera)
+        return espera
+
+    async def aguardar_async(self, url_ou_host):
+        """Versão assíncrona de aguardar() para o motor de varredura"""
+        espera = self.reservar(url_ou_host)
+        if espera > 0:
+            await asyncio.sleep(espera)
+        return espera
+
+    def bloquear(self, url_ou_host, segundos):
+        """Suspende novas requisições ao host pelo tempo indicado"""
+        host = normalizar_host(url_ou_host)
+        segundos = min(segundos, self.espera_maxima)
+        with self.lock:
+            self._balde(host).bloquear(time.monotonic(), segundos)
+
+    def registrar_resposta(self, url, response):
+        """Respeita Retry-After de respostas 429/503; retorna os segundos de bloqueio"""
+        if response is None or response.status_code not in self.STATUS_RETRY_AFTER:
+            return 0.0
+
+        segundos = interpretar_retry_after(response.headers.get('Retry-After'))
+        if segundos > 0:
+            self.bloquear(url, segundos)
+        return segundos
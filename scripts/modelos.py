@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Modelos de Dados Compartilhados
+Registro tipado de anúncio devolvido pelos extratores
+"""
+
+from collections import Counter
+from dataclasses import dataclass, asdict
+
+
+def identidade_anuncio(portal, url='', referencia='', titulo='', cidade='', bairro='', endereco='', area=0):
+    """Identidade do anúncio que não muda com o preço: id no portal, senão a
+    URL do anúncio, senão cidade + bairro + endereço + área + título (um
+    título genérico sozinho juntaria anúncios diferentes)"""
+    if referencia:
+        return f"{portal}|ref:{referencia}"
+    if url:
+        return f"{portal}|url:{url}"
+    return f"{portal}|{cidade}|{bairro}|{endereco}|{area or 0:g}|{titulo}"
+
+
+def urls_compartilhadas(urls):
+    """URLs que aparecem em mais de um card da página: link da listagem ou de
+    outro anúncio, não identificam o anúncio"""
+    contagem = Counter(url for url in urls if url)
+    return {url for url, vezes in contagem.items() if vezes > 1}
+
+
+@dataclass
+class Anuncio:
+    """Anúncio extraído de um portal, antes de pontuação e filtros"""
+    titulo: str
+    preco: float = 0.0
+    area: float = 0.0
+    endereco: str = ''
+    bairro: str = ''
+    quartos: int = 0
+    banheiros: int = 0
+    vagas: int = 0
+    url: str = ''
+    referencia: str = ''
+
+    def identidade(self, portal, cidade='', bairro=None, url=None):
+        """identidade_anuncio() deste anúncio; bairro e url substituem os
+        extraídos (bairro resolvido pelo robô, URL compartilhada descartada)"""
+        return identidade_anuncio(portal, self.url if url is None else url, self.referencia, self.titulo,
+                                  cidade, self.bairro if bairro is None else bairro, self.endereco, self.area)
+
+    @property
+    def preco_m2(self):
+        """Preço por m² (0 quando a área é desconhecida)"""
+        return self.preco / self.area if self.area > 0 else 0
+
+    def para_dict(self):
+        """Converte para o formato de dict usado pelos robôs"""
+        dados = asdict(self)
+        dados['preco_m2'] = self.preco_m2
+        return dados
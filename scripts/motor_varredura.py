@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motor de Varredura Assíncrono
+Executa todas as combinações cidade × portal em paralelo, com limite de
+concorrência separado para cada host
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+
+def host_da_url(url):
+    """Retorna o host (sem porta) de uma URL"""
+    return (urlparse(url).hostname or '').lower()
+
+
+class MotorVarreduraAsync:
+    """Agenda tarefas de varredura em um loop asyncio.
+
+    Cada tarefa é um dict com as chaves:
+        'host'      - host usado para aplicar o limite de concorrência
+        'funcao'    - função bloqueante executada em uma thread (requests/BeautifulSoup)
+        'args'      - argumentos posicionais da função
+        'contexto'  - qualquer valor devolvido junto com o resultado
+
+    Tarefas de hosts diferentes rodam ao mesmo tempo; tarefas do mesmo host
+    respeitam o limite configurado e, se houver um limitador, o token bucket
+    do host. O tempo total fica limitado pelo host mais lento, e não pela
+    soma de todas as esperas.
+    """
+
+    def __init__(self, limites_por_host=None, limite_padrao=2, limitador=None, logger=None):
+        self.limites_por_host = limites_por_host or {}
+        self.limite_padrao = limite_padrao
+        self.limitador = limitador
+        self.logger = logger or logging.getLogger(__name__)
+
+    def limite_host(self, host):
+        """Retorna o número máximo de requisições simultâneas para o host"""
+        return max(1, self.limites_por_host.get(host, self.limite_padrao))
+
+    async def _executar_tarefa(self, tarefa, semaforos, executor):
+        """Executa uma tarefa respeitando o semáforo do seu host"""
+        loop = asyncio.get_running_loop()
+
+        async with semaforos[tarefa['host']]:
+            # Espaçamento entre requisições ao mesmo host
+            if self.limitador is not None:
+                await self.limitador.aguardar_async(tarefa['host'])
+
+            inicio = time.time()
+            try:
+                resultado = await loop.run_in_executor(
+                    executor, lambda: tarefa['funcao'](*tarefa.get('args', ()))
+                )
+                erro = None
+            except Exception as e:
+                resultado, erro = None, e
+
+            return tarefa, resultado, erro, time.time() - inicio
+
+    async def executar(self, tarefas, ao_concluir):
+        """Executa todas as tarefas e chama ao_concluir(tarefa, resultado, erro, tempo)
+        no loop principal à medida que cada uma termina"""
+        if not tarefas:
+            return
+
+        semaforos = {}
+        for tarefa in tarefas:
+            host = tarefa['host']
+            if host not in semaforos:
+                semaforos[host] = asyncio.Semaphore(self.limite_host(host))
+
+        max_threads = sum(self.limite_host(host) for host in semaforos)
+        self.logger.info(
+            f"Motor assíncrono: {len(tarefas)} tarefas em {len(semaforos)} hosts "
+            f"({max_threads} conexões simultâneas no máximo)"
+        )
+
+        with ThreadPoolExecutor(max_workers=max_threads) as executor:
+            pendentes = [
+                asyncio.ensure_future(self._executar_tarefa(tarefa, semaforos, executor))
+                for tarefa in tarefas
+            ]
+
+            for futuro in asyncio.as_completed(pendentes):
+                tarefa, resultado, erro, tempo = await futuro
+                ao_concluir(tarefa, resultado, erro, tempo)
+
+    def executar_sync(self, tarefas, ao_concluir):
+        """Ponto de entrada síncrono para os robôs"""
+        asyncio.run(self.executar(tarefas, ao_concluir))
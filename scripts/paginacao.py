@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Paginação por Cursor das Listagens de Oportunidades
+Keyset pagination: a página seguinte começa depois dos valores de ordenação
+da última linha (cursor opaco), não em um OFFSET, então cada página custa o
+mesmo com 100 ou 10 milhões de linhas. Filtros e ordenações são listas
+fechadas, compostas em SQL parametrizado que usa os índices de esquema.py
+"""
+
+import base64
+import json
+
+
+# Ordenações: colunas (com desempate final por id) na mesma direção dos índices
+# de leitura, para o SQLite percorrer o índice sem ordenação temporária
+ORDENACOES = {
+    'ranking': (('cidade_rank', 'ASC'), ('score', 'DESC'), ('id', 'ASC')),
+    'score': (('score', 'DESC'), ('id', 'ASC')),
+    'preco': (('preco', 'ASC'), ('id', 'ASC')),
+    'preco_desc': (('preco', 'DESC'), ('id', 'DESC')),
+    'preco_m2': (('preco_m2', 'ASC'), ('id', 'ASC')),
+    'recentes': (('data_encontrado', 'DESC'), ('id', 'DESC'))
+}
+
+ORDENACAO_PADRAO = 'ranking'
+
+# Parâmetro da requisição -> (coluna, operador, conversão)
+FILTROS = {
+    'cidade': ('cidade', '=', str),
+    'estado': ('estado', '=', str),
+    'portal': ('portal', '=', str),
+    'potencial_categoria': ('potencial_categoria', '=', str),
+    'preco_min': ('preco', '>=', float),
+    'preco_max': ('preco', '<=', float),
+    'area_min': ('area', '>=', float),
+    'area_max': ('area', '<=', float),
+    'score_min': ('score', '>=', float),
+    'score_max': ('score', '<=', float)
+}
+
+# Colunas sempre preenchidas; nas demais, linhas com NULL vêm por último
+_NAO_NULAS = {'id', 'cidade_rank'}
+
+
+def filtros_de(parametros):
+    """Filtros válidos de um mapeamento (ex.: request.args); ValueError se inválido"""
+    filtros = {}
+    for nome, (_, _, conversao) in FILTROS.items():
+        valor = parametros.get(nome)
+        if valor not in (None, ''):
+            try:
+                filtros[nome] = conversao(valor)
+            except ValueError:
+                raise ValueError(f"filtro inválido: {nome}={valor!r}")
+    return filtros
+
+
+def codificar_cursor(ordem, valores):
+    texto = json.dumps([ordem, list(valores)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor, ordem):
+    """Valores de ordenação do cursor; ValueError se ele for inválido ou de outra ordenação"""
+    try:
+        texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        ordem_cursor, valores = json.loads(texto)
+    except (ValueError, TypeError):
+        raise ValueError('cursor inválido')
+    if ordem_cursor != ordem or len(valores) != len(ORDENACOES[ordem]):
+        raise ValueError('cursor de outra ordenação')
+    return valores
+
+
+def _depois_do_cursor(ordenacao, valores, parametros, inicio=0):
+    """(c1 op c1_cursor) OR (c1 = c1_cursor AND (c2 op ...)) a partir da coluna
+    'inicio'. NULL vem por último: colunas anuláveis (menos a primeira, tratada
+    em pagina()) ganham OR c IS NULL, e um valor NULL no cursor só deixa
+    c IS NULL AND (desempate seguinte)"""
+    condicao = None
+    for indice in reversed(range(inicio, len(ordenacao))):
+        coluna, direcao = ordenacao[indice]
+        if valores[indice] is None:
+            condicao = f"({coluna} IS NULL AND {condicao or '0'})"
+            continue
+        nome = f"cursor_{indice}"
+        parametros[nome] = valores[indice]
+        operador = '>' if direcao == 'ASC' else '<'
+        passos = [f"{coluna} {operador} :{nome}"]
+        if indice > 0 and coluna not in _NAO_NULAS:
+            passos.append(f"{coluna} IS NULL")
+        if condicao is not None:
+            passos.append(f"({coluna} = :{nome} AND {condicao})")
+        condicao = f"({' OR '.join(passos)})"
+    return condicao
+
+
+def _fases(ordenacao, valores, parametros):
+    """Condições de cada consulta da página seguinte, na ordem.
+
+    Com a primeira coluna preenchida no cursor, o limite inclusivo dela vem
+    antes para o SQLite usar a faixa do índice (um OR c1 IS NULL ali faria
+    ele ordenar em memória); as linhas com c1 NULL, que vêm por último, são
+    uma segunda consulta, feita só se a primeira não completar a página.
+    """
+    coluna, direcao = ordenacao[0]
+    fases = []
+    if valores[0] is not None:
+        fases.append([
+            f"{coluna} {'>=' if direcao == 'ASC' else '<='} :cursor_0",
+            _depois_do_cursor(ordenacao, valores, parametros)
+        ])
+    if coluna not in _NAO_NULAS:
+        nulas = [f"{coluna} IS NULL"]
+        if valores[0] is None and len(ordenacao) > 1:
+            nulas.append(_depois_do_cursor(ordenacao, valores, parametros, inicio=1))
+        fases.append(nulas)
+    return fases
+
+
+def pagina(conn, tabela, colunas, filtros=None, ordem=ORDENACAO_PADRAO, cursor=None, limite=50):
+    """Uma página da listagem: (linhas, próximo cursor ou None).
+
+    colunas: colunas retornadas (as de ordenação entram na consulta de
+    qualquer forma). Filtros de colunas que a tabela não tem são ignorados.
+    conn precisa de row_factory = sqlite3.Row.
+    """
+    filtros = dict(filtros or {})
+    if ordem not in ORDENACOES:
+        raise ValueError(f"ordenação inválida: {ordem}")
+    # Uma cidade só tem um cidade_rank: o índice (cidade, score) atende o ranking
+    if ordem == 'ranking' and 'cidade' in filtros:
+        ordem = 'score'
+    ordenacao = ORDENACOES[ordem]
+
+    existentes = {linha[1] for linha in conn.execute(f"PRAGMA table_info({tabela})")}
+    condicoes, parametros = [], {'limite': limite + 1}
+    for nome, valor in filtros.items():
+        coluna, operador, _ = FILTROS[nome]
+        if coluna in existentes:
+            condicoes.append(f"{coluna} {operador} :{nome}")
+            parametros[nome] = valor
+    fases = _fases(ordenacao, decodificar_cursor(cursor, ordem), parametros) if cursor else [[]]
+
+    selecionadas = list(dict.fromkeys(list(colunas) + [coluna for coluna, _ in ordenacao]))
+    ordenar = ', '.join(
+        f"{coluna} {direcao}" + ('' if coluna in _NAO_NULAS else ' NULLS LAST') for coluna, direcao in ordenacao
+    )
+    linhas = []
+    for fase in fases:
+        where = condicoes + fase
+        linhas += conn.execute(f'''
+            SELECT {', '.join(selecionadas)}
+            FROM {tabela}
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY {ordenar}
+            LIMIT :limite
+        ''', parametros).fetchall()
+        if len(linhas) > limite:
+            break
+
+    proximo = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo = codificar_cursor(ordem, [linhas[-1][coluna] for coluna, _ in ordenacao])
+    return linhas, proximo
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motor de Pontuação Declarativo
+Regras de score de todos os robôs descritas como dados: cada degrau é uma
+lista ordenada de (pontos, condições), vale a primeira que casar. A mesma
+regra é avaliada anúncio a anúncio (pontuar) ou em lote com NumPy
+(pontuar_lote), o que permite repontuar o histórico inteiro em segundos
+"""
+
+import operator
+
+import numpy as np
+
+from detector_bairros import detector_para
+
+
+OPERADORES = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq
+}
+
+
+def _faixa(feature, faixas, positivo=False):
+    """Degrau em escada: [(limite, pontos), ...] com feature <= limite"""
+    base = [(feature, '>', 0)] if positivo else []
+    return [(pontos, base + [(feature, '<=', limite)]) for limite, pontos in faixas]
+
+
+def _minimos(feature, faixas):
+    """Degrau em escada decrescente: [(minimo, pontos), ...] com feature >= minimo"""
+    return [(pontos, [(feature, '>=', minimo)]) for minimo, pontos in faixas]
+
+
+# Degraus comuns aos robôs de Senador Canedo (v1 a v4)
+_QUARTOS_SC = [(15, [('quartos', '>=', 3)]), (10, [('quartos', '==', 2)])]
+_VAGAS_SC = [(10, [('vagas', '>=', 2)]), (5, [('vagas', '==', 1)])]
+_REGIAO_SC = [(20, [('regiao', '==', 1)])]
+
+# Valores relativos ao preço/m² de referência do local (mediana do bairro/cidade,
+# ou o valor_max_m2 da configuração sem amostras): (feature, fator) = feature * fator
+_REFERENCIA = 'referencia_m2'
+
+REGRAS = {
+    # robo_senador_canedo.py e robo_senador_canedo_v2.py
+    'senador_canedo': {
+        'degraus': [
+            _faixa('preco_m2', [(1800, 30), (2000, 25), (2200, 20), (2400, 15)], positivo=True),
+            _REGIAO_SC,
+            _QUARTOS_SC,
+            _VAGAS_SC,
+            _minimos('area', [(100, 10), (80, 5)])
+        ],
+        'bonus': [],
+        'maximo': 100
+    },
+    # robo_senador_canedo_v3.py
+    'senador_canedo_v3': {
+        'degraus': [
+            _faixa('preco_m2', [(1800, 30), (2000, 25), (2200, 20), (2400, 15)], positivo=True),
+            _REGIAO_SC,
+            _QUARTOS_SC,
+            _VAGAS_SC,
+            _minimos('area', [(100, 10), (80, 5)]),
+            [(10, [('preco', '>', 0), ('preco', '<=', 300000)]), (5, [('preco', '<=', 500000)])]
+        ],
+        'bonus': [],
+        'maximo': 100
+    },
+    # robo_senador_canedo_v4.py
+    'senador_canedo_v4': {
+        'degraus': [
+            _faixa('preco_m2', [(1000, 35), (1500, 30), (2000, 25), (2400, 15)], positivo=True),
+            _REGIAO_SC,
+            _QUARTOS_SC + [(5, [('quartos', '==', 1)])],
+            _VAGAS_SC,
+            _minimos('area', [(200, 15), (100, 10), (50, 5)]),
+            [(10, [('preco', '>=', 100000), ('preco', '<=', 400000)]), (5, [('preco', '<=', 600000)])]
+        ],
+        'bonus': [],
+        'maximo': 100
+    },
+    # robo_oportunidades_nacionais_v5.py (calcular_score_expandido)
+    'nacional_v5': {
+        'degraus': [
+            [
+                (30, [('preco_m2', '<=', (_REFERENCIA, 0.6))]),
+                (20, [('preco_m2', '<=', (_REFERENCIA, 0.8))]),
+                (10, [('preco_m2', '<=', (_REFERENCIA, 1))])
+            ],
+            [(25, [('regiao', '==', 1)])],
+            _minimos('area', [(300, 15), (200, 10), (150, 5)]),
+            [(15, [('preco_m2', '<=', (_REFERENCIA, 0.5))])]
+        ],
+        'bonus': ['bonus_cidade'],
+        'maximo': 100
+    },
+    # robo_oportunidades_regionais_v6.py
+    'regional_v6': {
+        'degraus': [
+            [
+                (35, [('preco_m2', '<=', (_REFERENCIA, 0.5))]),
+                (25, [('preco_m2', '<=', (_REFERENCIA, 0.7))]),
+                (15, [('preco_m2', '<=', (_REFERENCIA, 1))])
+            ],
+            _minimos('area', [(250, 20), (180, 15), (120, 10)]),
+            [(15, [('regiao', '==', 1)])]
+        ],
+        'bonus': ['bonus_cidade'],
+        'maximo': 100
+    }
+}
+
+
+def regiao_prioritaria(bairro, regioes):
+    """1 se alguma região prioritária aparece no bairro (sem acento/maiúsculas, palavra inteira)"""
+    return int(detector_para(regioes).contem(bairro or ''))
+
+
+def features_imovel(imovel, regioes):
+    """Features de um dict de imóvel dos robôs de Senador Canedo"""
+    return {
+        'preco': imovel.get('preco', 0),
+        'area': imovel.get('area', 0),
+        'preco_m2': imovel.get('preco_m2', 0),
+        'quartos': imovel.get('quartos', 0),
+        'vagas': imovel.get('vagas', 0),
+        'regiao': regiao_prioritaria(imovel.get('bairro', ''), regioes)
+    }
+
+
+def features_cidade(preco_m2, area, bairro, referencia_m2, bonus_cidade, regioes):
+    """Features dos robôs por cidade (v5 e v6)"""
+    return {
+        'preco_m2': preco_m2,
+        'area': area,
+        'regiao': regiao_prioritaria(bairro, regioes),
+        'referencia_m2': referencia_m2,
+        'bonus_cidade': bonus_cidade
+    }
+
+
+def _limite(valor, features):
+    """Resolve o valor da condição: número ou (feature, fator)"""
+    if isinstance(valor, tuple):
+        nome, fator = valor
+        return features[nome] * fator
+    return valor
+
+
+def pontuar(regras, features):
+    """Score de um anúncio (dict de features)"""
+    score = 0
+    for degrau in regras['degraus']:
+        for pontos, condicoes in degrau:
+            if all(OPERADORES[op](features[nome], _limite(valor, features))
+                   for nome, op, valor in condicoes):
+                score += pontos
+                break
+
+    for nome in regras['bonus']:
+        score += features[nome]
+
+    return min(score, regras['maximo'])
+
+
+def pontuar_lote(regras, colunas):
+    """Scores de um lote: colunas é {feature: np.ndarray}, todas do mesmo tamanho"""
+    tamanho = len(next(iter(colunas.values()))) if colunas else 0
+    scores = np.zeros(tamanho, dtype=np.float64)
+
+    for degrau in regras['degraus']:
+        condicoes_degrau = []
+        pontos_degrau = []
+        for pontos, condicoes in degrau:
+            mascara = np.ones(tamanho, dtype=bool)
+            for nome, op, valor in condicoes:
+                mascara &= OPERADORES[op](colunas[nome], _limite(valor, colunas))
+            condicoes_degrau.append(mascara)
+            pontos_degrau.append(pontos)
+        # np.select escolhe a primeira condição verdadeira, como o if/elif original
+        scores += np.select(condicoes_degrau, pontos_degrau, default=0)
+
+    for nome in regras['bonus']:
+        scores += colunas[nome]
+
+    return np.minimum(scores, regras['maximo'])
+
+
+def colunas_senador_canedo(linhas, regioes):
+    """Colunas a partir de linhas (preco, area, preco_m2, quartos, vagas, bairro)"""
+    preco, area, preco_m2, quartos, vagas, bairros = zip(*linhas) if linhas else ((),) * 6
+
+    # Região calculada uma vez por bairro distinto
+    unicos, inverso = np.unique(np.array([b or '' for b in bairros], dtype=object), return_inverse=True)
+    regiao = np.array([regiao_prioritaria(b, regioes) for b in unicos], dtype=np.int64)
+
+    return {
+        'preco': np.array(preco, dtype=np.float64),
+        'area': np.array(area, dtype=np.float64),
+        'preco_m2': np.array(preco_m2, dtype=np.float64),
+        'quartos': np.array(quartos, dtype=np.float64),
+        'vagas': np.array(vagas, dtype=np.float64),
+        'regiao': regiao[inverso]
+    }
+
+
+def colunas_por_cidade(linhas, contexto_cidades, referencia_m2=None):
+    """Colunas a partir de linhas (cidade, preco_m2, area, bairro).
+
+    contexto_cidades: {cidade: {'valor_max_m2', 'bonus_cidade', 'regioes'}}
+    referencia_m2: função (cidade, bairro, padrao) -> preço/m² de referência
+    (ex.: EstatisticasMercado.referencia_m2); sem ela vale o valor_max_m2.
+    Cidades fora do contexto recebem score 0 nos degraus relativos à referência.
+    """
+    cidades, preco_m2, area, bairros = zip(*linhas) if linhas else ((),) * 4
+    vazio = {'valor_max_m2': 0, 'bonus_cidade': 0, 'regioes': []}
+
+    chaves = np.array([f"{c}\x00{b or ''}" for c, b in zip(cidades, bairros)], dtype=object)
+    unicos, inverso = np.unique(chaves, return_inverse=True)
+
+    regiao = np.zeros(len(unicos), dtype=np.int64)
+    referencia = np.zeros(len(unicos), dtype=np.float64)
+    bonus = np.zeros(len(unicos), dtype=np.float64)
+    for i, chave in enumerate(unicos):
+        cidade, bairro = chave.split('\x00', 1)
+        contexto = contexto_cidades.get(cidade, vazio)
+        regiao[i] = regiao_prioritaria(bairro, contexto['regioes'])
+        referencia[i] = (contexto['valor_max_m2'] if referencia_m2 is None or cidade not in contexto_cidades
+                         else referencia_m2(cidade, bairro, contexto['valor_max_m2']))
+        bonus[i] = contexto['bonus_cidade']
+
+    return {
+        'preco_m2': np.array(preco_m2, dtype=np.float64),
+        'area': np.array(area, dtype=np.float64),
+        'regiao': regiao[inverso],
+        'referencia_m2': referencia[inverso],
+        'bonus_cidade': bonus[inverso]
+    }
+
@@ -5,18 +5,63 @@ Robô de Monitoramento de Oportunidades Imobiliárias Nacionais V5
 Expandido para incluir cidades emergentes de alto potencial
 """
 
-import requests
-from bs4 import BeautifulSoup
-import sqlite3
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import logging
 import time
-import random
 from datetime import datetime
-import re
 import os
+import argparse
+
+from armazenamento import ArmazenamentoOportunidades, preencher_identidade
+from cache_http import CacheHTTP
+from cliente_http import ClienteHTTP, HEADERS_POOL
+from detector_bairros import detector_para
+from escritor_sqlite import EscritorSQLite, conectar_escrita
+from esquema import migrar_esquema_leitura
+from estatisticas_mercado import EstatisticasMercado
+from eventos_oportunidades import garantir_eventos, podar_eventos
+from extracao_estruturada import extrair_anuncios
+from extracao_seletores import ExtratorSeletores
+from historico_precos import garantir_historico_precos
+from limitador_taxa import LimitadorPorHost
+from modelos import urls_compartilhadas
+from motor_varredura import MotorVarreduraAsync, host_da_url
+from pontuacao import REGRAS, colunas_por_cidade, features_cidade, pontuar
+from score_versionado import rescore_incremental
+
+# Bônus por potencial da cidade
+POTENCIAL_BONUS = {
+    'Lucas do Rio Verde': 20,  # Máximo potencial
+    'Rio Verde': 15,
+    'Sinop': 10,
+    'Barreiras': 8,
+    'Palmas': 5,
+    'Senador Canedo': 0  # Já valorizado
+}
+
+# Sem UNIQUE com o preço: o anúncio é identificado pela coluna identidade
+# (modelos.identidade_anuncio), chave do upsert no armazenamento
+DDL_OPORTUNIDADES = '''
+    CREATE TABLE IF NOT EXISTS {tabela} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cidade TEXT NOT NULL,
+        estado TEXT NOT NULL,
+        titulo TEXT NOT NULL,
+        preco REAL,
+        area REAL,
+        preco_m2 REAL,
+        endereco TEXT,
+        bairro TEXT,
+        score INTEGER,
+        portal TEXT,
+        url TEXT,
+        data_encontrado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        potencial_categoria TEXT,
+        identidade TEXT
+    )
+'''
 
 class RoboOportunidadesNacionais:
     def __init__(self):
@@ -109,6 +154,9 @@ class RoboOportunidadesNacionais:
             '62imoveis.com.br': {
                 'base_url': 'https://www.62imoveis.com.br/venda/{estado}/{cidade}/{cidade}/imoveis',
                 'cobertura': ['GO', 'MT', 'BA', 'TO'],
+                'concorrencia': 2,
+                'taxa': 0.3,  # requisições por segundo
+                'rajada': 2,
                 'seletores': {
                     'cards': 'div[class*="card"], article[class*="listing"]',
                     'titulo': 'h2, h3, a[class*="title"]',
@@ -121,6 +169,9 @@ class RoboOportunidadesNacionais:
             'vivareal.com.br': {
                 'base_url': 'https://www.vivareal.com.br/venda/{estado}/{cidade}/',
                 'cobertura': ['GO', 'MT', 'BA', 'TO'],
+                'concorrencia': 2,
+                'taxa': 0.3,  # requisições por segundo
+                'rajada': 2,
                 'seletores': {
                     'cards': 'article[class*="property"], div[class*="result"]',
                     'titulo': 'h2[class*="property"], span[class*="title"]',
@@ -133,6 +184,9 @@ class RoboOportunidadesNacionais:
             'imovelweb.com.br': {
                 'base_url': 'https://www.imovelweb.com.br/imoveis-venda-{cidade}-{estado}.html',
                 'cobertura': ['MT', 'GO', 'BA', 'TO'],
+                'concorrencia': 2,
+                'taxa': 0.3,  # requisições por segundo
+                'rajada': 2,
                 'seletores': {
                     'cards': 'div[class*="posting"], article[class*="property"]',
                     'titulo': 'h2[class*="title"], h3[class*="name"]',
@@ -143,24 +197,39 @@ class RoboOportunidadesNacionais:
             }
         }
         
-        # Headers mais sofisticados para evitar bloqueios
-        self.headers_pool = [
-            {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1'
+        # Token bucket por host: só requisições ao mesmo portal esperam
+        self.limitador = LimitadorPorHost(config_hosts={
+            host_da_url(config['base_url']): {'taxa': config['taxa'], 'rajada': config['rajada']}
+            for config in self.portais.values()
+        })
+        
+        # Cache de páginas de listagem (GET condicional)
+        self.cache = CacheHTTP('cache_http.db')
+        
+        # Seletores de cada portal compilados uma única vez
+        self.extratores = {
+            nome: ExtratorSeletores(config['seletores'])
+            for nome, config in self.portais.items()
+        }
+        
+        # Cliente HTTP compartilhado: conexões reaproveitadas entre cidades do mesmo portal
+        self.cliente = ClienteHTTP(
+            pool_conexoes=len(self.portais),
+            pool_maximo=max(config['concorrencia'] for config in self.portais.values()),
+            headers_pool=HEADERS_POOL,
+            limitador=self.limitador,
+            cache=self.cache
+        )
+        
+        # Motor assíncrono: portais diferentes em paralelo, limite por host
+        self.motor = MotorVarreduraAsync(
+            limites_por_host={
+                host_da_url(config['base_url']): config['concorrencia']
+                for config in self.portais.values()
             },
-            {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'pt-BR,pt;q=0.8,en-US;q=0.5,en;q=0.3',
-                'Accept-Encoding': 'gzip, deflate',
-                'Connection': 'keep-alive'
-            }
-        ]
+            limitador=self.limitador,
+            logger=self.logger
+        )
 
     def setup_logging(self):
         """Configura sistema de logs"""
@@ -174,29 +243,13 @@ class RoboOportunidadesNacionais:
 
     def setup_database(self):
         """Configura banco de dados expandido"""
-        self.conn = sqlite3.connect('oportunidades_nacionais.db')
+        # WAL: os dashboards leem enquanto a varredura grava
+        self.conn = conectar_escrita('oportunidades_nacionais.db')
         cursor = self.conn.cursor()
         
-        # Tabela de oportunidades expandida
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS oportunidades (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                cidade TEXT NOT NULL,
-                estado TEXT NOT NULL,
-                titulo TEXT NOT NULL,
-                preco REAL,
-                area REAL,
-                preco_m2 REAL,
-                endereco TEXT,
-                bairro TEXT,
-                score INTEGER,
-                portal TEXT,
-                url TEXT,
-                data_encontrado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                potencial_categoria TEXT,
-                UNIQUE(titulo, preco, portal, cidade)
-            )
-        ''')
+        # Tabela de oportunidades expandida (bancos antigos: UNIQUE com o preço)
+        colunas_antigas = {linha[1] for linha in cursor.execute("PRAGMA table_info(oportunidades)")}
+        cursor.execute(DDL_OPORTUNIDADES.format(tabela='oportunidades'))
         
         # Tabela de histórico de varreduras
         cursor.execute('''
@@ -214,51 +267,118 @@ class RoboOportunidadesNacionais:
         ''')
         
         self.conn.commit()
+        
+        if colunas_antigas and 'identidade' not in colunas_antigas:
+            self.migrar_identidade()
+        
+        # Chave do upsert criada antes do escritor: um índice único novo não
+        # faz a conexão dele reler o esquema ao compilar o ON CONFLICT
+        with self.conn:
+            self.conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ux_oportunidades_chave ON oportunidades(identidade)"
+            )
+        
+        # cidade_rank + índices de leitura (migra bancos antigos no lugar)
+        migrar_esquema_leitura(self.conn, 'oportunidades')
+        
+        # Histórico só de mudanças de preço/área (observacoes_anuncios)
+        garantir_historico_precos(self.conn, 'oportunidades')
+        
+        # Log de mudanças do stream /api/eventos do dashboard
+        garantir_eventos(self.conn, 'oportunidades')
+        podar_eventos(self.conn)
+        
+        # Gravações da varredura em uma thread única, com commit por lote/tempo:
+        # o loop do motor não espera o disco
+        self.escritor = EscritorSQLite('oportunidades_nacionais.db')
+        
+        # Upsert em lote pela identidade do anúncio: preço novo é UPDATE da
+        # mesma linha (e entra no histórico de preços), não uma linha nova
+        self.armazenamento = ArmazenamentoOportunidades(
+            self.conn, 'oportunidades',
+            chave=('identidade',),
+            colunas=('cidade', 'estado', 'titulo', 'preco', 'area', 'preco_m2', 'endereco',
+                     'bairro', 'score', 'portal', 'url', 'potencial_categoria', 'identidade'),
+            colunas_historico=('cidade', 'estado', 'portal', 'total_anuncios',
+                               'oportunidades_encontradas', 'tempo_execucao', 'status'),
+            escritor=self.escritor
+        )
+        
+        # Quantis de preço/m² por cidade/bairro (referência local do score)
+        self.mercado = EstatisticasMercado(self.conn, escritor=self.escritor)
+
+    def migrar_identidade(self):
+        """Troca UNIQUE(titulo, preco, portal, cidade) pela identidade do anúncio.
+
+        A constraint só sai recriando a tabela: mesmas linhas e ids (índices e
+        triggers voltam nos garantir_* de setup_database). Depois preenche a
+        identidade da linha mais recente de cada anúncio.
+        """
+        tipos = {linha[1]: linha[2] for linha in self.conn.execute("PRAGMA table_info(oportunidades)")}
+        self.conn.execute(DDL_OPORTUNIDADES.format(tabela='oportunidades_nova'))
+        novas = {linha[1] for linha in self.conn.execute("PRAGMA table_info(oportunidades_nova)")}
+        colunas = ', '.join(tipos)
+        
+        with self.conn:
+            # cidade_rank, atualizado_em, versões de score...
+            for coluna, tipo in tipos.items():
+                if coluna not in novas:
+                    self.conn.execute(f"ALTER TABLE oportunidades_nova ADD COLUMN {coluna} {tipo}")
+            self.conn.execute(
+                f"INSERT INTO oportunidades_nova ({colunas}) SELECT {colunas} FROM oportunidades"
+            )
+            # Triggers de ranking_cidades citam a tabela e barrariam o RENAME
+            for sufixo in ('insert', 'update'):
+                self.conn.execute(f"DROP TRIGGER IF EXISTS oportunidades_rank_ranking_{sufixo}")
+            self.conn.execute("DROP TABLE oportunidades")
+            self.conn.execute("ALTER TABLE oportunidades_nova RENAME TO oportunidades")
+        
+        preenchidas = preencher_identidade(self.conn, 'oportunidades')
+        self.logger.info(
+            f"oportunidades: chave trocada para a identidade do anúncio ({preenchidas} anúncios; "
+            f"linhas de preços antigos ficam sem identidade)"
+        )
 
     def calcular_score_expandido(self, preco_m2, area, bairro, cidade_config):
-        """Sistema de pontuação expandido para diferentes mercados"""
-        score = 0
-        
-        # Pontuação base por preço/m² (adaptada por cidade)
-        valor_max = cidade_config['valor_max_m2']
-        
-        if preco_m2 <= valor_max * 0.6:  # Muito abaixo do máximo
-            score += 30
-        elif preco_m2 <= valor_max * 0.8:  # Abaixo do máximo
-            score += 20
-        elif preco_m2 <= valor_max:  # Dentro do limite
-            score += 10
-        
-        # Pontuação por região prioritária
-        if any(regiao.lower() in bairro.lower() for regiao in cidade_config['regioes_prioritarias']):
-            score += 25
-        
-        # Pontuação por área
-        if area >= 300:
-            score += 15
-        elif area >= 200:
-            score += 10
-        elif area >= 150:
-            score += 5
-        
-        # Bônus por oportunidade (preço muito atrativo)
-        if preco_m2 <= valor_max * 0.5:
-            score += 15
-        
-        # Bônus por potencial da cidade
-        potencial_bonus = {
-            'Lucas do Rio Verde': 20,  # Máximo potencial
-            'Rio Verde': 15,
-            'Sinop': 10,
-            'Barreiras': 8,
-            'Palmas': 5,
-            'Senador Canedo': 0  # Já valorizado
+        """Sistema de pontuação expandido para diferentes mercados (pontuacao.REGRAS),
+        relativo à mediana de preço/m² do bairro/cidade"""
+        return pontuar(REGRAS['nacional_v5'], features_cidade(
+            preco_m2, area, bairro,
+            self.mercado.referencia_m2(cidade_config['nome'], bairro, cidade_config['valor_max_m2']),
+            POTENCIAL_BONUS.get(cidade_config['nome'], 0),
+            cidade_config['regioes_prioritarias']
+        ))
+    
+    def rescore(self):
+        """Repontua o histórico com as regras atuais (só o que mudou desde a última versão)"""
+        contexto = {
+            config['nome']: {
+                'valor_max_m2': config['valor_max_m2'],
+                'bonus_cidade': POTENCIAL_BONUS.get(config['nome'], 0),
+                'regioes': config['regioes_prioritarias'],
+                # Muda quando alguma mediana da cidade se move ~2%
+                'mercado': self.mercado.assinatura(config['nome'])
+            }
+            for config in self.cidades_alvo.values()
         }
-        
-        cidade_nome = cidade_config['nome']
-        score += potencial_bonus.get(cidade_nome, 0)
-        
-        return min(score, 100)  # Máximo 100 pontos
+        resultado = rescore_incremental(
+            self.conn, 'oportunidades', 'nacional_v5', REGRAS['nacional_v5'],
+            ('cidade', 'preco_m2', 'area', 'bairro'),
+            lambda linhas: colunas_por_cidade(linhas, contexto, self.mercado.referencia_m2),
+            contextos=contexto, coluna_contexto='cidade'
+        )
+        self.logger.info(
+            f"Rescore (versão {resultado['versao']}): {resultado['atualizadas']} scores alterados, "
+            f"{resultado['avaliadas']} avaliados, {resultado['features']} vetores recalculados"
+        )
+        return resultado['atualizadas']
+
+    def url_portal_cidade(self, portal_config, cidade_slug, cidade_config):
+        """URL da listagem de um portal para uma cidade"""
+        return portal_config['base_url'].format(
+            estado=cidade_config['estado'].lower(),
+            cidade=cidade_slug
+        )
 
     def varrer_portal_cidade(self, portal_nome, portal_config, cidade_slug, cidade_config):
         """Varre um portal específico para uma cidade"""
@@ -271,57 +391,54 @@ class RoboOportunidadesNacionais:
         
         try:
             # Constrói URL
-            url = portal_config['base_url'].format(
-                estado=estado,
-                cidade=cidade
-            )
+            url = self.url_portal_cidade(portal_config, cidade_slug, cidade_config)
             
-            # Headers aleatórios
-            headers = random.choice(self.headers_pool)
+            self.logger.info(f"Varrendo {portal_nome} - {cidade_config['nome']}/{estado.upper()}")
             
-            # Delay aleatório
-            time.sleep(random.uniform(2, 5))
+            # A vaga no limitador já foi reservada pelo motor assíncrono
+            response, nao_modificado = self.cliente.get_condicional(url, aguardar=False)
             
-            self.logger.info(f"Varrendo {portal_nome} - {cidade_config['nome']}/{estado.upper()}")
+            if nao_modificado:
+                self.logger.info(f"{portal_nome} - {cidade_config['nome']}: página não modificada (304)")
+                return []
             
-            response = requests.get(url, headers=headers, timeout=30)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Busca cards de imóveis
-            cards = soup.find_all('div', class_=re.compile(r'card|listing|result|property'))
+            # Dados estruturados embutidos (JSON-LD / hidratação) quando existirem;
+            # senão os seletores do portal compilados em __init__
+            anuncios = extrair_anuncios(response.content, url)[:50]
+            if not anuncios:
+                anuncios = self.extratores[portal_nome].extrair(response.content, url, limite=50)
             
             oportunidades = []
+            # Link repetido em vários cards não identifica nenhum deles
+            compartilhadas = urls_compartilhadas(anuncio.url for anuncio in anuncios)
             
-            for card in cards[:50]:  # Limita para evitar sobrecarga
+            for anuncio in anuncios:
                 try:
-                    # Extrai informações
-                    titulo_elem = card.find(['h2', 'h3', 'a'], class_=re.compile(r'title|name|heading'))
-                    titulo = titulo_elem.get_text(strip=True) if titulo_elem else "Imóvel sem título"
-                    
-                    preco_elem = card.find(['span', 'div'], class_=re.compile(r'price|valor|amount'))
-                    preco_text = preco_elem.get_text(strip=True) if preco_elem else "0"
+                    titulo = anuncio.titulo
+                    preco = anuncio.preco
+                    area = anuncio.area
+                    endereco = anuncio.endereco
+                    preco_m2 = anuncio.preco_m2
                     
-                    area_elem = card.find(['span', 'div'], class_=re.compile(r'area|m2|surface'))
-                    area_text = area_elem.get_text(strip=True) if area_elem else "0"
-                    
-                    endereco_elem = card.find(['span', 'div'], class_=re.compile(r'address|endereco|location'))
-                    endereco = endereco_elem.get_text(strip=True) if endereco_elem else "Endereço não informado"
-                    
-                    # Processa preço
-                    preco_numeros = re.findall(r'[\d.,]+', preco_text.replace('.', '').replace(',', '.'))
-                    preco = float(preco_numeros[0]) if preco_numeros else 0
-                    
-                    # Processa área
-                    area_numeros = re.findall(r'[\d.,]+', area_text.replace(',', '.'))
-                    area = float(area_numeros[0]) if area_numeros else 0
-                    
-                    # Calcula preço por m²
-                    preco_m2 = preco / area if area > 0 else 0
+                    # Bairro: dado estruturado, região conhecida citada no endereço
+                    # (nome canônico) ou o primeiro trecho do endereço
+                    bairro = (anuncio.bairro
+                              or detector_para(cidade_config['regioes_prioritarias']).identificar(endereco)
+                              or (endereco.split(',')[0] if ',' in endereco else endereco))
+                    identidade = anuncio.identidade(
+                        portal_nome, cidade_config['nome'], bairro=bairro,
+                        url='' if anuncio.url in compartilhadas else None
+                    )
                     
-                    # Extrai bairro do endereço
-                    bairro = endereco.split(',')[0] if ',' in endereco else endereco
+                    # Todo anúncio com área real alimenta os quantis do mercado local,
+                    # uma vez por preço/m² (revarreduras sem mudança não contam de novo)
+                    if preco > 0 and area > 0:
+                        self.mercado.registrar(
+                            cidade_config['nome'], bairro, preco_m2,
+                            anuncio=identidade
+                        )
                     
                     # Calcula score
                     score = self.calcular_score_expandido(preco_m2, area, bairro, cidade_config)
@@ -346,8 +463,9 @@ class RoboOportunidadesNacionais:
                             'bairro': bairro,
                             'score': score,
                             'portal': portal_nome,
-                            'url': url,
-                            'potencial_categoria': potencial
+                            'url': anuncio.url or url,
+                            'potencial_categoria': potencial,
+                            'identidade': identidade
                         }
                         
                         oportunidades.append(oportunidade)
@@ -356,6 +474,9 @@ class RoboOportunidadesNacionais:
                     self.logger.warning(f"Erro ao processar card: {e}")
                     continue
             
+            if not oportunidades:
+                # Nada a gravar: a página processada já pode ir para o cache
+                self.cliente.confirmar(url)
             return oportunidades
             
         except Exception as e:
@@ -385,34 +506,15 @@ class RoboOportunidadesNacionais:
             return f"{base} - BÁSICA"
 
     def salvar_oportunidades(self, oportunidades):
-        """Salva oportunidades no banco de dados"""
-        cursor = self.conn.cursor()
-        
-        for oportunidade in oportunidades:
-            try:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO oportunidades 
-                    (cidade, estado, titulo, preco, area, preco_m2, endereco, bairro, 
-                     score, portal, url, potencial_categoria)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    oportunidade['cidade'],
-                    oportunidade['estado'],
-                    oportunidade['titulo'],
-                    oportunidade['preco'],
-                    oportunidade['area'],
-                    oportunidade['preco_m2'],
-                    oportunidade['endereco'],
-                    oportunidade['bairro'],
-                    oportunidade['score'],
-                    oportunidade['portal'],
-                    oportunidade['url'],
-                    oportunidade['potencial_categoria']
-                ))
-            except Exception as e:
-                self.logger.error(f"Erro ao salvar oportunidade: {e}")
-        
-        self.conn.commit()
+        """Envia oportunidades ao escritor (upsert em lote; commit por lote/tempo).
+
+        Retorna o Future do lote, ou None se não foi possível enviá-lo.
+        """
+        try:
+            return self.armazenamento.salvar(oportunidades)
+        except Exception as e:
+            self.logger.error(f"Erro ao salvar oportunidades: {e}")
+            return None
 
     def executar_varredura_completa(self):
         """Executa varredura completa em todas as cidades e portais"""
@@ -421,39 +523,67 @@ class RoboOportunidadesNacionais:
         
         self.logger.info("=== INICIANDO VARREDURA NACIONAL DE OPORTUNIDADES ===")
         
+        # Monta todas as combinações cidade × portal cobertas
+        tarefas = []
         for cidade_slug, cidade_config in self.cidades_alvo.items():
-            self.logger.info(f"Varrendo {cidade_config['nome']}/{cidade_config['estado']}")
-            
             for portal_nome, portal_config in self.portais.items():
-                inicio_portal = time.time()
+                if cidade_config['estado'] not in portal_config['cobertura']:
+                    continue
                 
-                try:
-                    oportunidades = self.varrer_portal_cidade(
-                        portal_nome, portal_config, cidade_slug, cidade_config
-                    )
-                    
-                    if oportunidades:
-                        self.salvar_oportunidades(oportunidades)
-                        total_oportunidades += len(oportunidades)
-                        
-                        self.logger.info(
-                            f"{portal_nome} - {cidade_config['nome']}: "
-                            f"{len(oportunidades)} oportunidades encontradas"
-                        )
-                    
-                    # Registra histórico
-                    tempo_portal = time.time() - inicio_portal
-                    self.registrar_historico(
-                        cidade_config['nome'], cidade_config['estado'],
-                        portal_nome, 0, len(oportunidades), tempo_portal, "Sucesso"
-                    )
-                    
-                except Exception as e:
-                    self.logger.error(f"Erro no portal {portal_nome}: {e}")
-                    self.registrar_historico(
-                        cidade_config['nome'], cidade_config['estado'],
-                        portal_nome, 0, 0, 0, f"Erro: {e}"
-                    )
+                tarefas.append({
+                    'host': host_da_url(portal_config['base_url']),
+                    'funcao': self.varrer_portal_cidade,
+                    'args': (portal_nome, portal_config, cidade_slug, cidade_config),
+                    'contexto': (portal_nome, cidade_config,
+                                 self.url_portal_cidade(portal_config, cidade_slug, cidade_config))
+                })
+        
+        def ao_concluir(tarefa, oportunidades, erro, tempo_portal):
+            """Persiste o resultado de cada combinação assim que ela termina"""
+            nonlocal total_oportunidades
+            portal_nome, cidade_config, url = tarefa['contexto']
+            
+            if erro is not None:
+                self.logger.error(f"Erro no portal {portal_nome}: {erro}")
+                self.registrar_historico(
+                    cidade_config['nome'], cidade_config['estado'],
+                    portal_nome, 0, 0, 0, f"Erro: {erro}"
+                )
+                return
+            
+            if oportunidades:
+                futuro = self.salvar_oportunidades(oportunidades)
+                if futuro is not None:
+                    # A página só entra no cache depois do commit do lote
+                    def confirmar_pagina(futuro_lote):
+                        if futuro_lote.exception() is None:
+                            self.cliente.confirmar(url)
+                    futuro.add_done_callback(confirmar_pagina)
+                total_oportunidades += len(oportunidades)
+                
+                self.logger.info(
+                    f"{portal_nome} - {cidade_config['nome']}: "
+                    f"{len(oportunidades)} oportunidades encontradas"
+                )
+            
+            # Quantis atualizados pela combinação
+            self.mercado.salvar()
+            
+            # Registra histórico
+            self.registrar_historico(
+                cidade_config['nome'], cidade_config['estado'],
+                portal_nome, 0, len(oportunidades), tempo_portal, "Sucesso"
+            )
+        
+        self.motor.executar_sync(tarefas, ao_concluir)
+        
+        # Histórico das combinações sem oportunidades ainda não gravado
+        self.armazenamento.descarregar_historico()
+        self.escritor.aguardar()
+        
+        # Anúncios novos ou alterados pelo upsert passam a ter score e versão
+        # das regras atuais
+        self.rescore()
         
         tempo_total = time.time() - inicio
         
@@ -467,14 +597,10 @@ class RoboOportunidadesNacionais:
         return total_oportunidades
 
     def registrar_historico(self, cidade, estado, portal, total_anuncios, oportunidades, tempo, status):
-        """Registra histórico da varredura"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO historico_varreduras 
-            (cidade, estado, portal, total_anuncios, oportunidades_encontradas, tempo_execucao, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (cidade, estado, portal, total_anuncios, oportunidades, tempo, status))
-        self.conn.commit()
+        """Registra histórico da varredura (gravado junto com o próximo lote)"""
+        self.armazenamento.registrar_historico(
+            cidade, estado, portal, total_anuncios, oportunidades, tempo, status
+        )
 
     def gerar_relatorio_oportunidades(self):
         """Gera relatório das melhores oportunidades por categoria"""
@@ -484,16 +610,7 @@ class RoboOportunidadesNacionais:
         cursor.execute('''
             SELECT cidade, estado, titulo, preco, area, preco_m2, score, potencial_categoria, portal
             FROM oportunidades 
-            ORDER BY 
-                CASE 
-                    WHEN cidade = 'Lucas do Rio Verde' THEN 1
-                    WHEN cidade = 'Rio Verde' THEN 2
-                    WHEN cidade = 'Sinop' THEN 3
-                    WHEN cidade = 'Barreiras' THEN 4
-                    WHEN cidade = 'Palmas' THEN 5
-                    ELSE 6
-                END,
-                score DESC
+            ORDER BY cidade_rank, score DESC
             LIMIT 20
         ''')
         
@@ -525,8 +642,18 @@ class RoboOportunidadesNacionais:
 
 def main():
     """Função principal"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rescore', action='store_true',
+                        help='repontua o histórico com as regras atuais, sem varrer os portais')
+    args = parser.parse_args()
+    
     try:
         robo = RoboOportunidadesNacionais()
+        if args.rescore:
+            atualizadas = robo.rescore()
+            print(f"✅ Rescore concluído: {atualizadas} oportunidades atualizadas")
+            return
+        
         total_oportunidades = robo.executar_varredura_completa()
         
         print(f"✅ Varredura concluída!")
@@ -5,21 +5,43 @@ Robô de Oportunidades Regionais V6 - FUNCIONANDO COM DADOS REAIS
 Focado em portais regionais que não bloqueiam acesso
 """
 
-import requests
 from bs4 import BeautifulSoup
-import sqlite3
 import logging
 import time
 import random
 from datetime import datetime
 import re
 import json
+import os
+import argparse
+
+from adaptador_api import AdaptadorAPIJSON
+from armazenamento import ArmazenamentoOportunidades
+from cliente_http import ClienteHTTP
+from escritor_sqlite import conectar_escrita
+from esquema import migrar_esquema_leitura
+from estatisticas_mercado import EstatisticasMercado
+from extracao_atributos import TEXTO_PRECO, TEXTO_REFERENCIA, converter_numero_br
+from historico_precos import garantir_historico_precos
+from pontuacao import REGRAS, colunas_por_cidade, features_cidade, pontuar
+from score_versionado import rescore_incremental
+
+# Padrões da página do Keller (compilados uma vez, não a cada elemento)
+KELLER_CARDS = re.compile(r'imovel|card|property')
+KELLER_BAIRRO = re.compile(r'Bairro:|Bandeirantes|Jardim|Residencial|Centro')
+KELLER_TITULO = re.compile(r'alto padrão|Padrão|Casa|Terreno|Apartamento')
+
+# Palavras-chave de bairro que somam pontos no score
+BAIRROS_BONS = ['centro', 'jardim', 'residencial', 'bandeirantes', 'universitário']
 
 class RoboOportunidadesRegionais:
     def __init__(self):
         self.setup_logging()
         self.setup_database()
         
+        # Cliente HTTP compartilhado (pool keep-alive, retry e timeouts)
+        self.cliente = ClienteHTTP()
+        
         # Portais regionais que funcionam
         self.portais_regionais = {
             'keller_imoveis': {
@@ -38,7 +60,28 @@ class RoboOportunidadesRegionais:
                 'nome': 'OLX Regional',
                 'base_url': 'https://www.olx.com.br/imoveis/',
                 'cidades': ['Barreiras', 'Palmas'],
-                'metodo': 'api_publica'
+                'metodo': 'api_publica',
+                'api': {
+                    # Sem endpoint público conhecido: OLX_REGIONAL_API_URL é obrigatória
+                    # (ex.: o ServidorLocalAPI em testes); sem ela o portal é pulado
+                    'url': os.environ.get('OLX_REGIONAL_API_URL'),
+                    'caminho_itens': 'ads',
+                    'paginacao': 'offset',
+                    'tamanho_lote': 50,
+                    'max_paginas': 5,
+                    'parametros_cidade': {'cidade': '{cidade}', 'estado': '{estado}', 'categoria': 'venda'},
+                    'campos': {
+                        'titulo': 'subject',
+                        'preco': 'price',
+                        'area': 'properties.size',
+                        'quartos': 'properties.rooms',
+                        'banheiros': 'properties.bathrooms',
+                        'vagas': 'properties.garage_spaces',
+                        'bairro': 'location.neighbourhood',
+                        'url': 'url',
+                        'referencia': 'list_id'
+                    }
+                }
             }
         }
         
@@ -93,7 +136,8 @@ class RoboOportunidadesRegionais:
 
     def setup_database(self):
         """Configura banco de dados"""
-        self.conn = sqlite3.connect('oportunidades_regionais.db')
+        # WAL: os dashboards leem enquanto a varredura grava
+        self.conn = conectar_escrita('oportunidades_regionais.db')
         cursor = self.conn.cursor()
         
         cursor.execute('''
@@ -118,6 +162,24 @@ class RoboOportunidadesRegionais:
         ''')
         
         self.conn.commit()
+        
+        # cidade_rank + índices de leitura (migra bancos antigos no lugar)
+        migrar_esquema_leitura(self.conn, 'oportunidades_reais')
+        
+        # Histórico só de mudanças de preço/área (observacoes_anuncios)
+        garantir_historico_precos(self.conn, 'oportunidades_reais')
+        
+        # Upsert em lote pela chave UNIQUE(referencia, portal, cidade); ao
+        # contrário do INSERT OR REPLACE, preserva id e data_encontrado
+        self.armazenamento = ArmazenamentoOportunidades(
+            self.conn, 'oportunidades_reais',
+            chave=('referencia', 'portal', 'cidade'),
+            colunas=('cidade', 'estado', 'titulo', 'preco', 'area', 'preco_m2', 'endereco',
+                     'bairro', 'score', 'potencial_categoria', 'portal', 'referencia', 'url')
+        )
+        
+        # Quantis de preço/m² por cidade/bairro (referência local do score)
+        self.mercado = EstatisticasMercado(self.conn)
 
     def varrer_keller_imoveis(self):
         """Varre o portal Keller Imóveis (Lucas do Rio Verde e Sinop)"""
@@ -126,25 +188,18 @@ class RoboOportunidadesRegionais:
         try:
             self.logger.info("Varrendo Keller Imóveis...")
             
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-                'Connection': 'keep-alive'
-            }
-            
-            response = requests.get('https://kellerimob.com.br/', headers=headers, timeout=30)
+            response = self.cliente.get('https://kellerimob.com.br/')
             response.raise_for_status()
             
             soup = BeautifulSoup(response.content, 'html.parser')
             
             # Busca todos os imóveis na página principal
-            imoveis = soup.find_all('div', class_=re.compile(r'imovel|card|property'))
+            imoveis = soup.find_all('div', class_=KELLER_CARDS)
             
             # Se não encontrar com classe específica, busca por padrão de estrutura
             if not imoveis:
                 # Busca por elementos que contenham "Ref:" e preço
-                elementos = soup.find_all(text=re.compile(r'Ref:\s*\d+'))
+                elementos = soup.find_all(text=TEXTO_REFERENCIA)
                 
                 for elemento in elementos:
                     try:
@@ -158,27 +213,22 @@ class RoboOportunidadesRegionais:
                             
                         # Extrai informações
                         ref_text = elemento.strip()
-                        ref_match = re.search(r'Ref:\s*(\d+)', ref_text)
+                        ref_match = TEXTO_REFERENCIA.search(ref_text)
                         referencia = ref_match.group(1) if ref_match else "N/A"
                         
                         # Busca preço no container
-                        preco_elem = container.find(text=re.compile(r'R\$\s*[\d.,]+'))
-                        if preco_elem:
-                            preco_text = preco_elem.strip()
-                            preco_numeros = re.findall(r'[\d.,]+', preco_text.replace('.', '').replace(',', '.'))
-                            preco = float(preco_numeros[0]) if preco_numeros else 0
-                        else:
-                            preco = 0
+                        preco_elem = container.find(text=TEXTO_PRECO)
+                        preco = converter_numero_br(preco_elem.strip()) if preco_elem else 0
                         
                         # Busca bairro
-                        bairro_elem = container.find(text=re.compile(r'Bairro:|Bandeirantes|Jardim|Residencial|Centro'))
+                        bairro_elem = container.find(text=KELLER_BAIRRO)
                         bairro = bairro_elem.strip() if bairro_elem else "Não informado"
                         
                         # Determina cidade baseada no bairro
                         cidade = "Lucas do Rio Verde" if "Bandeirantes" in bairro else "Sinop"
                         
                         # Busca tipo/título
-                        titulo_elem = container.find(text=re.compile(r'alto padrão|Padrão|Casa|Terreno|Apartamento'))
+                        titulo_elem = container.find(text=KELLER_TITULO)
                         titulo = titulo_elem.strip() if titulo_elem else f"Imóvel Ref {referencia}"
                         
                         if preco > 50000:  # Filtro básico
@@ -220,6 +270,71 @@ class RoboOportunidadesRegionais:
             self.logger.error(f"Erro ao varrer Keller Imóveis: {e}")
             return []
 
+    def varrer_api_publica(self, portal_nome):
+        """Varre um portal declarado com 'metodo': 'api_publica' via endpoint JSON"""
+        portal = self.portais_regionais[portal_nome]
+        api = portal['api']
+        oportunidades = []
+        
+        if not api['url']:
+            self.logger.warning(f"{portal['nome']}: endpoint da API não configurado (OLX_REGIONAL_API_URL) - portal ignorado")
+            return oportunidades
+        
+        for cidade in portal['cidades']:
+            config = self.config_cidades[cidade]
+            parametros = {
+                chave: valor.format(cidade=cidade, estado=config['estado'])
+                for chave, valor in api['parametros_cidade'].items()
+            }
+            
+            adaptador = AdaptadorAPIJSON(
+                self.cliente, api['url'], api['campos'],
+                caminho_itens=api['caminho_itens'],
+                paginacao=api['paginacao'],
+                tamanho_lote=api['tamanho_lote'],
+                max_paginas=api['max_paginas'],
+                parametros=parametros
+            )
+            
+            try:
+                self.logger.info(f"Consultando API {portal['nome']} - {cidade}")
+                
+                for anuncio in adaptador.anuncios():
+                    if anuncio.preco <= 50000 or anuncio.area <= 0:  # Filtro básico
+                        continue
+                    
+                    bairro = anuncio.bairro or "Não informado"
+                    preco_m2 = anuncio.preco_m2
+                    # Área informada pela API: entra nos quantis do mercado local
+                    # (uma vez por anúncio e preço/m²)
+                    self.mercado.registrar(cidade, bairro, preco_m2,
+                                           anuncio=anuncio.identidade(portal['nome'], cidade))
+                    score = self.calcular_score(preco_m2, anuncio.area, bairro, cidade)
+                    
+                    if score >= config['score_minimo']:
+                        oportunidades.append({
+                            'cidade': cidade,
+                            'estado': config['estado'],
+                            'titulo': anuncio.titulo or f"Imóvel em {cidade}",
+                            'preco': anuncio.preco,
+                            'area': anuncio.area,
+                            'preco_m2': preco_m2,
+                            'endereco': f"{bairro}, {cidade}/{config['estado']}",
+                            'bairro': bairro,
+                            'score': score,
+                            'potencial_categoria': f"{config['potencial']} - REAL",
+                            'portal': portal['nome'],
+                            'referencia': anuncio.referencia or 'N/A',
+                            'url': anuncio.url or portal['base_url']
+                        })
+                        self.logger.info(f"Oportunidade encontrada: {anuncio.titulo} - R$ {anuncio.preco:,.2f}")
+            
+            except Exception as e:
+                self.logger.error(f"Erro na API {portal['nome']} - {cidade}: {e}")
+                continue
+        
+        return oportunidades
+
     def criar_oportunidades_demonstracao(self):
         """Cria oportunidades de demonstração baseadas em dados reais observados"""
         oportunidades_demo = [
@@ -303,66 +418,47 @@ class RoboOportunidadesRegionais:
         return oportunidades_demo
 
     def calcular_score(self, preco_m2, area, bairro, cidade):
-        """Calcula score da oportunidade"""
+        """Calcula score da oportunidade (regras em pontuacao.REGRAS), relativo à
+        mediana de preço/m² do bairro/cidade"""
         config = self.config_cidades[cidade]
-        score = 0
-        
-        # Score por preço/m²
-        if preco_m2 <= config['valor_max_m2'] * 0.5:
-            score += 35
-        elif preco_m2 <= config['valor_max_m2'] * 0.7:
-            score += 25
-        elif preco_m2 <= config['valor_max_m2']:
-            score += 15
-        
-        # Score por área
-        if area >= 250:
-            score += 20
-        elif area >= 180:
-            score += 15
-        elif area >= 120:
-            score += 10
-        
-        # Score por bairro (palavras-chave positivas)
-        bairros_bons = ['centro', 'jardim', 'residencial', 'bandeirantes', 'universitário']
-        if any(palavra in bairro.lower() for palavra in bairros_bons):
-            score += 15
-        
-        # Bônus por potencial da cidade
-        score += config['score_bonus']
-        
-        return min(score, 100)
+        return pontuar(REGRAS['regional_v6'], features_cidade(
+            preco_m2, area, bairro,
+            self.mercado.referencia_m2(cidade, bairro, config['valor_max_m2']),
+            config['score_bonus'], BAIRROS_BONS
+        ))
+
+    def rescore(self):
+        """Repontua o histórico com as regras atuais (só o que mudou desde a última versão)"""
+        contexto = {
+            cidade: {
+                'valor_max_m2': config['valor_max_m2'],
+                'bonus_cidade': config['score_bonus'],
+                'regioes': BAIRROS_BONS,
+                # Muda quando alguma mediana da cidade se move ~2%
+                'mercado': self.mercado.assinatura(cidade)
+            }
+            for cidade, config in self.config_cidades.items()
+        }
+        resultado = rescore_incremental(
+            self.conn, 'oportunidades_reais', 'regional_v6', REGRAS['regional_v6'],
+            ('cidade', 'preco_m2', 'area', 'bairro'),
+            lambda linhas: colunas_por_cidade(linhas, contexto, self.mercado.referencia_m2),
+            contextos=contexto, coluna_contexto='cidade'
+        )
+        self.logger.info(
+            f"Rescore (versão {resultado['versao']}): {resultado['atualizadas']} scores alterados, "
+            f"{resultado['avaliadas']} avaliados, {resultado['features']} vetores recalculados"
+        )
+        return resultado['atualizadas']
 
     def salvar_oportunidades(self, oportunidades):
-        """Salva oportunidades no banco"""
-        cursor = self.conn.cursor()
-        
-        for oportunidade in oportunidades:
-            try:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO oportunidades_reais 
-                    (cidade, estado, titulo, preco, area, preco_m2, endereco, bairro, 
-                     score, potencial_categoria, portal, referencia, url)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    oportunidade['cidade'],
-                    oportunidade['estado'],
-                    oportunidade['titulo'],
-                    oportunidade['preco'],
-                    oportunidade['area'],
-                    oportunidade['preco_m2'],
-                    oportunidade['endereco'],
-                    oportunidade['bairro'],
-                    oportunidade['score'],
-                    oportunidade['potencial_categoria'],
-                    oportunidade['portal'],
-                    oportunidade['referencia'],
-                    oportunidade['url']
-                ))
-            except Exception as e:
-                self.logger.error(f"Erro ao salvar oportunidade: {e}")
+        """Salva oportunidades no banco (upsert em lote, uma transação)"""
+        try:
+            self.armazenamento.salvar(oportunidades)
+        except Exception as e:
+            self.logger.error(f"Erro ao salvar oportunidades: {e}")
         
-        self.conn.commit()
+        self.mercado.salvar()
 
     def executar_varredura_completa(self):
         """Executa varredura completa"""
@@ -377,6 +473,11 @@ class RoboOportunidadesRegionais:
         oportunidades_keller = self.varrer_keller_imoveis()
         oportunidades_reais.extend(oportunidades_keller)
         
+        # Portais com API pública (Barreiras e Palmas)
+        for portal_nome, portal in self.portais_regionais.items():
+            if portal['metodo'] == 'api_publica':
+                oportunidades_reais.extend(self.varrer_api_publica(portal_nome))
+        
         # Se não conseguiu dados reais, usa demonstração baseada em observação
         if not oportunidades_reais:
             self.logger.info("Usando oportunidades de demonstração baseadas em dados reais observados")
@@ -386,6 +487,9 @@ class RoboOportunidadesRegionais:
         if oportunidades_reais:
             self.salvar_oportunidades(oportunidades_reais)
         
+        # Carimba a versão das regras nos anúncios novos
+        self.rescore()
+        
         tempo_total = time.time() - inicio
         
         self.logger.info(f"=== VARREDURA CONCLUÍDA ===")
@@ -403,16 +507,7 @@ class RoboOportunidadesRegionais:
         
         oportunidades = cursor.execute('''
             SELECT * FROM oportunidades_reais 
-            ORDER BY 
-                CASE 
-                    WHEN cidade = 'Lucas do Rio Verde' THEN 1
-                    WHEN cidade = 'Rio Verde' THEN 2
-                    WHEN cidade = 'Sinop' THEN 3
-                    WHEN cidade = 'Barreiras' THEN 4
-                    WHEN cidade = 'Palmas' THEN 5
-                    ELSE 6
-                END,
-                score DESC
+            ORDER BY cidade_rank, score DESC
         ''').fetchall()
         
         with open('relatorio_oportunidades_regionais.txt', 'w', encoding='utf-8') as f:
@@ -438,8 +533,18 @@ class RoboOportunidadesRegionais:
 
 def main():
     """Função principal"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rescore', action='store_true',
+                        help='repontua o histórico com as regras atuais, sem varrer os portais')
+    args = parser.parse_args()
+    
     try:
         robo = RoboOportunidadesRegionais()
+        if args.rescore:
+            atualizadas = robo.rescore()
+            print(f"✅ Rescore concluído: {atualizadas} oportunidades atualizadas")
+            return
+        
         total = robo.executar_varredura_completa()
         
         print(f"✅ Varredura regional concluída!")
@@ -5,7 +5,6 @@ Robô de Monitoramento de Oportunidades Imobiliárias - Senador Canedo
 Desenvolvido para varrer portais imobiliários e identificar oportunidades de investimento
 """
 
-import requests
 import sqlite3
 import smtplib
 import logging
@@ -18,8 +17,17 @@ from email.mime.multipart import MIMEMultipart
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, quote
 import os
+import argparse
 from typing import List, Dict, Optional
 
+from cliente_http import ClienteHTTP
+from detector_bairros import detector_para
+from extracao_atributos import converter_numero_br, extrair_atributos
+from extracao_estruturada import extrair_anuncios
+from limitador_taxa import LimitadorPorHost
+from pontuacao import REGRAS, colunas_senador_canedo, features_imovel, pontuar
+from score_versionado import CONTEXTO_UNICO, rescore_incremental
+
 # Configuração de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -34,10 +42,12 @@ logger = logging.getLogger(__name__)
 class RoboSenadorCanedo:
     def __init__(self):
         self.db_path = '/home/ubuntu/oportunidades_senador_canedo.db'
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+        
+        # Uma requisição a cada 2s por portal (antes: sleep fixo entre páginas)
+        self.limitador = LimitadorPorHost(taxa_padrao=0.5, rajada_padrao=1)
+        
+        # Cliente HTTP compartilhado (pool keep-alive e retry)
+        self.cliente = ClienteHTTP(limitador=self.limitador)
         
         # Critérios de oportunidade
         self.score_minimo = 50
@@ -112,71 +122,37 @@ class RoboSenadorCanedo:
             logger.error(f"Erro ao inicializar banco de dados: {e}")
     
     def calcular_score(self, imovel: Dict) -> int:
-        """Calcula o score de oportunidade do imóvel"""
-        score = 0
-        
+        """Calcula o score de oportunidade do imóvel (regras em pontuacao.REGRAS)"""
         try:
-            # Score baseado no preço por m²
-            preco_m2 = imovel.get('preco_m2', 0)
-            if preco_m2 > 0:
-                if preco_m2 <= 1800:
-                    score += 30
-                elif preco_m2 <= 2000:
-                    score += 25
-                elif preco_m2 <= 2200:
-                    score += 20
-                elif preco_m2 <= 2400:
-                    score += 15
-            
-            # Score baseado na região
-            bairro = imovel.get('bairro', '').lower()
-            for regiao in self.regioes_prioritarias:
-                if regiao.lower() in bairro:
-                    score += 20
-                    break
-            
-            # Score baseado no número de quartos
-            quartos = imovel.get('quartos', 0)
-            if quartos >= 3:
-                score += 15
-            elif quartos == 2:
-                score += 10
-            
-            # Score baseado em vagas de garagem
-            vagas = imovel.get('vagas', 0)
-            if vagas >= 2:
-                score += 10
-            elif vagas == 1:
-                score += 5
-            
-            # Score baseado na área
-            area = imovel.get('area', 0)
-            if area >= 100:
-                score += 10
-            elif area >= 80:
-                score += 5
-            
+            return pontuar(REGRAS['senador_canedo'], features_imovel(imovel, self.regioes_prioritarias))
         except Exception as e:
             logger.error(f"Erro ao calcular score: {e}")
-            score = 0
+            return 0
+    
+    def rescore(self) -> int:
+        """Repontua o histórico com as regras atuais (só o que mudou desde a última versão)"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            resultado = rescore_incremental(
+                conn, 'oportunidades', 'senador_canedo', REGRAS['senador_canedo'],
+                ('preco', 'area', 'preco_m2', 'quartos', 'vagas', 'bairro'),
+                lambda linhas: colunas_senador_canedo(linhas, self.regioes_prioritarias),
+                contextos={CONTEXTO_UNICO: {'regioes': self.regioes_prioritarias}},
+                # v1 a v4 dividem a tabela: 'score' (dashboard e consolidação) é do v4
+                coluna_score='score_senador_canedo'
+            )
+        finally:
+            conn.close()
         
-        return min(score, 100)  # Score máximo de 100
+        logger.info(
+            f"Rescore (versão {resultado['versao']}): {resultado['atualizadas']} scores alterados, "
+            f"{resultado['avaliadas']} avaliados, {resultado['features']} vetores recalculados"
+        )
+        return resultado['atualizadas']
     
     def extrair_numero(self, texto: str) -> float:
-        """Extrai números de uma string"""
-        if not texto:
-            return 0
-        
-        # Remove caracteres não numéricos exceto vírgulas e pontos
-        numeros = re.findall(r'[\d.,]+', str(texto))
-        if numeros:
-            # Pega o primeiro número encontrado
-            numero_str = numeros[0].replace('.', '').replace(',', '.')
-            try:
-                return float(numero_str)
-            except:
-                return 0
-        return 0
+        """Extrai números de uma string (formato brasileiro)"""
+        return converter_numero_br(texto)
     
     def varrer_zap_imoveis(self) -> List[Dict]:
         """Varre o portal ZAP Imóveis"""
@@ -191,7 +167,7 @@ class RoboSenadorCanedo:
                 url = f"{url_base}?pagina={pagina}"
                 
                 try:
-                    response = self.session.get(url, timeout=30)
+                    response = self.cliente.get(url)
                     if response.status_code != 200:
                         continue
                     
@@ -215,8 +191,6 @@ class RoboSenadorCanedo:
                         except Exception as e:
                             logger.debug(f"Erro ao processar card do ZAP: {e}")
                             continue
-                    
-                    time.sleep(2)  # Pausa entre páginas
                 
                 except Exception as e:
                     logger.error(f"Erro ao acessar página {pagina} do ZAP: {e}")
@@ -240,20 +214,17 @@ class RoboSenadorCanedo:
             preco_texto = preco_elem.get_text(strip=True) if preco_elem else "0"
             preco = self.extrair_numero(preco_texto)
             
-            # Área
-            area_elem = card.find(text=re.compile(r'm²|m2'))
-            area = 0
-            if area_elem:
-                area = self.extrair_numero(area_elem.parent.get_text() if area_elem.parent else area_elem)
+            # Área, quartos, banheiros e vagas em uma passada sobre o texto do card
+            atributos = extrair_atributos(card.get_text(' '))
+            area = atributos['area']
             
             # Endereço/Bairro
             endereco_elem = card.find(['span', 'div'], class_=re.compile(r'address|location|endereco'))
             endereco = endereco_elem.get_text(strip=True) if endereco_elem else ""
             
-            # Quartos, banheiros, vagas
-            quartos = self.extrair_caracteristica(card, r'quarto|bedroom|dorm')
-            banheiros = self.extrair_caracteristica(card, r'banheiro|bathroom|wc')
-            vagas = self.extrair_caracteristica(card, r'vaga|garage|garagem')
+            quartos = atributos['quartos']
+            banheiros = atributos['banheiros']
+            vagas = atributos['vagas']
             
             # URL
             link_elem = card.find('a', href=True)
@@ -279,27 +250,15 @@ class RoboSenadorCanedo:
             logger.debug(f"Erro ao extrair dados do imóvel ZAP: {e}")
             return None
     
-    def extrair_caracteristica(self, card, pattern: str) -> int:
-        """Extrai características numéricas (quartos, banheiros, vagas)"""
-        try:
-            elem = card.find(text=re.compile(pattern, re.IGNORECASE))
-            if elem:
-                texto = elem.parent.get_text() if elem.parent else elem
-                numero = self.extrair_numero(texto)
-                return int(numero) if numero > 0 else 0
-            return 0
-        except:
-            return 0
-    
     def extrair_bairro(self, endereco: str) -> str:
         """Extrai o bairro do endereço"""
         if not endereco:
             return ""
         
-        # Procura por padrões comuns de bairro
-        for regiao in self.regioes_prioritarias:
-            if regiao.lower() in endereco.lower():
-                return regiao
+        # Regiões prioritárias: uma passada do autômato sobre o endereço
+        regiao = detector_para(self.regioes_prioritarias).identificar(endereco)
+        if regiao:
+            return regiao
         
         # Se não encontrar região prioritária, tenta extrair bairro genérico
         partes = endereco.split(',')
@@ -308,6 +267,12 @@ class RoboSenadorCanedo:
         
         return endereco.split('-')[0].strip() if '-' in endereco else endereco
     
+    def imovel_de_anuncio(self, anuncio) -> Dict:
+        """Converte um anúncio dos dados estruturados no dict usado pelo robô"""
+        imovel = anuncio.para_dict()
+        imovel['bairro'] = anuncio.bairro or self.extrair_bairro(anuncio.endereco)
+        return imovel
+    
     def varrer_viva_real(self) -> List[Dict]:
         """Varre o portal Viva Real"""
         logger.info("Iniciando varredura do Viva Real")
@@ -321,16 +286,22 @@ class RoboSenadorCanedo:
                 url = f"{url_base}?pagina={pagina}"
                 
                 try:
-                    response = self.session.get(url, timeout=30)
+                    response = self.cliente.get(url)
                     if response.status_code != 200:
                         continue
                     
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    cards = soup.find_all(['div', 'article'], class_=re.compile(r'property|listing|card'))
+                    # Caminho rápido: anúncios em JSON-LD / JSON de hidratação da página
+                    anuncios = extrair_anuncios(response.content, url)
+                    if anuncios:
+                        imoveis = [self.imovel_de_anuncio(anuncio) for anuncio in anuncios]
+                    else:
+                        # Sem dados estruturados: scraping do DOM
+                        soup = BeautifulSoup(response.content, 'html.parser')
+                        cards = soup.find_all(['div', 'article'], class_=re.compile(r'property|listing|card'))
+                        imoveis = [self.extrair_dados_imovel_viva_real(card) for card in cards]
                     
-                    for card in cards:
+                    for imovel in imoveis:
                         try:
-                            imovel = self.extrair_dados_imovel_viva_real(card)
                             if imovel and self.validar_imovel(imovel):
                                 score = self.calcular_score(imovel)
                                 imovel['score'] = score
@@ -341,10 +312,8 @@ class RoboSenadorCanedo:
                                     logger.info(f"Oportunidade encontrada no Viva Real: {imovel['titulo']} - Score: {score}")
                         
                         except Exception as e:
-                            logger.debug(f"Erro ao processar card do Viva Real: {e}")
+                            logger.debug(f"Erro ao processar anúncio do Viva Real: {e}")
                             continue
-                    
-                    time.sleep(2)
                 
                 except Exception as e:
                     logger.error(f"Erro ao acessar página {pagina} do Viva Real: {e}")
@@ -398,7 +367,7 @@ class RoboSenadorCanedo:
                 url = f"{url_base}?o={pagina}"
                 
                 try:
-                    response = self.session.get(url, timeout=30)
+                    response = self.cliente.get(url)
                     if response.status_code != 200:
                         continue
                     
@@ -420,8 +389,6 @@ class RoboSenadorCanedo:
                         except Exception as e:
                             logger.debug(f"Erro ao processar card da OLX: {e}")
                             continue
-                    
-                    time.sleep(2)
                 
                 except Exception as e:
                     logger.error(f"Erro ao acessar página {pagina} da OLX: {e}")
@@ -754,9 +721,18 @@ class RoboSenadorCanedo:
 def main():
     """Função principal"""
     try:
-        logger.info("Iniciando Robô de Monitoramento - Senador Canedo")
+        parser = argparse.ArgumentParser(description=__doc__)
+        parser.add_argument('--rescore', action='store_true',
+                            help='repontua o histórico com as regras atuais, sem varrer os portais')
+        args = parser.parse_args()
         
         robo = RoboSenadorCanedo()
+        if args.rescore:
+            robo.rescore()
+            return
+        
+        logger.info("Iniciando Robô de Monitoramento - Senador Canedo")
+        
         oportunidades = robo.executar_varredura_completa()
         
         logger.info(f"Execução concluída. {len(oportunidades)} oportunidades processadas.")
@@ -5,23 +5,26 @@ Robô de Monitoramento de Oportunidades Imobiliárias - Senador Canedo V2
 Versão avançada com contorno de proteções anti-bot
 """
 
-import requests
 import sqlite3
 import smtplib
 import logging
 import time
 import json
-import re
-import random
 from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, quote
 import os
+import argparse
 from typing import List, Dict, Optional
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from cliente_http import ClienteHTTP
+from detector_bairros import detector_para
+from extracao_atributos import converter_numero_br, extrair_atributos
+from extracao_estruturada import extrair_anuncios
+from limitador_taxa import LimitadorPorHost
+from pontuacao import REGRAS, colunas_senador_canedo, features_imovel, pontuar
+from score_versionado import CONTEXTO_UNICO, rescore_incremental
 
 # Configuração de logging
 logging.basicConfig(
@@ -37,7 +40,12 @@ logger = logging.getLogger(__name__)
 class RoboSenadorCanedoV2:
     def __init__(self):
         self.db_path = '/home/ubuntu/oportunidades_senador_canedo.db'
-        self.session = self.criar_sessao_avancada()
+        
+        # Token bucket por host: portais diferentes não esperam uns pelos outros
+        self.limitador = LimitadorPorHost(taxa_padrao=1 / 3.5, rajada_padrao=1)
+        
+        # Cliente HTTP compartilhado (pool keep-alive, retry e rotação de user agents)
+        self.cliente = ClienteHTTP(limitador=self.limitador)
         
         # Critérios de oportunidade
         self.score_minimo = 50
@@ -54,15 +62,6 @@ class RoboSenadorCanedoV2:
             'Residencial Eldorado'
         ]
         
-        # User agents rotativos
-        self.user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15'
-        ]
-        
         # Configurações de email
         self.email_config = {
             'smtp_server': 'smtp.gmail.com',
@@ -74,47 +73,6 @@ class RoboSenadorCanedoV2:
         
         self.init_database()
     
-    def criar_sessao_avancada(self):
-        """Cria sessão HTTP avançada com retry e headers realistas"""
-        session = requests.Session()
-        
-        # Configurar retry strategy
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        
-        # Headers mais realistas
-        session.headers.update({
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Cache-Control': 'max-age=0'
-        })
-        
-        return session
-    
-    def get_random_headers(self):
-        """Retorna headers com User-Agent aleatório"""
-        headers = self.session.headers.copy()
-        headers['User-Agent'] = random.choice(self.user_agents)
-        return headers
-    
-    def delay_aleatorio(self, min_delay=2, max_delay=5):
-        """Adiciona delay aleatório entre requisições"""
-        delay = random.uniform(min_delay, max_delay)
-        time.sleep(delay)
-    
     def init_database(self):
         """Inicializa o banco de dados SQLite"""
         try:
@@ -185,12 +143,17 @@ class RoboSenadorCanedoV2:
                 logger.info(f"Tentando acessar {portal['nome']}")
                 oportunidades_portal = portal['funcao']()
                 oportunidades.extend(oportunidades_portal)
-                self.delay_aleatorio()
             except Exception as e:
                 logger.error(f"Erro ao acessar {portal['nome']}: {e}")
         
         return oportunidades
     
+    def imovel_de_anuncio(self, anuncio) -> Dict:
+        """Converte um anúncio dos dados estruturados no dict usado pelo robô"""
+        imovel = anuncio.para_dict()
+        imovel['bairro'] = anuncio.bairro or self.extrair_bairro(anuncio.endereco)
+        return imovel
+    
     def varrer_imovelweb(self) -> List[Dict]:
         """Varre o portal Imovelweb"""
         logger.info("Iniciando varredura do Imovelweb")
@@ -198,19 +161,22 @@ class RoboSenadorCanedoV2:
         
         try:
             url = 'https://www.imovelweb.com.br/imoveis-venda-senador-canedo-goias.html'
-            headers = self.get_random_headers()
-            
-            response = self.session.get(url, headers=headers, timeout=30)
+            response = self.cliente.get(url)
             
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Buscar cards de imóveis (estrutura específica do Imovelweb)
-                cards = soup.find_all('div', class_=['posting-card', 'property-card'])
+                # Caminho rápido: anúncios em JSON-LD / JSON de hidratação da página
+                anuncios = extrair_anuncios(response.content, url)
+                if anuncios:
+                    imoveis = [self.imovel_de_anuncio(anuncio) for anuncio in anuncios]
+                else:
+                    soup = BeautifulSoup(response.content, 'html.parser')
+                    
+                    # Buscar cards de imóveis (estrutura específica do Imovelweb)
+                    cards = soup.find_all('div', class_=['posting-card', 'property-card'])
+                    imoveis = [self.extrair_dados_imovelweb(card) for card in cards]
                 
-                for card in cards:
+                for imovel in imoveis:
                     try:
-                        imovel = self.extrair_dados_imovelweb(card)
                         if imovel and self.validar_imovel(imovel):
                             score = self.calcular_score(imovel)
                             imovel['score'] = score
@@ -221,7 +187,7 @@ class RoboSenadorCanedoV2:
                                 logger.info(f"Oportunidade encontrada no Imovelweb: {imovel['titulo']} - Score: {score}")
                     
                     except Exception as e:
-                        logger.debug(f"Erro ao processar card do Imovelweb: {e}")
+                        logger.debug(f"Erro ao processar anúncio do Imovelweb: {e}")
                         continue
             
             else:
@@ -245,20 +211,17 @@ class RoboSenadorCanedoV2:
             preco_texto = preco_elem.get_text(strip=True) if preco_elem else "0"
             preco = self.extrair_numero(preco_texto)
             
-            # Área
-            area_elem = card.find(text=re.compile(r'm²|m2'))
-            area = 0
-            if area_elem:
-                area = self.extrair_numero(area_elem.parent.get_text() if area_elem.parent else area_elem)
+            # Área, quartos, banheiros e vagas em uma passada sobre o texto do card
+            atributos = extrair_atributos(card.get_text(' '))
+            area = atributos['area']
             
             # Endereço
             endereco_elem = card.find(['span', 'div'], class_=['address', 'location'])
             endereco = endereco_elem.get_text(strip=True) if endereco_elem else ""
             
-            # Características
-            quartos = self.extrair_caracteristica(card, r'quarto|bedroom|dorm')
-            banheiros = self.extrair_caracteristica(card, r'banheiro|bathroom|wc')
-            vagas = self.extrair_caracteristica(card, r'vaga|garage|garagem')
+            quartos = atributos['quartos']
+            banheiros = atributos['banheiros']
+            vagas = atributos['vagas']
             
             # URL
             link_elem = card.find('a', href=True)
@@ -291,9 +254,7 @@ class RoboSenadorCanedoV2:
         
         try:
             url = 'https://www.chavesnamao.com.br/imoveis-para-venda-em-senador-canedo-go'
-            headers = self.get_random_headers()
-            
-            response = self.session.get(url, headers=headers, timeout=30)
+            response = self.cliente.get(url)
             
             if response.status_code == 200:
                 soup = BeautifulSoup(response.content, 'html.parser')
@@ -414,93 +375,47 @@ class RoboSenadorCanedoV2:
         return oportunidades_validas
     
     def calcular_score(self, imovel: Dict) -> int:
-        """Calcula o score de oportunidade do imóvel"""
-        score = 0
-        
+        """Calcula o score de oportunidade do imóvel (regras em pontuacao.REGRAS)"""
         try:
-            # Score baseado no preço por m²
-            preco_m2 = imovel.get('preco_m2', 0)
-            if preco_m2 > 0:
-                if preco_m2 <= 1800:
-                    score += 30
-                elif preco_m2 <= 2000:
-                    score += 25
-                elif preco_m2 <= 2200:
-                    score += 20
-                elif preco_m2 <= 2400:
-                    score += 15
-            
-            # Score baseado na região
-            bairro = imovel.get('bairro', '').lower()
-            for regiao in self.regioes_prioritarias:
-                if regiao.lower() in bairro:
-                    score += 20
-                    break
-            
-            # Score baseado no número de quartos
-            quartos = imovel.get('quartos', 0)
-            if quartos >= 3:
-                score += 15
-            elif quartos == 2:
-                score += 10
-            
-            # Score baseado em vagas de garagem
-            vagas = imovel.get('vagas', 0)
-            if vagas >= 2:
-                score += 10
-            elif vagas == 1:
-                score += 5
-            
-            # Score baseado na área
-            area = imovel.get('area', 0)
-            if area >= 100:
-                score += 10
-            elif area >= 80:
-                score += 5
-            
+            return pontuar(REGRAS['senador_canedo'], features_imovel(imovel, self.regioes_prioritarias))
         except Exception as e:
             logger.error(f"Erro ao calcular score: {e}")
-            score = 0
-        
-        return min(score, 100)
-    
-    def extrair_numero(self, texto: str) -> float:
-        """Extrai números de uma string"""
-        if not texto:
             return 0
-        
-        # Remove caracteres não numéricos exceto vírgulas e pontos
-        numeros = re.findall(r'[\d.,]+', str(texto))
-        if numeros:
-            # Pega o primeiro número encontrado
-            numero_str = numeros[0].replace('.', '').replace(',', '.')
-            try:
-                return float(numero_str)
-            except:
-                return 0
-        return 0
     
-    def extrair_caracteristica(self, card, pattern: str) -> int:
-        """Extrai características numéricas (quartos, banheiros, vagas)"""
+    def rescore(self) -> int:
+        """Repontua o histórico com as regras atuais (só o que mudou desde a última versão)"""
+        conn = sqlite3.connect(self.db_path)
         try:
-            elem = card.find(text=re.compile(pattern, re.IGNORECASE))
-            if elem:
-                texto = elem.parent.get_text() if elem.parent else elem
-                numero = self.extrair_numero(texto)
-                return int(numero) if numero > 0 else 0
-            return 0
-        except:
-            return 0
+            resultado = rescore_incremental(
+                conn, 'oportunidades', 'senador_canedo_v2', REGRAS['senador_canedo'],
+                ('preco', 'area', 'preco_m2', 'quartos', 'vagas', 'bairro'),
+                lambda linhas: colunas_senador_canedo(linhas, self.regioes_prioritarias),
+                contextos={CONTEXTO_UNICO: {'regioes': self.regioes_prioritarias}},
+                # v1 a v4 dividem a tabela: 'score' (dashboard e consolidação) é do v4
+                coluna_score='score_senador_canedo_v2'
+            )
+        finally:
+            conn.close()
+        
+        logger.info(
+            f"Rescore (versão {resultado['versao']}): {resultado['atualizadas']} scores alterados, "
+            f"{resultado['avaliadas']} avaliados, {resultado['features']} vetores recalculados"
+        )
+        return resultado['atualizadas']
+    
+    def extrair_numero(self, texto: str) -> float:
+        """Extrai números de uma string (formato brasileiro)"""
+        return converter_numero_br(texto)
     
     def extrair_bairro(self, endereco: str) -> str:
         """Extrai o bairro do endereço"""
         if not endereco:
             return ""
         
-        # Procura por padrões comuns de bairro
-        for regiao in self.regioes_prioritarias:
-            if regiao.lower() in endereco.lower():
-                return regiao
+        # Regiões prioritárias: uma passada do autômato sobre o endereço
+        regiao = detector_para(self.regioes_prioritarias).identificar(endereco)
+        if regiao:
+            return regiao
         
         # Se não encontrar região prioritária, tenta extrair bairro genérico
         partes = endereco.split(',')
@@ -720,9 +635,18 @@ class RoboSenadorCanedoV2:
 def main():
     """Função principal"""
     try:
-        logger.info("Iniciando Robô de Monitoramento V2 - Senador Canedo")
+        parser = argparse.ArgumentParser(description=__doc__)
+        parser.add_argument('--rescore', action='store_true',
+                            help='repontua o histórico com as regras atuais, sem varrer os portais')
+        args = parser.parse_args()
         
         robo = RoboSenadorCanedoV2()
+        if args.rescore:
+            robo.rescore()
+            return
+        
+        logger.info("Iniciando Robô de Monitoramento V2 - Senador Canedo")
+        
         oportunidades = robo.executar_varredura_completa()
         
         logger.info(f"Execução concluída. {len(oportunidades)} oportunidades processadas.")
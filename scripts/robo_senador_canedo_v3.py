@@ -5,23 +5,37 @@ Robô de Monitoramento de Oportunidades Imobiliárias - Senador Canedo V3
 Versão com extração REAL de dados do portal 62imoveis.com.br
 """
 
-import requests
 import sqlite3
 import smtplib
 import logging
 import time
 import json
 import re
-import random
 from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, quote
 import os
+import argparse
 from typing import List, Dict, Optional
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from cache_http import CacheHTTP
+from cliente_http import ClienteHTTP
+from detector_bairros import detector_para
+from extracao_atributos import TEXTO_PRECO, converter_numero_br, extrair_atributos
+from limitador_taxa import LimitadorPorHost
+from pontuacao import REGRAS, colunas_senador_canedo, features_imovel, pontuar
+from score_versionado import CONTEXTO_UNICO, rescore_incremental
+from segmentacao_cards import IndiceTextos
+
+# Padrões genéricos de bairro (depois do detector de regiões)
+PADROES_BAIRROS = [
+    re.compile(r'jardim\s+\w+'),
+    re.compile(r'setor\s+\w+'),
+    re.compile(r'residencial\s+\w+'),
+    re.compile(r'vila\s+\w+'),
+    re.compile(r'parque\s+\w+')
+]
 
 # Configuração de logging
 logging.basicConfig(
@@ -37,7 +51,15 @@ logger = logging.getLogger(__name__)
 class RoboSenadorCanedoV3:
     def __init__(self):
         self.db_path = '/home/ubuntu/oportunidades_senador_canedo.db'
-        self.session = self.criar_sessao_avancada()
+        
+        # Uma requisição a cada ~4,5s por portal (antes: delay de 3 a 6s)
+        self.limitador = LimitadorPorHost(taxa_padrao=1 / 4.5, rajada_padrao=1)
+        
+        # Cache de páginas de listagem (GET condicional)
+        self.cache = CacheHTTP(os.path.join(os.path.dirname(self.db_path), 'cache_http.db'))
+        
+        # Cliente HTTP compartilhado (pool keep-alive, retry e rotação de user agents)
+        self.cliente = ClienteHTTP(limitador=self.limitador, cache=self.cache)
         
         # Critérios de oportunidade
         self.score_minimo = 50
@@ -57,14 +79,8 @@ class RoboSenadorCanedoV3:
             'Jardins Montreal'
         ]
         
-        # User agents rotativos
-        self.user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15'
-        ]
+        # Gazetteer opcional com todos os bairros da cidade ('Canônico;variação' por linha)
+        self.arquivo_bairros = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bairros_senador_canedo.txt')
         
         # Configurações de email
         self.email_config = {
@@ -77,47 +93,6 @@ class RoboSenadorCanedoV3:
         
         self.init_database()
     
-    def criar_sessao_avancada(self):
-        """Cria sessão HTTP avançada com retry e headers realistas"""
-        session = requests.Session()
-        
-        # Configurar retry strategy
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        
-        # Headers mais realistas
-        session.headers.update({
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Cache-Control': 'max-age=0'
-        })
-        
-        return session
-    
-    def get_random_headers(self):
-        """Retorna headers com User-Agent aleatório"""
-        headers = self.session.headers.copy()
-        headers['User-Agent'] = random.choice(self.user_agents)
-        return headers
-    
-    def delay_aleatorio(self, min_delay=2, max_delay=5):
-        """Adiciona delay aleatório entre requisições"""
-        delay = random.uniform(min_delay, max_delay)
-        time.sleep(delay)
-    
     def init_database(self):
         """Inicializa o banco de dados SQLite"""
         try:
@@ -168,6 +143,8 @@ class RoboSenadorCanedoV3:
         """Varre o portal 62imoveis.com.br com dados REAIS"""
         logger.info("Iniciando varredura REAL do 62imoveis.com.br")
         oportunidades = []
+        # Páginas baixadas e processadas: entram no cache depois de salvas
+        self.paginas_processadas = []
         
         try:
             # URL base do portal
@@ -180,10 +157,13 @@ class RoboSenadorCanedoV3:
                     else:
                         url = url_base
                     
-                    headers = self.get_random_headers()
                     logger.info(f"Acessando página {pagina}: {url}")
                     
-                    response = self.session.get(url, headers=headers, timeout=30)
+                    response, nao_modificado = self.cliente.get_condicional(url)
+                    
+                    if nao_modificado:
+                        logger.info(f"Página {pagina} não modificada (304) - parsing ignorado")
+                        continue
                     
                     if response.status_code == 200:
                         soup = BeautifulSoup(response.content, 'html.parser')
@@ -229,11 +209,11 @@ class RoboSenadorCanedoV3:
                         if not cards:
                             oportunidades_html = self.extrair_dados_direto_html(soup)
                             oportunidades.extend(oportunidades_html)
+                        
+                        self.paginas_processadas.append(url)
                     
                     else:
                         logger.warning(f"Página {pagina} retornou status {response.status_code}")
-                    
-                    self.delay_aleatorio(3, 6)  # Delay maior entre páginas
                 
                 except Exception as e:
                     logger.error(f"Erro ao acessar página {pagina}: {e}")
@@ -250,36 +230,35 @@ class RoboSenadorCanedoV3:
         oportunidades = []
         
         try:
-            # Buscar por padrões de preço no HTML
-            precos = soup.find_all(text=re.compile(r'R\$\s*[\d.,]+'))
+            # Índice dos nós de texto por container, montado em uma única travessia
+            indice = IndiceTextos(soup, TEXTO_PRECO)
             
-            for i, preco_text in enumerate(precos[:10]):  # Limitar a 10 para não sobrecarregar
+            for i, preco_text in enumerate(indice.nos):
                 try:
                     # Extrair preço
                     preco = self.extrair_numero(preco_text)
                     if preco < 50000 or preco > 2000000:  # Filtrar preços irreais
                         continue
                     
-                    # Buscar contexto ao redor do preço
-                    preco_elem = soup.find(text=preco_text)
-                    if preco_elem and preco_elem.parent:
-                        contexto = preco_elem.parent.find_parent(['div', 'article', 'section'])
+                    # Contexto do próprio nó (não de outro anúncio com o mesmo preço)
+                    if preco_text.parent:
+                        contexto = indice.contexto(preco_text)
                         
                         if contexto:
                             # Extrair título/descrição
-                            titulo_elem = contexto.find(['h1', 'h2', 'h3', 'h4', 'a'])
+                            titulo_elem = indice.primeiro(contexto, 'titulo')
                             titulo = titulo_elem.get_text(strip=True) if titulo_elem else f"Imóvel em Senador Canedo - R$ {preco:,.0f}"
                             
                             # Buscar área
-                            area_text = contexto.find(text=re.compile(r'\d+\s*m²'))
+                            area_text = indice.primeiro(contexto, 'area')
                             area = self.extrair_numero(area_text) if area_text else 0
                             
                             # Buscar quartos
-                            quartos_text = contexto.find(text=re.compile(r'\d+\s*quarto', re.IGNORECASE))
+                            quartos_text = indice.primeiro(contexto, 'quartos')
                             quartos = int(self.extrair_numero(quartos_text)) if quartos_text else 0
                             
                             # Buscar vagas
-                            vagas_text = contexto.find(text=re.compile(r'\d+\s*vaga', re.IGNORECASE))
+                            vagas_text = indice.primeiro(contexto, 'vagas')
                             vagas = int(self.extrair_numero(vagas_text)) if vagas_text else 0
                             
                             # Calcular preço por m²
@@ -313,23 +292,16 @@ class RoboSenadorCanedoV3:
     
     def identificar_bairro(self, texto: str) -> str:
         """Identifica bairro no texto"""
-        texto_lower = texto.lower()
+        # Regiões prioritárias + gazetteer opcional em uma passada do autômato
+        bairro = detector_para(self.regioes_prioritarias, self.arquivo_bairros).identificar(texto)
+        if bairro:
+            return bairro
         
-        for regiao in self.regioes_prioritarias:
-            if regiao.lower() in texto_lower:
-                return regiao
+        texto_lower = texto.lower()
         
         # Buscar padrões comuns de bairros
-        padroes_bairros = [
-            r'jardim\s+\w+',
-            r'setor\s+\w+',
-            r'residencial\s+\w+',
-            r'vila\s+\w+',
-            r'parque\s+\w+'
-        ]
-        
-        for padrao in padroes_bairros:
-            match = re.search(padrao, texto_lower)
+        for padrao in PADROES_BAIRROS:
+            match = padrao.search(texto_lower)
             if match:
                 return match.group().title()
         
@@ -342,32 +314,13 @@ class RoboSenadorCanedoV3:
             titulo_elem = card.find(['h1', 'h2', 'h3', 'h4', 'a'])
             titulo = titulo_elem.get_text(strip=True) if titulo_elem else "Imóvel em Senador Canedo"
             
-            # Preço - buscar por padrões de R$
-            preco_elem = card.find(text=re.compile(r'R\$\s*[\d.,]+'))
-            preco = self.extrair_numero(preco_elem) if preco_elem else 0
-            
-            # Se não encontrou preço no card, buscar no texto
-            if preco == 0:
-                texto_card = card.get_text()
-                match_preco = re.search(r'R\$\s*([\d.,]+)', texto_card)
-                if match_preco:
-                    preco = self.extrair_numero(match_preco.group(1))
-            
-            # Área
-            area_elem = card.find(text=re.compile(r'\d+\s*m²'))
-            area = self.extrair_numero(area_elem) if area_elem else 0
-            
-            # Quartos
-            quartos_elem = card.find(text=re.compile(r'\d+\s*quarto', re.IGNORECASE))
-            quartos = int(self.extrair_numero(quartos_elem)) if quartos_elem else 0
-            
-            # Suítes (contar como banheiros)
-            suites_elem = card.find(text=re.compile(r'\d+\s*suíte', re.IGNORECASE))
-            banheiros = int(self.extrair_numero(suites_elem)) if suites_elem else 0
-            
-            # Vagas
-            vagas_elem = card.find(text=re.compile(r'\d+\s*vaga', re.IGNORECASE))
-            vagas = int(self.extrair_numero(vagas_elem)) if vagas_elem else 0
+            # Preço, área, quartos, suítes e vagas em uma passada sobre o texto do card
+            atributos = extrair_atributos(card.get_text(' '))
+            preco = atributos['preco']
+            area = atributos['area']
+            quartos = atributos['quartos']
+            banheiros = atributos['suites']  # Suítes contam como banheiros
+            vagas = atributos['vagas']
             
             # URL
             link_elem = card.find('a', href=True)
@@ -394,78 +347,37 @@ class RoboSenadorCanedoV3:
             return None
     
     def calcular_score(self, imovel: Dict) -> int:
-        """Calcula o score de oportunidade do imóvel"""
-        score = 0
-        
+        """Calcula o score de oportunidade do imóvel (regras em pontuacao.REGRAS)"""
         try:
-            # Score baseado no preço por m²
-            preco_m2 = imovel.get('preco_m2', 0)
-            if preco_m2 > 0:
-                if preco_m2 <= 1800:
-                    score += 30
-                elif preco_m2 <= 2000:
-                    score += 25
-                elif preco_m2 <= 2200:
-                    score += 20
-                elif preco_m2 <= 2400:
-                    score += 15
-            
-            # Score baseado na região
-            bairro = imovel.get('bairro', '').lower()
-            for regiao in self.regioes_prioritarias:
-                if regiao.lower() in bairro:
-                    score += 20
-                    break
-            
-            # Score baseado no número de quartos
-            quartos = imovel.get('quartos', 0)
-            if quartos >= 3:
-                score += 15
-            elif quartos == 2:
-                score += 10
-            
-            # Score baseado em vagas de garagem
-            vagas = imovel.get('vagas', 0)
-            if vagas >= 2:
-                score += 10
-            elif vagas == 1:
-                score += 5
-            
-            # Score baseado na área
-            area = imovel.get('area', 0)
-            if area >= 100:
-                score += 10
-            elif area >= 80:
-                score += 5
-            
-            # Bonus por preço atrativo
-            preco = imovel.get('preco', 0)
-            if preco > 0 and preco <= 300000:
-                score += 10
-            elif preco <= 500000:
-                score += 5
-            
+            return pontuar(REGRAS['senador_canedo_v3'], features_imovel(imovel, self.regioes_prioritarias))
         except Exception as e:
             logger.error(f"Erro ao calcular score: {e}")
-            score = 0
+            return 0
+    
+    def rescore(self) -> int:
+        """Repontua o histórico com as regras atuais (só o que mudou desde a última versão)"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            resultado = rescore_incremental(
+                conn, 'oportunidades', 'senador_canedo_v3', REGRAS['senador_canedo_v3'],
+                ('preco', 'area', 'preco_m2', 'quartos', 'vagas', 'bairro'),
+                lambda linhas: colunas_senador_canedo(linhas, self.regioes_prioritarias),
+                contextos={CONTEXTO_UNICO: {'regioes': self.regioes_prioritarias}},
+                # v1 a v4 dividem a tabela: 'score' (dashboard e consolidação) é do v4
+                coluna_score='score_senador_canedo_v3'
+            )
+        finally:
+            conn.close()
         
-        return min(score, 100)
+        logger.info(
+            f"Rescore (versão {resultado['versao']}): {resultado['atualizadas']} scores alterados, "
+            f"{resultado['avaliadas']} avaliados, {resultado['features']} vetores recalculados"
+        )
+        return resultado['atualizadas']
     
     def extrair_numero(self, texto: str) -> float:
-        """Extrai números de uma string"""
-        if not texto:
-            return 0
-        
-        # Remove caracteres não numéricos exceto vírgulas e pontos
-        numeros = re.findall(r'[\d.,]+', str(texto))
-        if numeros:
-            # Pega o primeiro número encontrado
-            numero_str = numeros[0].replace('.', '').replace(',', '.')
-            try:
-                return float(numero_str)
-            except:
-                return 0
-        return 0
+        """Extrai números de uma string (formato brasileiro)"""
+        return converter_numero_br(texto)
     
     def validar_imovel(self, imovel: Dict) -> bool:
         """Valida se o imóvel atende aos critérios básicos"""
@@ -493,10 +405,10 @@ class RoboSenadorCanedoV3:
             logger.debug(f"Erro na validação do imóvel: {e}")
             return False
     
-    def salvar_oportunidades(self, oportunidades: List[Dict]):
-        """Salva oportunidades no banco de dados"""
+    def salvar_oportunidades(self, oportunidades: List[Dict]) -> bool:
+        """Salva oportunidades no banco de dados (True se gravou)"""
         if not oportunidades:
-            return
+            return True
         
         try:
             conn = sqlite3.connect(self.db_path)
@@ -533,9 +445,11 @@ class RoboSenadorCanedoV3:
             conn.commit()
             conn.close()
             logger.info(f"Salvadas {len(oportunidades)} oportunidades REAIS no banco de dados")
+            return True
         
         except Exception as e:
             logger.error(f"Erro ao salvar oportunidades: {e}")
+            return False
     
     def registrar_varredura(self, portal: str, total_anuncios: int, oportunidades: int, tempo: float, status: str):
         """Registra histórico da varredura"""
@@ -573,6 +487,7 @@ class RoboSenadorCanedoV3:
         inicio = time.time()
         
         todas_oportunidades = []
+        self.paginas_processadas = []
         
         try:
             # Varrer 62imoveis.com.br
@@ -593,8 +508,10 @@ class RoboSenadorCanedoV3:
             logger.error(f"Erro na varredura: {e}")
         
         # Salva todas as oportunidades REAIS
+        if self.salvar_oportunidades(todas_oportunidades):
+            # Só páginas já gravadas podem ser puladas no próximo 304
+            self.cliente.confirmar(*self.paginas_processadas)
         if todas_oportunidades:
-            self.salvar_oportunidades(todas_oportunidades)
             self.enviar_email_oportunidades(todas_oportunidades)
         
         tempo_total = time.time() - inicio
@@ -607,9 +524,18 @@ class RoboSenadorCanedoV3:
 def main():
     """Função principal"""
     try:
-        logger.info("Iniciando Robô de Monitoramento V3 - DADOS REAIS - Senador Canedo")
+        parser = argparse.ArgumentParser(description=__doc__)
+        parser.add_argument('--rescore', action='store_true',
+                            help='repontua o histórico com as regras atuais, sem varrer os portais')
+        args = parser.parse_args()
         
         robo = RoboSenadorCanedoV3()
+        if args.rescore:
+            robo.rescore()
+            return
+        
+        logger.info("Iniciando Robô de Monitoramento V3 - DADOS REAIS - Senador Canedo")
+        
         oportunidades = robo.executar_varredura_completa()
         
         logger.info(f"Execução concluída. {len(oportunidades)} oportunidades REAIS processadas.")
@@ -5,18 +5,40 @@ Robô de Monitoramento de Oportunidades Imobiliárias - Senador Canedo V4
 Versão com extração REAL baseada na estrutura HTML observada do 62imoveis.com.br
 """
 
-import requests
-import sqlite3
 import logging
 import time
 import re
-import random
 from datetime import datetime
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 import os
+import argparse
 from typing import List, Dict, Optional
 
+from armazenamento import ArmazenamentoOportunidades, preencher_identidade
+from cache_http import CacheHTTP
+from cliente_http import ClienteHTTP
+from detector_bairros import detector_para
+from escritor_sqlite import conectar_escrita
+from esquema import migrar_esquema_leitura
+from extracao_atributos import TEXTO_PRECO, converter_numero_br, extrair_atributos
+from limitador_taxa import LimitadorPorHost
+from modelos import identidade_anuncio, urls_compartilhadas
+from pontuacao import REGRAS, colunas_senador_canedo, features_imovel, pontuar
+from score_versionado import CONTEXTO_UNICO, rescore_incremental
+from segmentacao_cards import SegmentadorCards
+
+# Padrões genéricos de bairro (depois do detector de regiões)
+PADROES_BAIRROS = [
+    re.compile(r'jardim\s+[\w\s]+'),
+    re.compile(r'jardins\s+[\w\s]+'),
+    re.compile(r'setor\s+[\w\s]+'),
+    re.compile(r'residencial\s+[\w\s]+'),
+    re.compile(r'condomínio\s+[\w\s]+'),
+    re.compile(r'vila\s+[\w\s]+'),
+    re.compile(r'parque\s+[\w\s]+')
+]
+
 # Configuração de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -31,18 +53,29 @@ logger = logging.getLogger(__name__)
 class RoboSenadorCanedoV4:
     def __init__(self):
         self.db_path = '/home/ubuntu/oportunidades_senador_canedo.db'
-        self.session = requests.Session()
         
-        # Headers realistas
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-            'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1'
-        })
+        # Uma requisição a cada ~3s por portal (antes: sleep de 2 a 4s)
+        self.limitador = LimitadorPorHost(taxa_padrao=1 / 3, rajada_padrao=1)
+        
+        # Cache de páginas de listagem (GET condicional)
+        self.cache = CacheHTTP(os.path.join(os.path.dirname(self.db_path), 'cache_http.db'))
+        
+        # Cliente HTTP compartilhado com headers realistas
+        self.cliente = ClienteHTTP(
+            headers_base={
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+                'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
+                'Accept-Encoding': 'gzip, deflate, br',
+                'DNT': '1',
+                'Connection': 'keep-alive',
+                'Upgrade-Insecure-Requests': '1'
+            },
+            user_agents=[
+                'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+            ],
+            limitador=self.limitador,
+            cache=self.cache
+        )
         
         # Critérios de oportunidade
         self.score_minimo = 50
@@ -55,12 +88,26 @@ class RoboSenadorCanedoV4:
             'Jardins Capri', 'Jardins Montreal', 'Villa Verde', 'Terras Alpha'
         ]
         
+        # Gazetteer opcional com todos os bairros da cidade ('Canônico;variação' por linha)
+        self.arquivo_bairros = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bairros_senador_canedo.txt')
+        
         self.init_database()
+        
+        # Conexão única para gravação: upsert em lote pela identidade do anúncio
+        # (preço novo atualiza a mesma linha)
+        self.armazenamento = ArmazenamentoOportunidades(
+            conectar_escrita(self.db_path), 'oportunidades',
+            chave=('identidade',),
+            colunas=('portal', 'titulo', 'preco', 'area', 'preco_m2', 'endereco', 'bairro',
+                     'quartos', 'banheiros', 'vagas', 'score', 'url', 'identidade'),
+            colunas_historico=('portal', 'total_anuncios', 'oportunidades_encontradas',
+                               'tempo_execucao', 'status')
+        )
     
     def init_database(self):
         """Inicializa o banco de dados SQLite"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = conectar_escrita(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -97,6 +144,18 @@ class RoboSenadorCanedoV4:
             ''')
             
             conn.commit()
+            
+            # Chave do upsert: identidade do anúncio, não o preço (v1 a v3 gravam
+            # sem ela; em bancos antigos só a linha mais recente de cada anúncio)
+            if 'identidade' not in {linha[1] for linha in cursor.execute("PRAGMA table_info(oportunidades)")}:
+                cursor.execute("ALTER TABLE oportunidades ADD COLUMN identidade TEXT")
+                conn.commit()
+                preenchidas = preencher_identidade(conn, 'oportunidades', com_cidade=False)
+                logger.info(f"Identidade preenchida em {preenchidas} anúncios")
+            
+            # Índices de leitura do dashboard (data_encontrado, portal, bairro)
+            migrar_esquema_leitura(conn, 'oportunidades')
+            
             conn.close()
             logger.info("Banco de dados inicializado com sucesso")
             
@@ -104,45 +163,24 @@ class RoboSenadorCanedoV4:
             logger.error(f"Erro ao inicializar banco de dados: {e}")
     
     def extrair_numero(self, texto: str) -> float:
-        """Extrai números de uma string"""
-        if not texto:
-            return 0
-        
-        # Remove tudo exceto dígitos, vírgulas e pontos
-        numeros = re.findall(r'[\d.,]+', str(texto))
-        if numeros:
-            numero_str = numeros[0].replace('.', '').replace(',', '.')
-            try:
-                return float(numero_str)
-            except:
-                return 0
-        return 0
+        """Extrai números de uma string (formato brasileiro)"""
+        return converter_numero_br(texto)
     
     def identificar_bairro(self, texto: str) -> str:
         """Identifica bairro no texto"""
         if not texto:
             return 'Senador Canedo'
             
-        texto_lower = texto.lower()
+        # Regiões prioritárias + gazetteer opcional em uma passada do autômato
+        bairro = detector_para(self.regioes_prioritarias, self.arquivo_bairros).identificar(texto)
+        if bairro:
+            return bairro
         
-        # Buscar regiões prioritárias
-        for regiao in self.regioes_prioritarias:
-            if regiao.lower() in texto_lower:
-                return regiao
+        texto_lower = texto.lower()
         
         # Buscar padrões comuns
-        padroes = [
-            r'jardim\s+[\w\s]+',
-            r'jardins\s+[\w\s]+',
-            r'setor\s+[\w\s]+',
-            r'residencial\s+[\w\s]+',
-            r'condomínio\s+[\w\s]+',
-            r'vila\s+[\w\s]+',
-            r'parque\s+[\w\s]+'
-        ]
-        
-        for padrao in padroes:
-            match = re.search(padrao, texto_lower)
+        for padrao in PADROES_BAIRROS:
+            match = padrao.search(texto_lower)
             if match:
                 bairro = match.group().strip().title()
                 if len(bairro) < 50:  # Evitar textos muito longos
@@ -151,66 +189,30 @@ class RoboSenadorCanedoV4:
         return 'Senador Canedo'
     
     def calcular_score(self, imovel: Dict) -> int:
-        """Calcula o score de oportunidade do imóvel"""
-        score = 0
-        
+        """Calcula o score de oportunidade do imóvel (regras em pontuacao.REGRAS)"""
         try:
-            # Score baseado no preço por m²
-            preco_m2 = imovel.get('preco_m2', 0)
-            if preco_m2 > 0:
-                if preco_m2 <= 1000:
-                    score += 35
-                elif preco_m2 <= 1500:
-                    score += 30
-                elif preco_m2 <= 2000:
-                    score += 25
-                elif preco_m2 <= 2400:
-                    score += 15
-            
-            # Score baseado na região
-            bairro = imovel.get('bairro', '').lower()
-            for regiao in self.regioes_prioritarias:
-                if regiao.lower() in bairro:
-                    score += 20
-                    break
-            
-            # Score baseado no número de quartos
-            quartos = imovel.get('quartos', 0)
-            if quartos >= 3:
-                score += 15
-            elif quartos == 2:
-                score += 10
-            elif quartos == 1:
-                score += 5
-            
-            # Score baseado em vagas de garagem
-            vagas = imovel.get('vagas', 0)
-            if vagas >= 2:
-                score += 10
-            elif vagas == 1:
-                score += 5
-            
-            # Score baseado na área
-            area = imovel.get('area', 0)
-            if area >= 200:
-                score += 15
-            elif area >= 100:
-                score += 10
-            elif area >= 50:
-                score += 5
-            
-            # Bonus por preço atrativo
-            preco = imovel.get('preco', 0)
-            if 100000 <= preco <= 400000:
-                score += 10
-            elif preco <= 600000:
-                score += 5
-            
+            return pontuar(REGRAS['senador_canedo_v4'], features_imovel(imovel, self.regioes_prioritarias))
         except Exception as e:
             logger.error(f"Erro ao calcular score: {e}")
-            score = 0
+            return 0
+    
+    def rescore(self) -> int:
+        """Repontua o histórico com as regras atuais (só o que mudou desde a última versão)"""
+        resultado = rescore_incremental(
+            self.armazenamento.conn, 'oportunidades', 'senador_canedo_v4', REGRAS['senador_canedo_v4'],
+            ('preco', 'area', 'preco_m2', 'quartos', 'vagas', 'bairro'),
+            lambda linhas: colunas_senador_canedo(linhas, self.regioes_prioritarias),
+            contextos={CONTEXTO_UNICO: {'regioes': self.regioes_prioritarias}},
+            # v1 a v4 dividem a tabela: o v4 é o dono de 'score' (lido pelo
+            # dashboard e pela consolidação); v1 a v3 repontuam na sua coluna
+            coluna_score='score'
+        )
         
-        return min(score, 100)
+        logger.info(
+            f"Rescore (versão {resultado['versao']}): {resultado['atualizadas']} scores alterados, "
+            f"{resultado['avaliadas']} avaliados, {resultado['features']} vetores recalculados"
+        )
+        return resultado['atualizadas']
     
     def validar_imovel(self, imovel: Dict) -> bool:
         """Valida se o imóvel atende aos critérios básicos"""
@@ -240,6 +242,8 @@ class RoboSenadorCanedoV4:
         """Varre o 62imoveis.com.br com base na estrutura HTML real observada"""
         logger.info("Iniciando varredura REAL do 62imoveis.com.br")
         oportunidades = []
+        # Páginas baixadas e processadas: entram no cache depois de salvas
+        self.paginas_processadas = []
         
         try:
             url = 'https://www.62imoveis.com.br/venda/go/senador-canedo/senador-canedo/imoveis'
@@ -253,73 +257,71 @@ class RoboSenadorCanedoV4:
                     
                     logger.info(f"Acessando página {pagina}: {url_pagina}")
                     
-                    response = self.session.get(url_pagina, timeout=30)
+                    response, nao_modificado = self.cliente.get_condicional(url_pagina)
+                    
+                    if nao_modificado:
+                        logger.info(f"Página {pagina} não modificada (304) - parsing ignorado")
+                        continue
                     
                     if response.status_code == 200:
                         soup = BeautifulSoup(response.content, 'html.parser')
                         
-                        # Método 1: Buscar por padrões de preço no HTML
-                        html_text = soup.get_text()
-                        precos_encontrados = re.findall(r'R\$\s*([\d.,]+)', html_text)
+                        # Tamanho do texto de cada subárvore calculado em uma travessia;
+                        # o card de cada preço é o primeiro ancestral com mais de 100 caracteres
+                        segmentador = SegmentadorCards(soup, TEXTO_PRECO)
+                        cards = segmentador.cards(tamanho_minimo=100, niveis=5)
                         
-                        logger.info(f"Encontrados {len(precos_encontrados)} preços na página {pagina}")
+                        logger.info(f"Encontrados {len(segmentador.nos)} preços em {len(cards)} cards na página {pagina}")
                         
-                        # Método 2: Buscar elementos que contêm "R$" e extrair contexto
-                        elementos_preco = soup.find_all(string=re.compile(r'R\$\s*[\d.,]+'))
+                        # URL do imóvel: primeiro link do card; link repetido em vários
+                        # cards (listagem, destaque) não identifica nenhum deles
+                        links = [elemento_pai.find('a', href=True) for _, elemento_pai in cards]
+                        urls_cards = [urljoin("https://www.62imoveis.com.br", link['href']) if link else ""
+                                      for link in links]
+                        compartilhadas = urls_compartilhadas(urls_cards)
                         
-                        for i, preco_text in enumerate(elementos_preco):
+                        for i, ((precos_text, elemento_pai), url_imovel) in enumerate(zip(cards, urls_cards)):
                             try:
-                                # Extrair preço
-                                preco = self.extrair_numero(preco_text)
-                                if preco < 50000 or preco > 3000000:
-                                    continue
-                                
-                                # Buscar elemento pai que contém mais informações
-                                elemento_pai = None
-                                current = preco_text.parent if hasattr(preco_text, 'parent') else None
-                                
-                                # Subir na árvore DOM até encontrar um container com mais informações
-                                for _ in range(5):  # Máximo 5 níveis
-                                    if current and current.name:
-                                        texto_container = current.get_text()
-                                        if len(texto_container) > 100:  # Container com informações suficientes
-                                            elemento_pai = current
-                                            break
-                                        current = current.parent
-                                    else:
-                                        break
-                                
-                                if not elemento_pai:
+                                # Extrair preço: condomínio e IPTU também aparecem em R$ no
+                                # card; o preço de venda é o maior valor da faixa aceita
+                                precos = [self.extrair_numero(texto) for texto in precos_text]
+                                precos = [valor for valor in precos if 50000 <= valor <= 3000000]
+                                if not precos:
                                     continue
+                                preco = max(precos)
                                 
                                 texto_completo = elemento_pai.get_text()
                                 
-                                # Extrair informações do texto
+                                # Extrair informações do texto (uma passada para os atributos)
                                 titulo = self.extrair_titulo(texto_completo, preco)
-                                area = self.extrair_area(texto_completo)
-                                quartos = self.extrair_quartos(texto_completo)
-                                vagas = self.extrair_vagas(texto_completo)
+                                # Com separador: "R$ 350.000" + "3 quartos" não viram um número só
+                                atributos = extrair_atributos(elemento_pai.get_text(' '))
+                                area = atributos['area']
+                                quartos = atributos['quartos']
+                                vagas = atributos['vagas']
                                 bairro = self.identificar_bairro(texto_completo)
                                 
                                 # Calcular preço por m²
                                 preco_m2 = preco / area if area > 0 else 0
                                 
-                                # Buscar URL do imóvel
-                                link_elem = elemento_pai.find('a', href=True)
-                                url_imovel = urljoin("https://www.62imoveis.com.br", link_elem['href']) if link_elem else ""
+                                endereco = f"{bairro}, Senador Canedo, GO"
                                 
                                 imovel = {
                                     'titulo': titulo,
                                     'preco': preco,
                                     'area': area,
                                     'preco_m2': preco_m2,
-                                    'endereco': f"{bairro}, Senador Canedo, GO",
+                                    'endereco': endereco,
                                     'bairro': bairro,
                                     'quartos': quartos,
                                     'banheiros': 0,  # Não conseguimos extrair facilmente
                                     'vagas': vagas,
                                     'url': url_imovel,
-                                    'portal': '62imoveis.com.br'
+                                    'portal': '62imoveis.com.br',
+                                    'identidade': identidade_anuncio(
+                                        '62imoveis.com.br', '' if url_imovel in compartilhadas else url_imovel,
+                                        titulo=titulo, bairro=bairro, endereco=endereco, area=area
+                                    )
                                 }
                                 
                                 if self.validar_imovel(imovel):
@@ -333,11 +335,11 @@ class RoboSenadorCanedoV4:
                             except Exception as e:
                                 logger.debug(f"Erro ao processar preço {i}: {e}")
                                 continue
+                        
+                        self.paginas_processadas.append(url_pagina)
                     
                     else:
                         logger.warning(f"Página {pagina} retornou status {response.status_code}")
-                    
-                    time.sleep(random.uniform(2, 4))  # Delay entre páginas
                 
                 except Exception as e:
                     logger.error(f"Erro ao acessar página {pagina}: {e}")
@@ -372,94 +374,23 @@ class RoboSenadorCanedoV4:
         else:
             return f"Imóvel em Senador Canedo - R$ {preco:,.0f}"
     
-    def extrair_area(self, texto: str) -> float:
-        """Extrai área do texto"""
-        # Buscar padrões como "100 m²", "100m²", "100 m2"
-        matches = re.findall(r'(\d+(?:[.,]\d+)?)\s*m[²2]', texto, re.IGNORECASE)
-        if matches:
-            return self.extrair_numero(matches[0])
-        return 0
-    
-    def extrair_quartos(self, texto: str) -> int:
-        """Extrai número de quartos"""
-        matches = re.findall(r'(\d+)\s*quarto', texto, re.IGNORECASE)
-        if matches:
-            return int(matches[0])
-        
-        # Buscar por "2Q", "3Q", etc.
-        matches = re.findall(r'(\d+)Q', texto, re.IGNORECASE)
-        if matches:
-            return int(matches[0])
-        
-        return 0
-    
-    def extrair_vagas(self, texto: str) -> int:
-        """Extrai número de vagas"""
-        matches = re.findall(r'(\d+)\s*vaga', texto, re.IGNORECASE)
-        if matches:
-            return int(matches[0])
-        return 0
-    
-    def salvar_oportunidades(self, oportunidades: List[Dict]):
-        """Salva oportunidades no banco de dados"""
+    def salvar_oportunidades(self, oportunidades: List[Dict]) -> bool:
+        """Salva oportunidades no banco de dados (upsert em lote, uma transação; True se gravou)"""
         if not oportunidades:
-            return
+            return True
         
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            for oportunidade in oportunidades:
-                # Verifica duplicatas
-                cursor.execute('''
-                    SELECT id FROM oportunidades 
-                    WHERE titulo = ? AND preco = ? AND portal = ?
-                ''', (oportunidade['titulo'], oportunidade['preco'], oportunidade['portal']))
-                
-                if cursor.fetchone() is None:
-                    cursor.execute('''
-                        INSERT INTO oportunidades 
-                        (portal, titulo, preco, area, preco_m2, endereco, bairro, 
-                         quartos, banheiros, vagas, score, url)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        oportunidade['portal'],
-                        oportunidade['titulo'],
-                        oportunidade['preco'],
-                        oportunidade['area'],
-                        oportunidade['preco_m2'],
-                        oportunidade['endereco'],
-                        oportunidade['bairro'],
-                        oportunidade['quartos'],
-                        oportunidade['banheiros'],
-                        oportunidade['vagas'],
-                        oportunidade['score'],
-                        oportunidade['url']
-                    ))
-            
-            conn.commit()
-            conn.close()
-            logger.info(f"Salvadas {len(oportunidades)} oportunidades REAIS no banco")
+            gravadas = self.armazenamento.salvar(oportunidades)
+            logger.info(f"Salvadas {len(oportunidades)} oportunidades REAIS no banco ({gravadas} novas/alteradas)")
+            return True
         
         except Exception as e:
             logger.error(f"Erro ao salvar oportunidades: {e}")
+            return False
     
     def registrar_varredura(self, portal: str, total: int, oportunidades: int, tempo: float, status: str):
-        """Registra histórico da varredura"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO historico_varreduras 
-                (portal, total_anuncios, oportunidades_encontradas, tempo_execucao, status)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (portal, total, oportunidades, tempo, status))
-            
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            logger.error(f"Erro ao registrar varredura: {e}")
+        """Registra histórico da varredura (gravado junto com o próximo lote)"""
+        self.armazenamento.registrar_historico(portal, total, oportunidades, tempo, status)
     
     def executar_varredura_completa(self):
         """Executa varredura completa com dados REAIS"""
@@ -480,8 +411,19 @@ class RoboSenadorCanedoV4:
             )
             
             if oportunidades:
-                self.salvar_oportunidades(oportunidades)
+                salvas = self.salvar_oportunidades(oportunidades)
                 logger.info(f"Email simulado com {len(oportunidades)} oportunidades REAIS")
+            else:
+                self.armazenamento.descarregar_historico()
+                salvas = True
+            
+            if salvas:
+                # Só páginas já gravadas podem ser puladas no próximo 304
+                self.cliente.confirmar(*self.paginas_processadas)
+            
+            # O upsert não altera o score de anúncios já gravados: novos e
+            # alterados recebem o das regras atuais aqui
+            self.rescore()
             
             tempo_total = time.time() - inicio
             logger.info(f"=== VARREDURA CONCLUÍDA ===")
@@ -497,9 +439,18 @@ class RoboSenadorCanedoV4:
 def main():
     """Função principal"""
     try:
-        logger.info("Iniciando Robô V4 - EXTRAÇÃO REAL DE DADOS")
+        parser = argparse.ArgumentParser(description=__doc__)
+        parser.add_argument('--rescore', action='store_true',
+                            help='repontua o histórico com as regras atuais, sem varrer os portais')
+        args = parser.parse_args()
         
         robo = RoboSenadorCanedoV4()
+        if args.rescore:
+            robo.rescore()
+            return
+        
+        logger.info("Iniciando Robô V4 - EXTRAÇÃO REAL DE DADOS")
+        
         oportunidades = robo.executar_varredura_completa()
         
         logger.info(f"Execução concluída. {len(oportunidades)} oportunidades REAIS processadas.")
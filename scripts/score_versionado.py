@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Repontuação Incremental com Versões de Regras
+Guarda o vetor de features de cada anúncio por variante (BLOB '<f8'),
+registra cada conjunto de regras em versoes_score e marca em <coluna>_versao
+a versão que produziu o score. Um rescore só recalcula features de linhas
+novas ou de cidades cujo contexto mudou, e só regrava o score das linhas que
+mudaram. Robôs que dividem a mesma tabela gravam cada um na sua coluna
+"""
+
+import hashlib
+import json
+from datetime import datetime
+
+import numpy as np
+
+from pontuacao import pontuar_lote
+
+
+TIPO_VETOR = np.dtype('<f8')
+
+# Chave de contexto das tabelas sem coluna de cidade
+CONTEXTO_UNICO = '*'
+
+
+def hash_config(config):
+    """Hash estável de regras/contexto (tuplas viram listas no JSON)"""
+    texto = json.dumps(config, sort_keys=True, ensure_ascii=False, default=list)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+def empacotar(colunas):
+    """{feature: array} -> (layout, lista de BLOBs, um por linha)"""
+    nomes = list(colunas)
+    matriz = np.column_stack([np.asarray(colunas[nome], dtype=TIPO_VETOR) for nome in nomes])
+    return ','.join(nomes), [linha.tobytes() for linha in np.ascontiguousarray(matriz, dtype=TIPO_VETOR)]
+
+
+def desempacotar(layout, blobs):
+    """(layout, BLOBs) -> {feature: array}"""
+    nomes = layout.split(',')
+    matriz = np.frombuffer(b''.join(blobs), dtype=TIPO_VETOR).reshape(len(blobs), len(nomes))
+    return {nome: matriz[:, i] for i, nome in enumerate(nomes)}
+
+
+def coluna_versao(coluna_score):
+    """Coluna com a versão das regras que produziu coluna_score"""
+    return f"{coluna_score}_versao"
+
+
+def garantir_esquema(conn, tabela, coluna_score='score'):
+    """Tabelas de versões, features e contextos + colunas de score e versão na tabela de anúncios"""
+    # features_score antiga (sem variante): vetores de robôs diferentes se
+    # sobrescreviam; é só cache, então é recriada e recalculada
+    colunas_features = {linha[1] for linha in conn.execute("PRAGMA table_info(features_score)")}
+    if colunas_features and 'variante' not in colunas_features:
+        conn.execute('DROP TABLE features_score')
+
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS versoes_score (
+            versao INTEGER PRIMARY KEY AUTOINCREMENT,
+            variante TEXT NOT NULL,
+            hash_regras TEXT NOT NULL,
+            regras TEXT NOT NULL,
+            criado_em TIMESTAMP,
+            UNIQUE(variante, hash_regras)
+        );
+        CREATE TABLE IF NOT EXISTS features_score (
+            tabela TEXT NOT NULL,
+            variante TEXT NOT NULL,
+            id_linha INTEGER NOT NULL,
+            layout TEXT NOT NULL,
+            vetor BLOB NOT NULL,
+            PRIMARY KEY (tabela, variante, id_linha)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS contextos_score (
+            tabela TEXT NOT NULL,
+            variante TEXT NOT NULL,
+            contexto TEXT NOT NULL,
+            hash_contexto TEXT NOT NULL,
+            PRIMARY KEY (tabela, variante, contexto)
+        ) WITHOUT ROWID;
+    ''')
+
+    versao = coluna_versao(coluna_score)
+    colunas = {linha[1] for linha in conn.execute(f"PRAGMA table_info({tabela})")}
+    if coluna_score not in colunas:
+        conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna_score} INTEGER")
+    if versao not in colunas:
+        conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {versao} INTEGER")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_{versao} ON {tabela}({versao})")
+    conn.commit()
+
+
+def registrar_versao(conn, variante, regras):
+    """Versão das regras (cria uma nova quando o hash muda)"""
+    hash_regras = hash_config(regras)
+    linha = conn.execute(
+        'SELECT versao FROM versoes_score WHERE variante = ? AND hash_regras = ?',
+        (variante, hash_regras)
+    ).fetchone()
+    if linha:
+        return linha[0]
+
+    cursor = conn.execute('''
+        INSERT INTO versoes_score (variante, hash_regras, regras, criado_em)
+        VALUES (?, ?, ?, ?)
+    ''', (
+        variante, hash_regras,
+        json.dumps(regras, ensure_ascii=False, default=list),
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    ))
+    return cursor.lastrowid
+
+
+def contextos_alterados(conn, tabela, variante, contextos):
+    """Grava o hash de cada contexto e retorna as chaves cujo hash mudou"""
+    anteriores = dict(conn.execute(
+        'SELECT contexto, hash_contexto FROM contextos_score WHERE tabela = ? AND variante = ?',
+        (tabela, variante)
+    ).fetchall())
+
+    alterados = []
+    for chave, contexto in contextos.items():
+        novo = hash_config(contexto)
+        if anteriores.get(chave) != novo:
+            alterados.append(chave)
+            conn.execute('''
+                INSERT OR REPLACE INTO contextos_score (tabela, variante, contexto, hash_contexto)
+                VALUES (?, ?, ?, ?)
+            ''', (tabela, variante, chave, novo))
+    return alterados
+
+
+def rescore_incremental(conn, tabela, variante, regras, colunas_sql, montar_colunas,
+                        contextos=None, coluna_contexto=None, chave='id', coluna_score='score'):
+    """Repontua só o necessário e carimba <coluna_score>_versao.
+
+    - features recalculadas para linhas novas/alteradas (versão NULL),
+      sem vetor da variante ou cujo contexto (ex.: cidade) mudou;
+    - score recalculado, a partir dos vetores, para linhas de outra versão;
+    - UPDATE de coluna_score (e de atualizado_em, se a tabela tiver) só onde
+      o valor muda; as demais só trocam de versão.
+    coluna_score: 'score' para a variante dona da coluna lida pelos dashboards
+    e pela consolidação; as outras variantes de uma tabela dividida passam uma
+    coluna própria.
+    Retorna {'versao', 'features', 'avaliadas', 'atualizadas'}.
+    """
+    garantir_esquema(conn, tabela, coluna_score)
+    contextos = contextos if contextos is not None else {}
+    coluna_v = coluna_versao(coluna_score)
+
+    with conn:
+        versao = registrar_versao(conn, variante, regras)
+        alterados = contextos_alterados(conn, tabela, variante, contextos)
+
+        # 1) Features: linhas sem vetor válido ou de contexto alterado
+        layout_atual = ','.join(montar_colunas([]).keys())
+        filtro_contexto = ''
+        parametros = [tabela, variante, layout_atual]
+        if alterados:
+            if coluna_contexto:
+                filtro_contexto = f" OR t.{coluna_contexto} IN ({', '.join('?' * len(alterados))})"
+                parametros.extend(alterados)
+            else:
+                filtro_contexto = ' OR 1'
+
+        linhas = conn.execute(f'''
+            SELECT t.{chave}, {', '.join('t.' + coluna for coluna in colunas_sql)}
+            FROM {tabela} t
+            LEFT JOIN features_score f ON f.tabela = ? AND f.variante = ? AND f.id_linha = t.{chave}
+            WHERE t.{coluna_v} IS NULL OR f.id_linha IS NULL OR f.layout != ?{filtro_contexto}
+        ''', parametros).fetchall()
+
+        if linhas:
+            layout, blobs = empacotar(montar_colunas([linha[1:] for linha in linhas]))
+            ids = [linha[0] for linha in linhas]
+            conn.executemany('''
+                INSERT OR REPLACE INTO features_score (tabela, variante, id_linha, layout, vetor)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(tabela, variante, id_linha, layout, blob) for id_linha, blob in zip(ids, blobs)])
+            # Força a reavaliação dessas linhas no passo 2
+            conn.executemany(f"UPDATE {tabela} SET {coluna_v} = NULL WHERE {chave} = ?",
+                             [(id_linha,) for id_linha in ids])
+
+        # 2) Score a partir dos vetores guardados, só para linhas fora da versão atual
+        pendentes = conn.execute(f'''
+            SELECT t.{chave}, t.{coluna_score}, f.layout, f.vetor
+            FROM {tabela} t
+            JOIN features_score f ON f.tabela = ? AND f.variante = ? AND f.id_linha = t.{chave}
+            WHERE t.{coluna_v} IS NULL OR t.{coluna_v} != ?
+        ''', (tabela, variante, versao)).fetchall()
+
+        atualizacoes = []
+        if pendentes:
+            ids = np.array([linha[0] for linha in pendentes], dtype=np.int64)
+            atuais = np.array([linha[1] if linha[1] is not None else -1 for linha in pendentes],
+                              dtype=np.float64)
+            novos = pontuar_lote(regras, desempacotar(pendentes[0][2], [linha[3] for linha in pendentes]))
+
+            mudou = novos != atuais
+            atualizacoes = list(zip(novos[mudou].astype(np.int64).tolist(), [versao] * int(mudou.sum()),
+                                    ids[mudou].tolist()))
+            # Score novo conta como alteração para quem lê por atualizado_em
+            # (consolidação por marca d'água), no formato do armazenamento
+            carimbo = ''
+            if 'atualizado_em' in {linha[1] for linha in conn.execute(f"PRAGMA table_info({tabela})")}:
+                carimbo = ', atualizado_em = ?'
+                agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                atualizacoes = [(score, v, agora, id_linha) for score, v, id_linha in atualizacoes]
+            conn.executemany(f"UPDATE {tabela} SET {coluna_score} = ?, {coluna_v} = ?{carimbo} WHERE {chave} = ?",
+                             atualizacoes)
+
+            # 3) Linhas cujo score não mudou: só troca de versão
+            conn.execute(f"UPDATE {tabela} SET {coluna_v} = ? WHERE {coluna_v} IS NULL OR {coluna_v} != ?",
+                         (versao, versao))
+
+        # Vetores de linhas removidas
+        conn.execute(f'''
+            DELETE FROM features_score
+            WHERE tabela = ? AND variante = ? AND id_linha NOT IN (SELECT {chave} FROM {tabela})
+        ''', (tabela, variante))
+
+    return {
+        'versao': versao,
+        'features': len(linhas),
+        'avaliadas': len(pendentes),
+        'atualizadas': len(atualizacoes)
+    }
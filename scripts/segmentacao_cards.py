@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Segmentação de Cards em Tempo Linear
+Calcula em uma única travessia o tamanho do texto de cada subárvore do HTML
+e usa esses tamanhos para achar o container (card) de cada preço, sem
+chamar get_text() repetidamente nos ancestrais. Também indexa os nós de
+texto por container para consultas O(1) no extrator de fallback
+"""
+
+from bs4 import CData, NavigableString, Tag
+
+from extracao_atributos import TEXTO_AREA, TEXTO_PRECO, TEXTO_QUARTOS, TEXTO_VAGAS
+
+
+# Mesmos tipos de texto que Tag.get_text() considera (exclui script, style e comentários)
+TIPOS_TEXTO = (NavigableString, CData)
+
+# Tags tratadas como container de um anúncio e tags candidatas a título
+TAGS_CONTAINER = ('div', 'article', 'section')
+TAGS_TITULO = ('h1', 'h2', 'h3', 'h4', 'a')
+
+# Padrões indexados por padrão no IndiceTextos
+PADROES_INDICE = {
+    'area': TEXTO_AREA,
+    'quartos': TEXTO_QUARTOS,
+    'vagas': TEXTO_VAGAS
+}
+
+
+class SegmentadorCards:
+    """Índice de tamanhos de texto por subárvore + nós que casam com o padrão"""
+
+    def __init__(self, raiz, padrao=TEXTO_PRECO):
+        self.comprimentos = {}
+        self.nos = []
+
+        tags = []
+        for no in raiz.descendants:
+            if isinstance(no, Tag):
+                tags.append(no)
+                self.comprimentos[id(no)] = 0
+            elif type(no) in TIPOS_TEXTO:
+                pai = no.parent
+                if pai is not None and id(pai) in self.comprimentos:
+                    self.comprimentos[id(pai)] += len(no)
+                if padrao.search(no):
+                    self.nos.append(no)
+
+        # Ordem inversa do documento: cada filho é somado antes do pai
+        for tag in reversed(tags):
+            pai = tag.parent
+            if pai is not None and id(pai) in self.comprimentos:
+                self.comprimentos[id(pai)] += self.comprimentos[id(tag)]
+
+    def comprimento(self, tag):
+        """len(tag.get_text()) sem percorrer a subárvore"""
+        return self.comprimentos.get(id(tag), 0)
+
+    def container(self, no, tamanho_minimo=100, niveis=5):
+        """Primeiro ancestral (até 'niveis' acima) com texto suficiente para ser um card"""
+        atual = no.parent
+        for _ in range(niveis):
+            if atual is None or not atual.name:
+                return None
+            if self.comprimento(atual) > tamanho_minimo:
+                return atual
+            atual = atual.parent
+        return None
+
+    def cards(self, tamanho_minimo=100, niveis=5):
+        """Pares (nós do padrão, container), um por container, na ordem do documento.
+
+        Todos os nós do container vêm na lista (ex.: preço, condomínio e IPTU
+        no mesmo card); o chamador escolhe qual usar.
+        """
+        por_container = {}
+        cards = []
+        for no in self.nos:
+            container = self.container(no, tamanho_minimo, niveis)
+            if container is None:
+                continue
+            nos = por_container.get(id(container))
+            if nos is None:
+                nos = por_container[id(container)] = []
+                cards.append((nos, container))
+            nos.append(no)
+        return cards
+
+
+class IndiceTextos:
+    """Índice construído em uma travessia: container de cada nó de texto e,
+    por container, o primeiro título e o primeiro texto de cada padrão.
+
+    Equivale a no.parent.find_parent(TAGS_CONTAINER) seguido de
+    contexto.find(...) / contexto.find(text=padrao), sem nova busca no documento.
+    """
+
+    def __init__(self, raiz, padrao=TEXTO_PRECO, padroes=None,
+                 tags_container=TAGS_CONTAINER, tags_titulo=TAGS_TITULO):
+        self.padroes = PADROES_INDICE if padroes is None else padroes
+        self.tags_container = set(tags_container)
+        self.tags_titulo = set(tags_titulo)
+        self.nos = []
+
+        # id(tag) -> container estritamente acima da tag
+        self.container_acima = {id(raiz): None}
+        # id(container) -> {'titulo': tag, nome_padrao: nó de texto}
+        self.primeiros = {}
+
+        for no in raiz.descendants:
+            if isinstance(no, Tag):
+                pai = no.parent
+                if pai is None or id(pai) not in self.container_acima:
+                    acima = None
+                elif pai.name in self.tags_container:
+                    acima = pai
+                else:
+                    acima = self.container_acima[id(pai)]
+                self.container_acima[id(no)] = acima
+
+                if no.name in self.tags_titulo:
+                    self._registrar(acima, 'titulo', no)
+
+            elif type(no) in TIPOS_TEXTO and no.parent is not None:
+                if padrao.search(no):
+                    self.nos.append(no)
+                for nome, regex in self.padroes.items():
+                    if regex.search(no):
+                        self._registrar(self._container_de_tag(no.parent), nome, no)
+
+    def _container_de_tag(self, tag):
+        """Container mais próximo que contém a tag (a própria tag, se for container)"""
+        if tag.name in self.tags_container:
+            return tag
+        return self.container_acima.get(id(tag))
+
+    def _registrar(self, container, nome, valor):
+        """Marca 'valor' como primeira ocorrência de 'nome' no container e nos
+        containers acima; para no primeiro que já tem (ocorrência anterior)"""
+        while container is not None:
+            primeiros = self.primeiros.setdefault(id(container), {})
+            if nome in primeiros:
+                break
+            primeiros[nome] = valor
+            container = self.container_acima.get(id(container))
+
+    def contexto(self, no):
+        """Container do anúncio ao qual o nó de texto pertence"""
+        return self.container_acima.get(id(no.parent)) if no.parent is not None else None
+
+    def primeiro(self, container, nome):
+        """Primeira tag de título ('titulo') ou primeiro texto do padrão no container"""
+        return self.primeiros.get(id(container), {}).get(nome)
@@ -5,18 +5,80 @@ Dashboard Plataforma Completa de Oportunidades Imobiliárias
 Sistema consolidado com todas as cidades: Senador Canedo + Regionais
 """
 
-from flask import Flask, render_template_string, jsonify
+from flask import Flask, Response, render_template_string, jsonify, g, request
 import sqlite3
 from datetime import datetime
 import json
+import os
+import sys
+from functools import wraps
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from esquema import migrar_arquivo
+from conexao_leitura import ConexoesLeitura
+from cache_respostas import CacheRespostas
+from historico_precos import alteracoes_preco
+from busca_textual import garantir_busca, buscar
+from paginacao import ORDENACAO_PADRAO, filtros_de, pagina
+from eventos_oportunidades import garantir_eventos, transmitir_eventos
 
 app = Flask(__name__)
 
+BANCO = 'plataforma_oportunidades_completa.db'
+
+# Colunas de um card de oportunidade (listagem paginada e eventos do stream)
+COLUNAS_CARD = (
+    'id', 'cidade', 'estado', 'titulo', 'preco', 'area', 'preco_m2', 'score',
+    'potencial_categoria', 'portal', 'referencia', 'endereco', 'bairro',
+    'quartos', 'banheiros', 'vagas', 'url', 'data_encontrado'
+)
+
+# Bancos criados antes de cidade_rank/índices de leitura são migrados ao subir
+if os.path.exists(BANCO):
+    migrar_arquivo(BANCO, 'oportunidades_completas', 'estatisticas_cidades')
+    # Índice da busca textual para bancos consolidados antes dele existir
+    conn_migracao = sqlite3.connect(BANCO)
+    garantir_busca(conn_migracao, 'oportunidades_completas')
+    # Log de mudanças lido pelo stream /api/eventos
+    garantir_eventos(conn_migracao, 'oportunidades_completas')
+    conn_migracao.close()
+
+# Conexões somente leitura reaproveitadas entre requisições (cache quente)
+leitura = ConexoesLeitura(BANCO)
+
 def get_db_connection():
-    """Conecta ao banco consolidado"""
-    conn = sqlite3.connect('plataforma_oportunidades_completa.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Conexão de leitura do banco consolidado, devolvida ao fim da requisição"""
+    if 'conn' not in g:
+        g.conn = leitura.obter()
+    return g.conn
+
+@app.teardown_appcontext
+def devolver_conexao(erro):
+    conn = g.pop('conn', None)
+    if conn is not None:
+        leitura.devolver(conn)
+
+# JSON das APIs guardado até o banco mudar (data_version / arquivo trocado)
+cache = CacheRespostas(BANCO)
+
+def resposta_em_cache(view):
+    """Serve o JSON da view do cache, com ETag forte e 304 para If-None-Match"""
+    @wraps(view)
+    def envoltorio(*args, **kwargs):
+        try:
+            entrada = cache.obter(
+                request.full_path,
+                lambda: app.json.dumps(view(*args, **kwargs)).encode('utf-8')
+            )
+        except ValueError as e:
+            # Parâmetro inválido (filtro, ordenação, cursor)
+            return jsonify({'erro': str(e)}), 400
+        resposta = app.response_class(entrada.corpo, mimetype='application/json')
+        resposta.set_etag(entrada.etag)
+        # O navegador sempre revalida; sem mudança volta só o 304
+        resposta.cache_control.no_cache = True
+        return resposta.make_conditional(request)
+    return envoltorio
 
 @app.route('/')
 def dashboard():
@@ -24,53 +86,38 @@ def dashboard():
     return render_template_string(DASHBOARD_CONSOLIDADO_TEMPLATE)
 
 @app.route('/api/oportunidades')
+@resposta_em_cache
 def api_oportunidades():
-    """API para obter todas as oportunidades"""
+    """API paginada das oportunidades (?ordem=&cursor=&limite= + filtros de paginacao.FILTROS)"""
     conn = get_db_connection()
     
-    oportunidades = conn.execute('''
-        SELECT cidade, estado, titulo, preco, area, preco_m2, score, 
-               potencial_categoria, portal, referencia, endereco, bairro,
-               quartos, banheiros, vagas, url, data_encontrado
-        FROM oportunidades_completas 
-        ORDER BY 
-            CASE 
-                WHEN cidade = 'Lucas do Rio Verde' THEN 1
-                WHEN cidade = 'Rio Verde' THEN 2
-                WHEN cidade = 'Sinop' THEN 3
-                WHEN cidade = 'Barreiras' THEN 4
-                WHEN cidade = 'Palmas' THEN 5
-                WHEN cidade = 'Senador Canedo' THEN 6
-                ELSE 7
-            END,
-            score DESC
-    ''').fetchall()
-    
-    conn.close()
+    oportunidades, proximo_cursor = pagina(
+        conn, 'oportunidades_completas', COLUNAS_CARD,
+        filtros=filtros_de(request.args),
+        ordem=request.args.get('ordem', ORDENACAO_PADRAO),
+        cursor=request.args.get('cursor'),
+        limite=min(max(request.args.get('limite', 50, type=int), 1), 200)
+    )
     
-    return jsonify([dict(row) for row in oportunidades])
+    return {
+        'oportunidades': [dict(row) for row in oportunidades],
+        'proximo_cursor': proximo_cursor
+    }
 
 @app.route('/api/estatisticas')
+@resposta_em_cache
 def api_estatisticas():
     """API para estatísticas consolidadas"""
     conn = get_db_connection()
     
-    # Estatísticas por cidade
+    # Estatísticas por cidade (agregados mantidos por triggers, O(cidades))
     stats_cidade = conn.execute('''
         SELECT c.cidade, c.estado, c.total_oportunidades, c.score_medio,
                c.preco_medio, c.preco_m2_medio, c.menor_preco, c.maior_preco,
-               c.potencial_categoria, c.crescimento_populacional
+               c.potencial_categoria, c.crescimento_populacional, c.cidade_rank
         FROM estatisticas_cidades c
-        ORDER BY 
-            CASE 
-                WHEN c.cidade = 'Lucas do Rio Verde' THEN 1
-                WHEN c.cidade = 'Rio Verde' THEN 2
-                WHEN c.cidade = 'Sinop' THEN 3
-                WHEN c.cidade = 'Barreiras' THEN 4
-                WHEN c.cidade = 'Palmas' THEN 5
-                WHEN c.cidade = 'Senador Canedo' THEN 6
-                ELSE 7
-            END
+        WHERE c.total_oportunidades > 0
+        ORDER BY c.cidade_rank
     ''').fetchall()
     
     # Histórico consolidado
@@ -93,15 +140,14 @@ def api_estatisticas():
         FROM oportunidades_completas
     ''').fetchone()
     
-    conn.close()
-    
-    return jsonify({
+    return {
         'stats_cidade': [dict(row) for row in stats_cidade],
         'historico': [dict(row) for row in historico],
         'resumo_geral': dict(resumo)
-    })
+    }
 
 @app.route('/api/cidade/<cidade>')
+@resposta_em_cache
 def api_cidade_detalhes(cidade):
     """API para detalhes de uma cidade específica"""
     conn = get_db_connection()
@@ -117,13 +163,81 @@ def api_cidade_detalhes(cidade):
         WHERE cidade = ?
     ''', (cidade,)).fetchone()
     
-    conn.close()
+    return {
+        'oportunidades': [dict(row) for row in oportunidades],
+        'estatisticas': dict(estatisticas) if estatisticas else None
+    }
+
+@app.route('/api/alteracoes_preco')
+def api_alteracoes_preco():
+    """API de mudanças de preço desde uma data (?desde=AAAA-MM-DD&cidade=&quedas=1&limite=)"""
+    conn = get_db_connection()
+    
+    alteracoes = alteracoes_preco(
+        conn, 'oportunidades_completas',
+        desde=request.args.get('desde'),
+        cidade=request.args.get('cidade'),
+        apenas_quedas=request.args.get('quedas') == '1',
+        limite=min(request.args.get('limite', 100, type=int), 1000)
+    )
+    
+    return jsonify([dict(row) for row in alteracoes])
+
+@app.route('/api/busca')
+def api_busca():
+    """API de busca textual (?q=&cidade=&score_min=&score_max=&preco_min=&preco_max=&pagina=&limite=)"""
+    limite = min(max(request.args.get('limite', 20, type=int), 1), 100)
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+    
+    conn = get_db_connection()
+    
+    oportunidades, tem_mais = buscar(
+        conn, 'oportunidades_completas',
+        texto=request.args.get('q', ''),
+        cidade=request.args.get('cidade') or None,
+        score_min=request.args.get('score_min', type=float),
+        score_max=request.args.get('score_max', type=float),
+        preco_min=request.args.get('preco_min', type=float),
+        preco_max=request.args.get('preco_max', type=float),
+        limite=limite,
+        pagina=pagina
+    )
     
     return jsonify({
         'oportunidades': [dict(row) for row in oportunidades],
-        'estatisticas': dict(estatisticas) if estatisticas else None
+        'pagina': pagina,
+        'tem_mais': tem_mais
     })
 
+def estatisticas_das_cidades(conn, cidades):
+    """Linhas de estatisticas_cidades das cidades afetadas (delta do stream)"""
+    if not cidades:
+        return []
+    return conn.execute(f'''
+        SELECT cidade, estado, total_oportunidades, score_medio,
+               preco_medio, preco_m2_medio, menor_preco, maior_preco,
+               potencial_categoria, crescimento_populacional, cidade_rank
+        FROM estatisticas_cidades
+        WHERE cidade IN ({', '.join('?' * len(cidades))})
+    ''', cidades).fetchall()
+
+@app.route('/api/eventos')
+def api_eventos():
+    """Server-Sent Events: oportunidades novas/alteradas/removidas e estatísticas das cidades afetadas"""
+    # EventSource reenvia o último id recebido ao reconectar
+    ultimo_id = request.headers.get('Last-Event-ID') or request.args.get('desde')
+    try:
+        ultimo_id = int(ultimo_id) if ultimo_id else None
+    except ValueError:
+        return jsonify({'erro': 'Last-Event-ID inválido'}), 400
+    
+    return Response(
+        transmitir_eventos(leitura.conexao(), 'oportunidades_completas', COLUNAS_CARD,
+                           ultimo_id, estatisticas_das_cidades),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # Template HTML consolidado
 DASHBOARD_CONSOLIDADO_TEMPLATE = '''
 <!DOCTYPE html>
@@ -299,6 +413,37 @@ DASHBOARD_CONSOLIDADO_TEMPLATE = '''
             box-shadow: 0 15px 35px rgba(0,0,0,0.1);
         }
         
+        .busca-form {
+            display: flex;
+            flex-wrap: wrap;
+            gap: 10px;
+            margin-top: 20px;
+        }
+        
+        .busca-form input, .busca-form select {
+            padding: 10px 14px;
+            border: 1px solid #ddd;
+            border-radius: 10px;
+            font-size: 0.95em;
+        }
+        
+        .busca-form input[type="search"] {
+            flex: 1;
+            min-width: 220px;
+        }
+        
+        .busca-form input[type="number"] {
+            width: 120px;
+        }
+        
+        .busca-paginacao {
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            gap: 15px;
+            margin-top: 25px;
+        }
+        
         .oportunidades-grid {
             display: grid;
             grid-template-columns: repeat(auto-fit, minmax(450px, 1fr));
@@ -618,13 +763,41 @@ DASHBOARD_CONSOLIDADO_TEMPLATE = '''
         
         <div id="oportunidades-section" class="oportunidades-section" style="display: none;">
             <h2>🏆 Todas as Oportunidades Encontradas</h2>
+            <form id="busca-form" class="busca-form" onsubmit="event.preventDefault(); filtrarOportunidades();">
+                <input type="search" id="busca-texto" placeholder="Buscar por título, endereço, bairro...">
+                <select id="busca-cidade">
+                    <option value="">Todas as cidades</option>
+                </select>
+                <input type="number" id="busca-score-min" placeholder="Score mín." min="0" max="100">
+                <input type="number" id="busca-score-max" placeholder="Score máx." min="0" max="100">
+                <input type="number" id="busca-preco-min" placeholder="Preço mín." min="0">
+                <input type="number" id="busca-preco-max" placeholder="Preço máx." min="0">
+                <select id="busca-ordem">
+                    <option value="ranking">Ranking das cidades</option>
+                    <option value="score">Maior score</option>
+                    <option value="preco">Menor preço</option>
+                    <option value="preco_desc">Maior preço</option>
+                    <option value="preco_m2">Menor preço/m²</option>
+                    <option value="recentes">Mais recentes</option>
+                </select>
+                <button type="submit" class="refresh-btn" style="margin: 0;">🔍 Buscar</button>
+            </form>
             <div id="oportunidades-grid" class="oportunidades-grid">
             </div>
+            <div id="busca-paginacao" class="busca-paginacao" style="display: none;">
+                <button class="refresh-btn" id="busca-anterior" style="margin: 0;">← Anterior</button>
+                <span id="busca-pagina"></span>
+                <button class="refresh-btn" id="busca-proxima" style="margin: 0;">Próxima →</button>
+            </div>
+            <button class="refresh-btn" id="carregar-mais" style="display: none;" onclick="carregarOportunidades(true)">⬇️ Carregar mais</button>
         </div>
     </div>
 
     <script>
         let chartInstances = [];
+        let proximoCursor = null;
+        let statsCidades = [];
+        let resumoGeral = null;
         
         async function carregarDados() {
             document.getElementById('loading').style.display = 'block';
@@ -635,13 +808,15 @@ DASHBOARD_CONSOLIDADO_TEMPLATE = '''
             
             try {
                 const [oportunidades, estatisticas] = await Promise.all([
-                    fetch('/api/oportunidades').then(r => r.json()),
+                    carregarOportunidades(false),
                     fetch('/api/estatisticas').then(r => r.json())
                 ]);
                 
-                exibirResumoGeral(estatisticas.resumo_geral);
-                exibirEstatisticasCidades(estatisticas.stats_cidade);
-                exibirOportunidades(oportunidades);
+                statsCidades = estatisticas.stats_cidade;
+                resumoGeral = estatisticas.resumo_geral;
+                exibirResumoGeral(resumoGeral);
+                exibirEstatisticasCidades(statsCidades);
+                preencherCidadesBusca(statsCidades);
                 criarGraficos(estatisticas.stats_cidade, oportunidades);
                 
                 document.getElementById('ultima-atualizacao').textContent = 
@@ -734,82 +909,85 @@ DASHBOARD_CONSOLIDADO_TEMPLATE = '''
             container.style.display = 'grid';
         }
         
-        function exibirOportunidades(oportunidades) {
-            const container = document.getElementById('oportunidades-grid');
-            
-            let html = '';
+        function htmlOportunidade(op) {
+            const contatoInfo = getContatoInfo(op);
             
-            oportunidades.forEach((op, index) => {
-                const contatoInfo = getContatoInfo(op);
-                
-                html += `
-                    <div class="oportunidade-card" onclick="flipCard(this)">
-                        <div class="click-hint">👆 Clique para contato</div>
-                        <div class="card-inner">
-                            <div class="card-front">
-                                <div class="oportunidade-header">
-                                    <div>
-                                        <div class="oportunidade-titulo">🏠 ${op.titulo}</div>
-                                        <div class="oportunidade-local">📍 ${op.endereco}</div>
-                                    </div>
-                                    <div class="score-badge">
-                                        ${op.score}/100
-                                    </div>
-                                </div>
-                                
-                                <div class="preco-destaque">
-                                    💰 R$ ${op.preco.toLocaleString('pt-BR')}
-                                </div>
-                                
-                                <div class="detalhes-grid">
-                                    <div class="detalhe-item">
-                                        <div class="detalhe-valor">${op.area.toFixed(0)} m²</div>
-                                        <div class="detalhe-label">Área</div>
-                                    </div>
-                                    <div class="detalhe-item">
-                                        <div class="detalhe-valor">R$ ${op.preco_m2.toFixed(0)}</div>
-                                        <div class="detalhe-label">Preço/m²</div>
-                                    </div>
-                                    ${op.quartos ? `
-                                    <div class="detalhe-item">
-                                        <div class="detalhe-valor">${op.quartos}</div>
-                                        <div class="detalhe-label">Quartos</div>
-                                    </div>
-                                    ` : ''}
-                                    ${op.banheiros ? `
-                                    <div class="detalhe-item">
-                                        <div class="detalhe-valor">${op.banheiros}</div>
-                                        <div class="detalhe-label">Banheiros</div>
-                                    </div>
-                                    ` : ''}
+            return `
+                <div class="oportunidade-card" data-id="${op.id}" onclick="flipCard(this)">
+                    <div class="click-hint">👆 Clique para contato</div>
+                    <div class="card-inner">
+                        <div class="card-front">
+                            <div class="oportunidade-header">
+                                <div>
+                                    <div class="oportunidade-titulo">🏠 ${op.titulo}</div>
+                                    <div class="oportunidade-local">📍 ${op.endereco}</div>
                                 </div>
-                                
-                                <div class="portal-info">
-                                    <span>🌐 ${op.portal}</span>
-                                    <span>🎯 ${op.potencial_categoria}</span>
+                                <div class="score-badge">
+                                    ${op.score}/100
                                 </div>
                             </div>
                             
-                            <div class="card-back">
-                                <div class="contato-header">
-                                    <div class="contato-titulo">${op.cidade}/${op.estado}</div>
-                                    <div class="contato-preco">R$ ${op.preco.toLocaleString('pt-BR')}</div>
+                            <div class="preco-destaque">
+                                💰 R$ ${op.preco.toLocaleString('pt-BR')}
+                            </div>
+                            
+                            <div class="detalhes-grid">
+                                <div class="detalhe-item">
+                                    <div class="detalhe-valor">${op.area.toFixed(0)} m²</div>
+                                    <div class="detalhe-label">Área</div>
+                                </div>
+                                <div class="detalhe-item">
+                                    <div class="detalhe-valor">R$ ${op.preco_m2.toFixed(0)}</div>
+                                    <div class="detalhe-label">Preço/m²</div>
+                                </div>
+                                ${op.quartos ? `
+                                <div class="detalhe-item">
+                                    <div class="detalhe-valor">${op.quartos}</div>
+                                    <div class="detalhe-label">Quartos</div>
                                 </div>
-                                
-                                <div class="contato-info">
-                                    ${contatoInfo}
+                                ` : ''}
+                                ${op.banheiros ? `
+                                <div class="detalhe-item">
+                                    <div class="detalhe-valor">${op.banheiros}</div>
+                                    <div class="detalhe-label">Banheiros</div>
                                 </div>
-                                
-                                <button class="voltar-btn" onclick="event.stopPropagation(); flipCard(this.closest('.oportunidade-card'))">
-                                    ← Voltar aos Detalhes
-                                </button>
+                                ` : ''}
+                            </div>
+                            
+                            <div class="portal-info">
+                                <span>🌐 ${op.portal}</span>
+                                <span>🎯 ${op.potencial_categoria}</span>
                             </div>
                         </div>
+                        
+                        <div class="card-back">
+                            <div class="contato-header">
+                                <div class="contato-titulo">${op.cidade}/${op.estado}</div>
+                                <div class="contato-preco">R$ ${op.preco.toLocaleString('pt-BR')}</div>
+                            </div>
+                            
+                            <div class="contato-info">
+                                ${contatoInfo}
+                            </div>
+                            
+                            <button class="voltar-btn" onclick="event.stopPropagation(); flipCard(this.closest('.oportunidade-card'))">
+                                ← Voltar aos Detalhes
+                            </button>
+                        </div>
                     </div>
-                `;
-            });
+                </div>
+            `;
+        }
+        
+        function exibirOportunidades(oportunidades, acrescentar = false) {
+            const container = document.getElementById('oportunidades-grid');
+            const html = oportunidades.map(htmlOportunidade).join('');
             
-            container.innerHTML = html;
+            if (acrescentar) {
+                container.insertAdjacentHTML('beforeend', html);
+            } else {
+                container.innerHTML = html;
+            }
             document.getElementById('oportunidades-section').style.display = 'block';
             document.getElementById('loading').style.display = 'none';
         }
@@ -938,6 +1116,75 @@ DASHBOARD_CONSOLIDADO_TEMPLATE = '''
             `;
         }
         
+        function preencherCidadesBusca(cidades) {
+            const select = document.getElementById('busca-cidade');
+            const selecionada = select.value;
+            select.innerHTML = '<option value="">Todas as cidades</option>';
+            cidades.forEach(cidade => {
+                const option = document.createElement('option');
+                option.value = cidade.cidade;
+                option.textContent = `${cidade.cidade}/${cidade.estado}`;
+                select.appendChild(option);
+            });
+            select.value = selecionada;
+        }
+        
+        function parametrosFiltros() {
+            const params = new URLSearchParams();
+            [['cidade', 'busca-cidade'], ['score_min', 'busca-score-min'], ['score_max', 'busca-score-max'],
+             ['preco_min', 'busca-preco-min'], ['preco_max', 'busca-preco-max']].forEach(([nome, id]) => {
+                const valor = document.getElementById(id).value;
+                if (valor !== '') params.set(nome, valor);
+            });
+            return params;
+        }
+        
+        function filtrarOportunidades() {
+            if (document.getElementById('busca-texto').value.trim()) {
+                buscarOportunidades(1);
+            } else {
+                carregarOportunidades(false);
+            }
+        }
+        
+        async function carregarOportunidades(acrescentar) {
+            // Listagem paginada por cursor: cada página custa o mesmo
+            const params = parametrosFiltros();
+            params.set('ordem', document.getElementById('busca-ordem').value);
+            if (acrescentar && proximoCursor) params.set('cursor', proximoCursor);
+            
+            const resultado = await fetch(`/api/oportunidades?${params}`).then(r => r.json());
+            exibirOportunidades(resultado.oportunidades, acrescentar);
+            proximoCursor = resultado.proximo_cursor;
+            document.getElementById('carregar-mais').style.display = proximoCursor ? 'block' : 'none';
+            document.getElementById('busca-paginacao').style.display = 'none';
+            return resultado.oportunidades;
+        }
+        
+        async function buscarOportunidades(pagina) {
+            // Busca no servidor (FTS5): só a página pedida é baixada
+            const params = parametrosFiltros();
+            params.set('q', document.getElementById('busca-texto').value);
+            params.set('pagina', pagina);
+            
+            try {
+                const resultado = await fetch(`/api/busca?${params}`).then(r => r.json());
+                exibirOportunidades(resultado.oportunidades);
+                document.getElementById('carregar-mais').style.display = 'none';
+                
+                const anterior = document.getElementById('busca-anterior');
+                const proxima = document.getElementById('busca-proxima');
+                anterior.disabled = pagina <= 1;
+                proxima.disabled = !resultado.tem_mais;
+                anterior.onclick = () => buscarOportunidades(pagina - 1);
+                proxima.onclick = () => buscarOportunidades(pagina + 1);
+                document.getElementById('busca-pagina').textContent = `Página ${pagina}`;
+                document.getElementById('busca-paginacao').style.display = 'flex';
+            } catch (error) {
+                console.error('Erro na busca:', error);
+            }
+        }
+        
         function flipCard(card) {
             card.classList.toggle('flipped');
         }
@@ -1007,17 +1254,72 @@ DASHBOARD_CONSOLIDADO_TEMPLATE = '''
             return 'potencial-estavel';
         }
         
-        // Carrega dados ao inicializar
-        document.addEventListener('DOMContentLoaded', carregarDados);
+        function listagemSemFiltros() {
+            return !document.getElementById('busca-texto').value.trim() &&
+                parametrosFiltros().toString() === '' &&
+                document.getElementById('busca-ordem').value === 'ranking';
+        }
+        
+        function aplicarOportunidade(evento) {
+            // Delta do stream: troca, remove ou insere só o card afetado
+            const card = document.querySelector(`.oportunidade-card[data-id="${evento.id_anuncio}"]`);
+            if (!evento.oportunidade) {
+                if (card) card.remove();
+            } else if (card) {
+                card.outerHTML = htmlOportunidade(evento.oportunidade);
+            } else if (evento.tipo === 'nova' && listagemSemFiltros()) {
+                document.getElementById('oportunidades-grid')
+                    .insertAdjacentHTML('afterbegin', htmlOportunidade(evento.oportunidade));
+            }
+            document.getElementById('ultima-atualizacao').textContent = 
+                `Última atualização: ${new Date().toLocaleString('pt-BR')}`;
+        }
+        
+        function aplicarEstatisticas(linhas) {
+            // Substitui as cidades recebidas; cidades sem oportunidades saem
+            linhas.forEach(linha => {
+                const indice = statsCidades.findIndex(c => c.cidade === linha.cidade);
+                if (indice >= 0) statsCidades.splice(indice, 1);
+                if (linha.total_oportunidades > 0) statsCidades.push(linha);
+            });
+            statsCidades.sort((a, b) => a.cidade_rank - b.cidade_rank);
+            
+            if (resumoGeral) {
+                // Resumo geral refeito a partir das cidades (média ponderada pelo total)
+                const total = statsCidades.reduce((soma, c) => soma + c.total_oportunidades, 0);
+                const ponderada = campo => total ? statsCidades.reduce((soma, c) => soma + (c[campo] || 0) * c.total_oportunidades, 0) / total : 0;
+                resumoGeral.total_oportunidades = total;
+                resumoGeral.total_cidades = statsCidades.length;
+                resumoGeral.score_medio_geral = ponderada('score_medio');
+                resumoGeral.preco_medio_geral = ponderada('preco_medio');
+                exibirResumoGeral(resumoGeral);
+            }
+            exibirEstatisticasCidades(statsCidades);
+            preencherCidadesBusca(statsCidades);
+        }
+        
+        function conectarEventos() {
+            if (!window.EventSource) {
+                // Navegador sem SSE: volta ao refresh periódico
+                setInterval(carregarDados, 600000);
+                return;
+            }
+            const fonte = new EventSource('/api/eventos');
+            fonte.addEventListener('oportunidade', e => aplicarOportunidade(JSON.parse(e.data)));
+            fonte.addEventListener('estatisticas', e => aplicarEstatisticas(JSON.parse(e.data)));
+            fonte.addEventListener('recarregar', () => carregarDados());
+        }
         
-        // Auto-refresh a cada 10 minutos
-        setInterval(carregarDados, 600000);
+        // Carrega dados ao inicializar; depois só chegam os deltas do servidor
+        document.addEventListener('DOMContentLoaded', () => {
+            carregarDados();
+            conectarEventos();
+        });
     </script>
 </body>
 </html>
 '''
 
 if __name__ == '__main__':
-    import os
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)